@@ -0,0 +1,44 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Hashable, List
+
+
+class KeyedLock:
+    """One ``asyncio.Lock`` per key, created on demand and dropped once unused.
+
+    Serialises work on the same key (an invoice, a user) inside this process
+    while different keys proceed concurrently.
+    """
+
+    def __init__(self) -> None:
+        # key -> [lock, holders + waiters]
+        self._locks: Dict[Hashable, List] = {}
+        self.acquisitions = 0
+        self.contended = 0
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        if entry[0].locked():
+            self.contended += 1
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                self.acquisitions += 1
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(key, None)
+
+    def locked(self, key: Hashable) -> bool:
+        entry = self._locks.get(key)
+        return entry is not None and entry[0].locked()
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._locks), "acquisitions": self.acquisitions, "contended": self.contended}
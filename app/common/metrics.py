@@ -0,0 +1,26 @@
+from typing import Callable, Dict
+
+from app.common.logging import logger
+
+
+class MetricsRegistry:
+    """Process-wide registry of named stats sources exposed on /admin/metrics."""
+
+    def __init__(self) -> None:
+        self._sources: Dict[str, Callable[[], dict]] = {}
+
+    def register(self, name: str, source: Callable[[], dict]) -> None:
+        self._sources[name] = source
+
+    def snapshot(self) -> Dict[str, dict]:
+        result: Dict[str, dict] = {}
+        for name, source in self._sources.items():
+            try:
+                result[name] = source()
+            except Exception as exc:
+                logger.warning("Metrics source %s failed: %s", name, exc)
+                result[name] = {"error": str(exc)}
+        return result
+
+
+metrics = MetricsRegistry()
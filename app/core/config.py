@@ -25,7 +25,39 @@ class Settings(BaseSettings):
     IMSI_API_URL: str = "https://mit.imsipay.com/b2b"
     IMSI_USERNAME: str = "flextest@notmail.com"
     IMSI_PASSWORD: str = "33mRC6E1R"
+    IMSI_HTTP_TIMEOUT_SECONDS: float = 10.0
+    IMSI_HTTP_MAX_CONNECTIONS: int = 20
+    IMSI_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    IMSI_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    IMSI_HTTP2_ENABLED: bool = False
+    ESIM_PROVIDER_SYNC_CONCURRENCY: int = 5
+    ESIM_PROVIDER_SYNC_TIMEOUT_SECONDS: float = 8.0
+    ESIM_IMSI_CACHE_TTL_SECONDS: float = 20.0
+    ESIM_IMSI_CACHE_REVALIDATE_SECONDS: float = 120.0
+    ESIM_IMSI_CACHE_MAX_STALE_SECONDS: float = 3600.0
+    ESIM_IMSI_CACHE_MAX_ENTRIES: int = 5000
+    ESIM_INVENTORY_REFRESH_SECONDS: float = 60.0
+    ESIM_ALLOCATOR_REBUILD_SECONDS: float = 300.0
+    ESIM_ALLOCATOR_MIN_REBUILD_SECONDS: float = 30.0
+
+    # Tariffs (imsimarket rates feed)
+    TARIFF_RATES_URL: str = "https://imsimarket.com/js/data/alternative.rates.json"
+    TARIFF_REFRESH_SECONDS: float = 3600.0
+    TARIFF_REFRESH_JITTER: float = 0.1
+    TARIFF_REFRESH_RETRY_SECONDS: float = 60.0
+    TARIFF_HTTP_TIMEOUT_SECONDS: float = 15.0
+    TARIFF_WARMUP_TIMEOUT_SECONDS: float = 5.0
+    TARIFF_SNAPSHOT_BACKEND: str = "firestore"  # firestore | file | none
+    TARIFF_SNAPSHOT_PATH: str = "tariff_snapshot.json"
+
+    # Background loops started by the app lifespan (disabled in tests)
+    BACKGROUND_WORKERS_ENABLED: bool = True
     
+    # Shared OAuth token manager (provider + ePay service tokens)
+    TOKEN_REFRESH_AHEAD_SECONDS: float = 300.0
+    TOKEN_EXPIRY_MARGIN_SECONDS: float = 60.0
+    TOKEN_STORE_BACKEND: str = "memory"  # "memory" or "firestore"
+
     # Mock OTP
     MOCK_OTP_CODE: str = "123456"
     
@@ -56,10 +88,45 @@ class Settings(BaseSettings):
     EPAY_ESIM_AUTOPAY_THRESHOLD_MB: float = 51.0
     EPAY_ESIM_AUTOPAY_PACKAGE_MB: float = 3072.0
     EPAY_ESIM_AUTOPAY_COOLDOWN_MINUTES: int = 60
+    AUTOPAY_WORKER_CONCURRENCY: int = 2
+    AUTOPAY_JOB_LEASE_SECONDS: float = 900.0
+    AUTOPAY_LEASE_SECONDS: float = 600.0
+    AUTOPAY_JOB_MAX_ATTEMPTS: int = 3
+    AUTOPAY_JOB_RETRY_BASE_SECONDS: float = 30.0
+    AUTOPAY_RECOVERY_SCAN_SECONDS: float = 120.0
+    AUTOPAY_SWEEP_CONCURRENCY: int = 5
+    AUTOPAY_SWEEP_INTERVAL_SECONDS: float = 0.0  # 0 disables the scheduled sweep
+    WEBHOOK_WORKER_COUNT: int = 4
+    WEBHOOK_MAX_ATTEMPTS: int = 5
+    WEBHOOK_RETRY_BASE_SECONDS: float = 15.0
+    WEBHOOK_LEASE_SECONDS: float = 300.0
+    WEBHOOK_RECOVERY_SCAN_SECONDS: float = 60.0
+    WEBHOOK_DEDUP_TTL_SECONDS: float = 900.0
+    WEBHOOK_DEDUP_MAX_ENTRIES: int = 10000
     EPAY_HTTP_TIMEOUT_SECONDS: float = 40.0
     EPAY_HTTP_RETRIES: int = 3
+    EPAY_HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    EPAY_HTTP_MAX_CONNECTIONS_PER_HOST: int = 10
+    EPAY_HTTP_MAX_KEEPALIVE_PER_HOST: int = 5
+    EPAY_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
     EPAY_REQUEST_DEADLINE_SECONDS: float = 25.0
     EPAY_PENDING_TTL_MINUTES: int = 20
+    EPAY_PAYMENT_TOKEN_EXPIRY_MARGIN_SECONDS: float = 60.0
+    EPAY_PAYMENT_TOKEN_CACHE_MAX_ENTRIES: int = 5000
+    EPAY_SAVED_CARDS_TTL_SECONDS: float = 300.0
+    EPAY_SAVED_CARDS_MAX_STALE_SECONDS: float = 86400.0
+    EPAY_SAVED_CARDS_CACHE_MAX_ENTRIES: int = 10000
+    PAYMENT_RECONCILE_INTERVAL_SECONDS: float = 60.0
+    PAYMENT_RECONCILE_CONCURRENCY: int = 5
+    PAYMENT_RECONCILE_BATCH_SIZE: int = 100
+    PAYMENT_STATUS_WAIT_SECONDS: float = 25.0
+    PAYMENT_STATUS_MAX_WAIT_SECONDS: float = 120.0
+    PAYMENT_STATUS_RECHECK_SECONDS: float = 5.0
+    AUTH_USER_CACHE_TTL_SECONDS: float = 30.0  # 0 disables the cache
+    AUTH_USER_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_CLAIMS_MODE: bool = False  # authorize app permissions from token claims, no user read
+    AUTH_VERIFIED_TOKEN_TTL_SECONDS: float = 60.0
+    AUTH_VERIFIED_TOKEN_MAX_ENTRIES: int = 10000
 
     model_config = SettingsConfigDict(
         env_file=".env", 
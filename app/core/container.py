@@ -0,0 +1,105 @@
+from typing import Any, Callable, Dict
+
+
+class ServiceContainer:
+    """App-scoped service singletons shared by routers and background workers.
+
+    Services are built lazily on first use (the lifespan builds them up front
+    and clears them on shutdown), so repositories, provider clients and their
+    caches are created once per process instead of once per request. Tests
+    replace a service with ``override(payment_service=fake)`` and undo it
+    with ``reset()``.
+    """
+
+    def __init__(self) -> None:
+        self._instances: Dict[str, Any] = {}
+        self._overrides: Dict[str, Any] = {}
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        if name in self._overrides:
+            return self._overrides[name]
+        instance = self._instances.get(name)
+        if instance is None:
+            instance = factory()
+            self._instances[name] = instance
+        return instance
+
+    @property
+    def epay(self):
+        from app.providers.epay.client import EpayClient
+
+        return self._get("epay", EpayClient)
+
+    @property
+    def esim_provider(self):
+        from app.providers.esim_provider.client import EsimProviderClient
+
+        return self._get("esim_provider", EsimProviderClient)
+
+    @property
+    def wallet_service(self):
+        from app.modules.wallet.service import WalletService
+
+        return self._get("wallet_service", WalletService)
+
+    @property
+    def esim_service(self):
+        from app.modules.esim.service import EsimService
+
+        return self._get(
+            "esim_service",
+            lambda: EsimService(provider=self.esim_provider, epay=self.epay),
+        )
+
+    @property
+    def payment_service(self):
+        from app.modules.payment.service import PaymentService
+
+        return self._get(
+            "payment_service",
+            lambda: PaymentService(
+                esim_service=self.esim_service,
+                wallet_service=self.wallet_service,
+                epay=self.epay,
+                esim_provider=self.esim_provider,
+            ),
+        )
+
+    @property
+    def user_service(self):
+        from app.modules.users.service import UserService
+
+        return self._get(
+            "user_service",
+            lambda: UserService(esim_service=self.esim_service, wallet_service=self.wallet_service),
+        )
+
+    def build(self) -> None:
+        """Construct every service now rather than on the first request."""
+        self.payment_service
+        self.user_service
+
+    def override(self, **instances: Any) -> None:
+        unknown = [name for name in instances if not isinstance(getattr(type(self), name, None), property)]
+        if unknown:
+            raise AttributeError(f"Unknown services: {', '.join(unknown)}")
+        self._overrides.update(instances)
+
+    def reset(self) -> None:
+        self._instances.clear()
+        self._overrides.clear()
+
+
+container = ServiceContainer()
+
+
+def get_payment_service():
+    return container.payment_service
+
+
+def get_esim_service():
+    return container.esim_service
+
+
+def get_user_service():
+    return container.user_service
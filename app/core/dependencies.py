@@ -2,26 +2,31 @@ from fastapi import Depends, HTTPException, status, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, APIKeyHeader
 from jose import JWTError, jwt
 from app.core.config import settings
-from app.core.jwt import decode_token
+from app.core.jwt import verified_tokens
 from app.common.exceptions import UnauthorizedError, ForbiddenError
 from app.modules.users.schemas import User
 from app.modules.users.repository import UserRepository
+from dataclasses import dataclass, field
+from typing import List, Optional
 
 security = HTTPBearer()
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    token = credentials.credentials
-    payload = decode_token(token)
-    if payload is None:
+def _access_token_payload(credentials: HTTPAuthorizationCredentials) -> dict:
+    payload = verified_tokens.decode(credentials.credentials)
+    # Refresh tokens are only good for /auth/refresh
+    if payload is None or payload.get("type") != "access":
         raise UnauthorizedError("Could not validate credentials")
-    
-    user_id: str = payload.get("sub")
-    if user_id is None:
+    if payload.get("sub") is None:
         raise UnauthorizedError("Invalid token payload: missing user_id")
+    return payload
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+    user_id: str = _access_token_payload(credentials)["sub"]
     
-    # Fetch comprehensive user data from Repository to ensure validity and freshness
+    # Fetch comprehensive user data from Repository to ensure validity; cached
+    # briefly per instance and invalidated by UserRepository writes
     repo = UserRepository()
-    user = await repo.get_user(user_id)
+    user = await repo.get_cached_user(user_id)
     
     if user is None:
         raise UnauthorizedError("User not found")
@@ -42,6 +47,52 @@ def require_app_permission(app_name: str):
         return current_user
     return _require_app_permission
 
+@dataclass
+class AuthClaims:
+    """Caller identity from a verified access token.
+
+    Enough for endpoints that only need the user id; ``load_user`` fetches
+    the full ``User`` (through the auth user cache) when one is needed.
+    """
+
+    user_id: str
+    apps: List[str]
+    _user: Optional[User] = field(default=None, repr=False)
+
+    async def load_user(self) -> User:
+        if self._user is None:
+            user = await UserRepository().get_cached_user(self.user_id)
+            if user is None:
+                raise UnauthorizedError("User not found")
+            self._user = user
+        return self._user
+
+
+async def get_current_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> AuthClaims:
+    payload = _access_token_payload(credentials)
+    user_id = payload["sub"]
+
+    apps = payload.get("apps")
+    if settings.AUTH_CLAIMS_MODE and isinstance(apps, list):
+        return AuthClaims(user_id=user_id, apps=list(apps))
+
+    # Claims mode off, or a token issued without "apps": entitlements come from the user document
+    user = await UserRepository().get_cached_user(user_id)
+    if user is None:
+        raise UnauthorizedError("User not found")
+    return AuthClaims(user_id=user.id, apps=list(user.apps_enabled), _user=user)
+
+
+def require_app_claims(app_name: str):
+    """Like ``require_app_permission`` but yields ``AuthClaims``; with
+    ``AUTH_CLAIMS_MODE`` on, the check uses the token's ``apps`` claim and
+    skips the user read."""
+    def _require_app_claims(claims: AuthClaims = Depends(get_current_claims)):
+        if app_name not in claims.apps:
+            raise ForbiddenError(f"User does not have access to {app_name}")
+        return claims
+    return _require_app_claims
+
 X_API_KEY = APIKeyHeader(name="X-Admin-API-Key", auto_error=True)
 
 def require_admin_api_key(api_key: str = Depends(X_API_KEY)):    
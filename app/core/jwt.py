@@ -1,7 +1,11 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
 from typing import Optional, List
 from jose import jwt, JWTError
 from app.core.config import settings
+from app.common.cache import TTLCache
+from app.common.metrics import metrics
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -31,3 +35,45 @@ def decode_token(token: str):
         return payload
     except JWTError:
         return None
+
+
+class VerifiedTokenCache:
+    """Payloads of recently verified tokens, keyed by the sha256 of the raw token.
+
+    Saves the signature check on repeated requests with the same bearer
+    token. An entry never outlives the token's own ``exp``; tokens that fail
+    verification are not cached.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._payloads: TTLCache[str, dict] = TTLCache(max_entries, ttl_seconds)
+        self.rejected = 0
+
+    def decode(self, token: str) -> Optional[dict]:
+        key = hashlib.sha256(token.encode()).hexdigest()
+        payload = self._payloads.get(key)
+        if payload is not None:
+            return dict(payload)
+        payload = decode_token(token)
+        if payload is None:
+            self.rejected += 1
+            return None
+        ttl = self.ttl_seconds
+        if payload.get("exp") is not None:
+            ttl = min(ttl, float(payload["exp"]) - time.time())
+        self._payloads.set(key, dict(payload), ttl_seconds=ttl)
+        return payload
+
+    def clear(self) -> None:
+        self._payloads.clear()
+
+    def stats(self) -> dict:
+        return {**self._payloads.stats(), "rejected": self.rejected}
+
+
+verified_tokens = VerifiedTokenCache(
+    ttl_seconds=settings.AUTH_VERIFIED_TOKEN_TTL_SECONDS,
+    max_entries=settings.AUTH_VERIFIED_TOKEN_MAX_ENTRIES,
+)
+metrics.register("verified_tokens", verified_tokens.stats)
@@ -0,0 +1,55 @@
+import copy
+from typing import Any, Dict
+
+from google.cloud.firestore_v1 import DELETE_FIELD
+
+_MISSING = object()
+
+
+class TrackedDocument(dict):
+    """A Firestore document as a plain dict that remembers what it was loaded as.
+
+    Repositories return these from reads; ``changes()`` yields only the
+    top-level fields that were added, modified or removed since load (or
+    since the last ``mark_clean``), which is what a partial ``update`` needs.
+    """
+
+    def __init__(self, data: Dict[str, Any], exists: bool = True) -> None:
+        super().__init__(data)
+        self.exists = exists
+        self._original: Dict[str, Any] = copy.deepcopy(dict(data))
+
+    def changes(self) -> Dict[str, Any]:
+        changed = {key: value for key, value in self.items() if self._original.get(key, _MISSING) != value}
+        for key in self._original:
+            if key not in self:
+                changed[key] = DELETE_FIELD
+        return changed
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.changes())
+
+    def mark_clean(self) -> None:
+        self.exists = True
+        self._original = copy.deepcopy(dict(self))
+
+
+class WriteStats:
+    """Document write counters for one collection, exposed on /admin/metrics."""
+
+    def __init__(self) -> None:
+        self.full_writes = 0
+        self.partial_updates = 0
+        self.fields_written = 0
+        self.skipped = 0
+        self.batches = 0
+
+    def stats(self) -> dict:
+        return {
+            "full_writes": self.full_writes,
+            "partial_updates": self.partial_updates,
+            "fields_written": self.fields_written,
+            "skipped_noop_writes": self.skipped,
+            "batches": self.batches,
+        }
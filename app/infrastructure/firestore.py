@@ -1,6 +1,6 @@
 import json
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore_async
 from app.core.config import settings
 from app.common.logging import logger
 import os
@@ -8,13 +8,85 @@ from unittest.mock import MagicMock
 
 db = None
 
+# Methods that build references/queries on both the sync and async clients.
+_CHAIN_METHODS = {
+    "collection",
+    "collection_group",
+    "document",
+    "where",
+    "limit",
+    "order_by",
+    "offset",
+    "start_after",
+    "select",
+}
+# Methods that perform I/O and are coroutines on the AsyncClient.
+_IO_METHODS = {"get", "set", "update", "delete", "create", "commit"}
+
+
+def _unwrap(value):
+    return value._target if isinstance(value, SyncClientShim) else value
+
+
+class SyncClientShim:
+    """Expose a synchronous Firestore-like client through the AsyncClient API.
+
+    Repositories are written against ``firestore_async`` and ``await`` every
+    get/set/update/delete/create/commit. Tests and the TESTING mode inject a
+    synchronous fake (or ``MagicMock``); this shim makes those calls awaitable
+    so the same repository code runs against either.
+    """
+
+    def __init__(self, target) -> None:
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        if name in _IO_METHODS:
+            async def _io(*args, **kwargs):
+                return attr(*[_unwrap(a) for a in args], **kwargs)
+            return _io
+
+        if name in _CHAIN_METHODS:
+            def _chain(*args, **kwargs):
+                return SyncClientShim(attr(*[_unwrap(a) for a in args], **kwargs))
+            return _chain
+
+        if name == "batch":
+            return lambda: _SyncBatchShim(attr())
+
+        return attr
+
+
+class _SyncBatchShim:
+    """Write batch: staging calls stay synchronous, only ``commit`` is awaited."""
+
+    def __init__(self, target) -> None:
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name == "commit":
+            async def _commit(*args, **kwargs):
+                return attr(*args, **kwargs)
+            return _commit
+        if callable(attr):
+            def _stage(*args, **kwargs):
+                return attr(*[_unwrap(a) for a in args], **kwargs)
+            return _stage
+        return attr
+
+
 def init_firestore():
     global db
-    
+
     # Check for Testing environment
     if os.getenv("TESTING") == "True":
         logger.warning("TESTING mode active: Using Mock Firestore Client.")
-        db = MagicMock()
+        db = SyncClientShim(MagicMock())
         return
 
     try:
@@ -39,11 +111,22 @@ def init_firestore():
                     logger.error(f"Failed to initialize Firebase: {e}")
                     return
 
-        db = firestore.client()
+        db = firestore_async.client()
     except Exception as e:
         logger.error(f"Error initializing Firestore: {e}")
         raise e
 
+def set_db(client, sync: bool = True):
+    """Inject a Firestore client (tests). Synchronous fakes are wrapped in the shim."""
+    global db
+    db = SyncClientShim(client) if sync and client is not None else client
+
+def close_firestore():
+    global db
+    client, db = db, None
+    if client is not None and not isinstance(client, SyncClientShim):
+        client.close()
+
 def get_db():
     if db is None:
         init_firestore()
@@ -0,0 +1,173 @@
+from typing import Dict, Optional, Union
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.common.logging import logger
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PooledHttpClient:
+    """Long-lived ``httpx.AsyncClient`` shared by every caller of one upstream.
+
+    The underlying client is opened by the app lifespan (``start``) and closed
+    on shutdown (``aclose``); if used outside the lifespan (scripts, tests) it
+    is created lazily on first request. Each request carries an httpcore trace
+    hook so we can count how many requests went over an already-open
+    connection versus paying a fresh TCP/TLS handshake.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        timeout: Union[float, httpx.Timeout],
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry: float,
+        http2: bool = False,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.name = name
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 requested for %s but 'h2' is not installed; using HTTP/1.1", name)
+            http2 = False
+        self.http2 = http2
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.errors = 0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        self._ensure_client()
+
+    async def aclose(self) -> None:
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+                transport=self._transport,
+            )
+            logger.info(
+                "HTTP pool %s opened (max_connections=%s keepalive=%s http2=%s)",
+                self.name,
+                self.limits.max_connections,
+                self.limits.max_keepalive_connections,
+                self.http2,
+            )
+        return self._client
+
+    # ------------------------------------------------------------------
+    # Requests
+    # ------------------------------------------------------------------
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        client = self._ensure_client()
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions["trace"] = self._trace
+        self.requests += 1
+        try:
+            return await client.request(method, url, extensions=extensions, **kwargs)
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+
+    async def _trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.new_connections += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    def stats(self) -> dict:
+        reused = max(0, self.requests - self.new_connections)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "tls_handshakes": self.tls_handshakes,
+            "reused_connections": reused,
+            "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+            "errors": self.errors,
+            "http2": self.http2,
+            "open": self._client is not None and not self._client.is_closed,
+        }
+
+
+class HostPoolGroup:
+    """One ``PooledHttpClient`` per upstream origin (scheme://host:port).
+
+    Used for gateways that are reached through a primary and several fallback
+    hosts: each host keeps its own warm connections and pool limits, so a slow
+    fallback cannot exhaust the connections reserved for the primary.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        timeout: Union[float, httpx.Timeout],
+        max_connections_per_host: int,
+        max_keepalive_per_host: int,
+        keepalive_expiry: float,
+        http2: bool = False,
+    ) -> None:
+        self.name = name
+        self._config = dict(
+            timeout=timeout,
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_keepalive_per_host,
+            keepalive_expiry=keepalive_expiry,
+            http2=http2,
+        )
+        self._pools: Dict[str, PooledHttpClient] = {}
+
+    @staticmethod
+    def _origin(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def for_url(self, url: str) -> PooledHttpClient:
+        origin = self._origin(url)
+        pool = self._pools.get(origin)
+        if pool is None:
+            pool = PooledHttpClient(f"{self.name}:{origin}", **self._config)
+            self._pools[origin] = pool
+        return pool
+
+    async def start(self, urls=()) -> None:
+        """Open pools for the known hosts up front (others open on first use)."""
+        for url in urls:
+            if url:
+                await self.for_url(url).start()
+
+    async def aclose(self) -> None:
+        for pool in list(self._pools.values()):
+            await pool.aclose()
+
+    def stats(self) -> dict:
+        return {origin: pool.stats() for origin, pool in self._pools.items()}
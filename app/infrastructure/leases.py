@@ -0,0 +1,117 @@
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from google.api_core.exceptions import Conflict, FailedPrecondition, NotFound
+
+from app.common.logging import logger
+from app.common.metrics import metrics
+from app.infrastructure.firestore import get_db
+
+
+@dataclass
+class Lease:
+    name: str
+    holder: str
+    expires_at: float
+    # Set when the previous holder's lease had expired without being released
+    taken_over: bool = False
+    update_time: Any = None
+
+
+class LeaseManager:
+    """Mutual exclusion across requests and instances via ``leases/{name}``.
+
+    ``acquire`` is a conditional create, so exactly one caller wins a free
+    lease. A lease that outlived its ``expires_at`` (holder crashed) is taken
+    over with an update conditioned on the document's ``update_time``, so two
+    callers racing for the same expired lease cannot both win. ``release``
+    deletes only the version we wrote.
+    """
+
+    def __init__(self, collection: str = "leases") -> None:
+        self.collection_name = collection
+        self.holder_prefix = uuid.uuid4().hex[:8]
+
+        self.acquired = 0
+        self.contended = 0
+        self.takeovers = 0
+        self.released = 0
+        self.lost = 0
+
+    @property
+    def db(self):
+        return get_db()
+
+    def _ref(self, name: str):
+        return self.db.collection(self.collection_name).document(name)
+
+    async def acquire(self, name: str, ttl_seconds: float) -> Optional[Lease]:
+        ref = self._ref(name)
+        now = time.time()
+        holder = f"{self.holder_prefix}:{uuid.uuid4().hex[:8]}"
+        payload: Dict[str, Any] = {"holder": holder, "acquired_at": now, "expires_at": now + ttl_seconds}
+
+        try:
+            result = await ref.create(payload)
+            self.acquired += 1
+            return Lease(name, holder, payload["expires_at"], update_time=getattr(result, "update_time", None))
+        except Conflict:
+            pass
+
+        doc = await ref.get()
+        if doc.exists:
+            current = doc.to_dict() or {}
+            if float(current.get("expires_at", 0) or 0) > now:
+                self.contended += 1
+                return None
+            try:
+                result = await ref.update(payload, option=self.db.write_option(last_update_time=doc.update_time))
+            except (FailedPrecondition, NotFound):
+                self.contended += 1
+                return None
+            logger.warning("Lease %s expired (holder %s); taking over", name, current.get("holder"))
+            self.takeovers += 1
+        else:
+            # Released between our create and read; try once more
+            try:
+                result = await ref.create(payload)
+            except Conflict:
+                self.contended += 1
+                return None
+
+        self.acquired += 1
+        return Lease(
+            name,
+            holder,
+            payload["expires_at"],
+            taken_over=doc.exists,
+            update_time=getattr(result, "update_time", None),
+        )
+
+    async def release(self, lease: Lease) -> None:
+        ref = self._ref(lease.name)
+        try:
+            if lease.update_time is not None:
+                await ref.delete(option=self.db.write_option(last_update_time=lease.update_time))
+            else:
+                await ref.delete()
+            self.released += 1
+        except (FailedPrecondition, NotFound):
+            # Expired and taken over by someone else while we held it
+            self.lost += 1
+            logger.warning("Lease %s was lost before release (holder %s)", lease.name, lease.holder)
+
+    def stats(self) -> dict:
+        return {
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "takeovers": self.takeovers,
+            "released": self.released,
+            "lost": self.lost,
+        }
+
+
+lease_manager = LeaseManager()
+metrics.register("leases", lease_manager.stats)
@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.common.logging import logger
+from app.common.metrics import metrics
+from app.infrastructure.firestore import get_db
+
+# Returns (access_token, expires_in_seconds)
+TokenFetcher = Callable[[], Awaitable[Tuple[str, float]]]
+
+
+@dataclass
+class CachedToken:
+    value: str
+    expires_at: float
+    refresh_at: float = 0.0
+
+
+class FirestoreTokenStore:
+    """Shares minted tokens between instances via ``service_tokens/{key}``."""
+
+    @property
+    def db(self):
+        return get_db()
+
+    def _ref(self, key: str):
+        doc_id = hashlib.sha256(key.encode()).hexdigest()[:40]
+        return self.db.collection("service_tokens").document(doc_id)
+
+    async def load(self, key: str) -> Optional[CachedToken]:
+        doc = await self._ref(key).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict() or {}
+        if not data.get("access_token") or not data.get("expires_at"):
+            return None
+        return CachedToken(
+            value=data["access_token"],
+            expires_at=float(data["expires_at"]),
+            refresh_at=float(data.get("refresh_at") or 0.0),
+        )
+
+    async def save(self, key: str, token: CachedToken) -> None:
+        await self._ref(key).set(
+            {
+                "key": key,
+                "access_token": token.value,
+                "expires_at": token.expires_at,
+                "refresh_at": token.refresh_at,
+            }
+        )
+
+
+class TokenManager:
+    """Process-wide OAuth token cache shared by every client instance.
+
+    - single-flight: concurrent callers for an expired key await one refresh;
+    - refresh-ahead: inside ``refresh_ahead_seconds`` of expiry the current
+      token is still served while a background refresh mints the next one;
+    - optional shared store: a token minted by another instance is reused
+      before minting a new one.
+    """
+
+    def __init__(
+        self,
+        refresh_ahead_seconds: float,
+        expiry_margin_seconds: float,
+        store: Optional[FirestoreTokenStore] = None,
+    ) -> None:
+        self.refresh_ahead_seconds = refresh_ahead_seconds
+        self.expiry_margin_seconds = expiry_margin_seconds
+        self.store = store
+        self._tokens: Dict[str, CachedToken] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._skip_store: Set[str] = set()
+
+        self.hits = 0
+        self.refreshes = 0
+        self.proactive_refreshes = 0
+        self.coalesced_waits = 0
+        self.store_hits = 0
+        self.failures = 0
+
+    async def get_token(self, key: str, fetcher: TokenFetcher) -> str:
+        entry = self._tokens.get(key)
+        now = time.time()
+        if entry and now < entry.expires_at - self.expiry_margin_seconds:
+            self.hits += 1
+            if now >= entry.refresh_at and key not in self._inflight:
+                self.proactive_refreshes += 1
+                self._start_refresh(key, fetcher).add_done_callback(self._log_background_failure)
+            return entry.value
+        return await self._refresh(key, fetcher)
+
+    def invalidate(self, key: str, token: Optional[str] = None) -> None:
+        """Drop a token the upstream rejected (e.g. HTTP 401)."""
+        entry = self._tokens.get(key)
+        if entry and (token is None or entry.value == token):
+            self._tokens.pop(key, None)
+            # The shared copy is just as stale; mint a fresh one next time.
+            self._skip_store.add(key)
+
+    async def _refresh(self, key: str, fetcher: TokenFetcher) -> str:
+        if key in self._inflight:
+            self.coalesced_waits += 1
+        task = self._inflight.get(key) or self._start_refresh(key, fetcher)
+        return await asyncio.shield(task)
+
+    def _start_refresh(self, key: str, fetcher: TokenFetcher) -> asyncio.Task:
+        task = asyncio.create_task(self._do_refresh(key, fetcher))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _do_refresh(self, key: str, fetcher: TokenFetcher) -> str:
+        if self.store and key not in self._skip_store:
+            try:
+                stored = await self.store.load(key)
+            except Exception as exc:
+                logger.warning("Token store read failed key=%s: %s", key, exc)
+                stored = None
+            if stored and time.time() < stored.refresh_at:
+                self.store_hits += 1
+                self._tokens[key] = stored
+                return stored.value
+
+        try:
+            value, expires_in = await fetcher()
+        except Exception:
+            self.failures += 1
+            raise
+        self.refreshes += 1
+        now = time.time()
+        lifetime = float(expires_in)
+        entry = CachedToken(
+            value=value,
+            expires_at=now + lifetime,
+            # Short-lived tokens refresh at half-life rather than immediately.
+            refresh_at=now + lifetime - min(self.refresh_ahead_seconds, lifetime / 2),
+        )
+        self._tokens[key] = entry
+        self._skip_store.discard(key)
+
+        if self.store:
+            try:
+                await self.store.save(key, entry)
+            except Exception as exc:
+                logger.warning("Token store write failed key=%s: %s", key, exc)
+        return value
+
+    @staticmethod
+    def _log_background_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception():
+            logger.warning("Background token refresh failed: %s", task.exception())
+
+    def stats(self) -> dict:
+        return {
+            "cached_keys": len(self._tokens),
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "proactive_refreshes": self.proactive_refreshes,
+            "coalesced_waits": self.coalesced_waits,
+            "store_hits": self.store_hits,
+            "failures": self.failures,
+            "store": "firestore" if self.store else "memory",
+        }
+
+
+token_manager = TokenManager(
+    refresh_ahead_seconds=settings.TOKEN_REFRESH_AHEAD_SECONDS,
+    expiry_margin_seconds=settings.TOKEN_EXPIRY_MARGIN_SECONDS,
+    store=FirestoreTokenStore() if settings.TOKEN_STORE_BACKEND == "firestore" else None,
+)
+metrics.register("tokens", token_manager.stats)
@@ -13,14 +13,47 @@ from app.modules.users.router import router as users_router
 from app.modules.esim.router import router as esim_router
 from app.modules.wallet.router import router as wallet_router
 from app.modules.payment.router import router as payment_router
-from app.infrastructure.firestore import init_firestore
+from app.modules.admin.router import router as admin_router
+from app.infrastructure.firestore import init_firestore, close_firestore
+from app.core.container import container
+from app.providers.esim_provider.client import provider_http
+from app.providers.epay.client import epay_http
+from app.modules.esim.tariffs import tariff_store
+from app.modules.esim.autopay import autopay_sweeper, autopay_worker
+from app.modules.payment.reconciler import pending_reconciler
+from app.modules.payment.webhooks import webhook_inbox
 from app.common.responses import ErrorResponse, ErrorDetail
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_firestore()
+    await provider_http.start()
+    await epay_http.start(
+        [
+            settings.EPAY_OAUTH_URL,
+            settings.EPAY_OAUTH_FALLBACK_URL,
+            settings.EPAY_API_URL,
+            settings.EPAY_API_FALLBACK_URL,
+        ]
+    )
+    container.build()
+    if settings.BACKGROUND_WORKERS_ENABLED:
+        await tariff_store.start(settings.TARIFF_WARMUP_TIMEOUT_SECONDS)
+        await autopay_worker.start()
+        await autopay_sweeper.start()
+        await webhook_inbox.start()
+        await pending_reconciler.start()
     yield
+    await pending_reconciler.stop()
+    await webhook_inbox.stop()
+    await autopay_sweeper.stop()
+    await autopay_worker.stop()
+    await tariff_store.stop()
+    await epay_http.aclose()
+    await provider_http.aclose()
+    container.reset()
+    close_firestore()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -53,6 +86,7 @@ app.include_router(users_router, prefix=settings.API_V1_STR, tags=["Users"])
 app.include_router(esim_router, prefix=settings.API_V1_STR, tags=["eSIM"])
 app.include_router(wallet_router, prefix=settings.API_V1_STR, tags=["Wallet"])
 app.include_router(payment_router, prefix=settings.API_V1_STR, tags=["Payments"])
+app.include_router(admin_router, prefix=settings.API_V1_STR, tags=["Admin"])
 
 @app.get("/")
 async def root():
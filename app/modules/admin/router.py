@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends
+
+from app.core.dependencies import require_admin_api_key
+from app.common.metrics import metrics
+from app.common.responses import DataResponse
+
+router = APIRouter()
+
+
+@router.get("/admin/metrics", summary="Process-level cache, pool and worker counters")
+async def get_metrics(_admin: dict = Depends(require_admin_api_key)):
+    return DataResponse(data=metrics.snapshot())
@@ -1,18 +1,13 @@
 from app.infrastructure.firestore import get_db
+from app.modules.users.cache import user_cache
 from app.modules.users.schemas import User, UserCreate
 from datetime import datetime
 import uuid
-import anyio
 
 class AuthRepository:
-    def __init__(self):
-        self._db = None
-
     @property
     def db(self):
-        if self._db is None:
-            self._db = get_db()
-        return self._db
+        return get_db()
 
     @property
     def collection(self):
@@ -20,14 +15,14 @@ class AuthRepository:
 
     async def get_user_by_phone(self, phone_number: str):
         query = self.collection.where("phone_number", "==", phone_number).limit(1)
-        docs = await anyio.to_thread.run_sync(query.get)
+        docs = await query.get()
         for doc in docs:
             return User(**doc.to_dict())
         return None
 
     async def get_user_by_id(self, user_id: str):
         doc_ref = self.collection.document(user_id)
-        doc = await anyio.to_thread.run_sync(doc_ref.get)
+        doc = await doc_ref.get()
         if doc.exists:
             return User(**doc.to_dict())
         return None
@@ -43,9 +38,10 @@ class AuthRepository:
         })
         
         doc_ref = self.collection.document(user_id)
-        await anyio.to_thread.run_sync(doc_ref.set, user_data)
+        await doc_ref.set(user_data)
         return User(**user_data)
 
     async def update_last_login(self, user_id: str):
         doc_ref = self.collection.document(user_id)
-        await anyio.to_thread.run_sync(doc_ref.update, {"last_login_at": datetime.utcnow()})
+        await doc_ref.update({"last_login_at": datetime.utcnow()})
+        user_cache.invalidate(user_id)
@@ -0,0 +1,189 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Set
+
+from app.core.config import settings
+from app.common.logging import logger
+from app.common.metrics import metrics
+from app.modules.esim.repository import EsimRepository
+from app.providers.esim_provider.client import EsimProviderClient
+from app.providers.esim_provider.inventory import InventoryDiff, InventorySnapshot, imsi_inventory
+from app.providers.esim_provider.schemas import ImsiListItem
+
+
+class FreeImsiAllocator:
+    """In-process pool of IMSIs that are neither allocated nor reserved.
+
+    The pool is rebuilt from the provider inventory snapshot plus Firestore
+    (allocated eSIMs and open reservations) every
+    ``ESIM_ALLOCATOR_REBUILD_SECONDS`` or when it runs dry (at most once per
+    ``ESIM_ALLOCATOR_MIN_REBUILD_SECONDS``, so an exhausted stock does not
+    cost every purchase a full scan); in between it is kept current from
+    inventory diffs and from our own acquire/release calls.
+    Handing out an IMSI pops the head of the pool and claims it with a
+    Firestore ``create`` on ``esim_reservations/{imsi}``, so several instances
+    with overlapping pools can never hand out the same IMSI: the loser of the
+    create just moves on to its next candidate.
+    """
+
+    def __init__(
+        self,
+        repository: Optional[EsimRepository] = None,
+        rebuild_seconds: float = 300.0,
+        min_rebuild_seconds: float = 30.0,
+    ) -> None:
+        self.repository = repository or EsimRepository()
+        self.rebuild_seconds = rebuild_seconds
+        self.min_rebuild_seconds = min_rebuild_seconds
+        self._queue: Deque[str] = deque()
+        self._free: Set[str] = set()
+        self._items: Dict[str, ImsiListItem] = {}
+        self._built_at = 0.0
+        self._rebuild_task: Optional[asyncio.Task] = None
+
+        self.acquired = 0
+        self.conflicts = 0
+        self.released = 0
+        self.rebuilds = 0
+        self.empty = 0
+
+    # ------------------------------------------------------------------
+    # Pool maintenance
+    # ------------------------------------------------------------------
+
+    async def rebuild(self, provider: EsimProviderClient) -> None:
+        if self._rebuild_task is None or self._rebuild_task.done():
+            self._rebuild_task = asyncio.create_task(self._rebuild(provider))
+        await asyncio.shield(self._rebuild_task)
+
+    async def _rebuild(self, provider: EsimProviderClient) -> None:
+        started = time.perf_counter()
+        inventory, allocated, reserved = await asyncio.gather(
+            provider.list_inventory(),
+            self.repository.get_all_allocated_imsis(),
+            self.repository.get_reserved_imsis(),
+        )
+        taken = set(allocated) | set(reserved)
+        self._items = {item.imsi: item for item in inventory}
+        self._queue = deque(item.imsi for item in inventory if item.imsi not in taken)
+        self._free = set(self._queue)
+        self._built_at = time.time()
+        self.rebuilds += 1
+        logger.info(
+            "Free IMSI pool rebuilt: %s free of %s in %.1f ms",
+            len(self._free),
+            len(self._items),
+            (time.perf_counter() - started) * 1000,
+        )
+
+    def on_inventory_change(self, snapshot: InventorySnapshot, diff: InventoryDiff) -> None:
+        """Inventory listener: follow provider-side changes between rebuilds."""
+        if not self._built_at:
+            return
+        for imsi in diff.removed:
+            self._items.pop(imsi, None)
+            self._free.discard(imsi)
+        for imsi in diff.balance_changed:
+            self._items[imsi] = snapshot.items[imsi]
+        for imsi in diff.added:
+            self._items[imsi] = snapshot.items[imsi]
+            self._push(imsi)
+
+    def _push(self, imsi: str) -> None:
+        if imsi not in self._free:
+            self._free.add(imsi)
+            self._queue.append(imsi)
+
+    def _pop(self) -> Optional[str]:
+        while self._queue:
+            imsi = self._queue.popleft()
+            # Entries discarded from the set are skipped lazily here
+            if imsi in self._free:
+                self._free.discard(imsi)
+                return imsi
+        return None
+
+    # ------------------------------------------------------------------
+    # Allocation
+    # ------------------------------------------------------------------
+
+    async def acquire(self, provider: EsimProviderClient, payload: dict) -> Optional[ImsiListItem]:
+        """Claim a free IMSI by creating its reservation document.
+
+        Returns None when no IMSI is available even after a rebuild, or when
+        the pool is empty and was rebuilt less than ``min_rebuild_seconds``
+        ago. Firestore
+        errors other than a create conflict propagate and leave the pool
+        intact. The caller owns the reservation and must delete it (or
+        ``release``) when done.
+        """
+        if not self._built_at or time.time() - self._built_at >= self.rebuild_seconds:
+            await self.rebuild(provider)
+
+        rebuilt = False
+        while True:
+            imsi = self._pop()
+            if imsi is None:
+                if rebuilt or time.time() - self._built_at < self.min_rebuild_seconds:
+                    self.empty += 1
+                    return None
+                await self.rebuild(provider)
+                rebuilt = True
+                continue
+
+            try:
+                reserved = await self.repository.create_reservation(imsi, payload)
+            except Exception:
+                # Not a conflict (Firestore unavailable, timeout): keep the IMSI
+                self._push(imsi)
+                raise
+            if not reserved:
+                # Reserved by another instance; a later rebuild sees it again if released
+                self.conflicts += 1
+                continue
+
+            # Allocated elsewhere since our last rebuild (reservations are
+            # deleted once a purchase completes), so check the point record.
+            existing = await self.repository.get_esim_by_imsi(imsi)
+            if existing and existing.get("user_id"):
+                self.conflicts += 1
+                await self.repository.delete_reservation(imsi)
+                continue
+
+            item = self._items.get(imsi)
+            if item is None:
+                # Dropped from the provider inventory while we were claiming it
+                await self.repository.delete_reservation(imsi)
+                continue
+            self.acquired += 1
+            return item
+
+    def release(self, imsi: str) -> None:
+        """Return an IMSI to the pool after a reservation was dropped or an eSIM unassigned."""
+        if imsi in self._items:
+            self.released += 1
+            self._push(imsi)
+
+    def discard(self, imsi: str) -> None:
+        self._free.discard(imsi)
+
+    def stats(self) -> dict:
+        return {
+            "free": len(self._free),
+            "known": len(self._items),
+            "age_seconds": round(time.time() - self._built_at, 1) if self._built_at else None,
+            "acquired": self.acquired,
+            "conflicts": self.conflicts,
+            "released": self.released,
+            "rebuilds": self.rebuilds,
+            "empty": self.empty,
+        }
+
+
+free_imsi_allocator = FreeImsiAllocator(
+    rebuild_seconds=settings.ESIM_ALLOCATOR_REBUILD_SECONDS,
+    min_rebuild_seconds=settings.ESIM_ALLOCATOR_MIN_REBUILD_SECONDS,
+)
+imsi_inventory.subscribe(free_imsi_allocator.on_inventory_change)
+metrics.register("free_imsi_allocator", free_imsi_allocator.stats)
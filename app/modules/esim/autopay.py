@@ -0,0 +1,236 @@
+import asyncio
+import random
+import time
+from typing import List, Optional
+
+from app.core.config import settings
+from app.common.logging import logger
+from app.common.metrics import metrics
+from app.modules.esim.repository import EsimRepository
+
+
+def autopay_status_for(last_status: Optional[str]) -> str:
+    """Collapse the detailed ``autopay_last_status`` into the pollable ``autopay_status``."""
+    if last_status == "success":
+        return "succeeded"
+    if last_status and (last_status.startswith("payment_") or last_status in ("error", "interrupted")):
+        return "failed"
+    return "skipped"
+
+
+class AutopayWorker:
+    """Processes ``autopay_jobs/{esim_id}`` off the request path.
+
+    Read endpoints only enqueue a job (a Firestore create, so one job per
+    eSIM) and ``submit`` its id here. Workers claim a job with a lease, run
+    the charge + top-up through ``EsimService.process_autopay_job`` and
+    delete the job when done. Unexpected errors are retried with exponential
+    backoff up to ``max_attempts``; a job whose eSIM lease is held by another
+    run is requeued without spending an attempt. A periodic recovery scan picks up jobs
+    queued by instances that died, and running jobs whose lease expired.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        lease_seconds: float,
+        max_attempts: int,
+        retry_base_seconds: float,
+        recovery_scan_seconds: float,
+        repository: Optional[EsimRepository] = None,
+    ) -> None:
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_seconds = retry_base_seconds
+        self.recovery_scan_seconds = recovery_scan_seconds
+        self.repository = repository or EsimRepository()
+        self._service = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.deferred = 0
+        self.recovered = 0
+
+    @property
+    def service(self):
+        if self._service is None:
+            from app.core.container import container
+
+            return container.esim_service
+        return self._service
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._recover_periodically()))
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        self._queue = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    def submit(self, esim_id: str) -> None:
+        """Wake a worker for a freshly enqueued job (no-op outside the lifespan)."""
+        if self._queue is not None:
+            self._queue.put_nowait(esim_id)
+
+    # ------------------------------------------------------------------
+    # Processing
+    # ------------------------------------------------------------------
+
+    async def _work(self) -> None:
+        while True:
+            esim_id = await self._queue.get()
+            try:
+                await self.process(esim_id)
+            except Exception as exc:
+                logger.error("Autopay worker crashed on esim_id=%s: %s", esim_id, exc)
+            finally:
+                self._queue.task_done()
+
+    async def process(self, esim_id: str) -> Optional[str]:
+        """Claim and run one job; returns the resulting autopay_last_status, or None if not claimed."""
+        now_ts = time.time()
+        job = await self.repository.claim_autopay_job(esim_id, now_ts, self.lease_seconds)
+        if job is None:
+            return None
+
+        try:
+            last_status = await self.service.process_autopay_job(esim_id, job)
+        except Exception as exc:
+            attempts = int(job.get("attempts", 1))
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                logger.error("Autopay job esim_id=%s failed after %s attempts: %s", esim_id, attempts, exc)
+                await self.repository.delete_autopay_job(esim_id)
+                await self.service.set_autopay_status(esim_id, "failed", "error")
+                return "error"
+            self.retried += 1
+            delay = self.retry_base_seconds * (2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+            logger.warning("Autopay job esim_id=%s attempt %s failed, retrying in %.0fs: %s", esim_id, attempts, delay, exc)
+            await self.repository.update_autopay_job(
+                esim_id,
+                {"status": "queued", "next_attempt_at": time.time() + delay, "last_error": str(exc)},
+            )
+            await self.service.set_autopay_status(esim_id, "queued")
+            return None
+
+        if last_status == "lease_busy":
+            # Another run holds this eSIM's lease: keep the job (and its queued status) for later
+            self.deferred += 1
+            await self.repository.update_autopay_job(
+                esim_id,
+                {
+                    "status": "queued",
+                    "next_attempt_at": time.time() + self.retry_base_seconds,
+                    "attempts": max(0, int(job.get("attempts", 1)) - 1),
+                },
+            )
+            return None
+
+        self.processed += 1
+        await self.repository.delete_autopay_job(esim_id)
+        return last_status
+
+    async def recover(self) -> int:
+        """Queue jobs left behind by restarts, crashes or retry backoff."""
+        due = await self.repository.list_due_autopay_jobs(time.time())
+        for esim_id in due:
+            self.submit(esim_id)
+        self.recovered += len(due)
+        return len(due)
+
+    async def _recover_periodically(self) -> None:
+        while True:
+            try:
+                await self.recover()
+            except Exception as exc:
+                logger.warning("Autopay recovery scan failed: %s", exc)
+            await asyncio.sleep(self.recovery_scan_seconds * random.uniform(0.9, 1.1))
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "recovered": self.recovered,
+        }
+
+
+class AutopaySweeper:
+    """Periodic fleet-wide autopay sweep (``EsimService.run_autopay_sweep``)."""
+
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+        self.sweeps = 0
+        self.last_report: Optional[dict] = None
+
+    async def run_once(self, concurrency: Optional[int] = None) -> dict:
+        if self._running:
+            return {"status": "already_running"}
+        self._running = True
+        try:
+            report = await autopay_worker.service.run_autopay_sweep(concurrency=concurrency)
+        finally:
+            self._running = False
+        self.sweeps += 1
+        self.last_report = {key: value for key, value in report.items() if key != "details"}
+        return report
+
+    async def start(self) -> None:
+        if self.interval_seconds > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds * random.uniform(0.9, 1.1))
+            try:
+                await self.run_once()
+            except Exception as exc:
+                logger.error("Scheduled autopay sweep failed: %s", exc)
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": self._task is not None and not self._task.done(),
+            "interval_seconds": self.interval_seconds,
+            "sweeps": self.sweeps,
+            "last_report": self.last_report,
+        }
+
+
+autopay_worker = AutopayWorker(
+    concurrency=settings.AUTOPAY_WORKER_CONCURRENCY,
+    lease_seconds=settings.AUTOPAY_JOB_LEASE_SECONDS,
+    max_attempts=settings.AUTOPAY_JOB_MAX_ATTEMPTS,
+    retry_base_seconds=settings.AUTOPAY_JOB_RETRY_BASE_SECONDS,
+    recovery_scan_seconds=settings.AUTOPAY_RECOVERY_SCAN_SECONDS,
+)
+metrics.register("autopay_worker", autopay_worker.stats)
+
+autopay_sweeper = AutopaySweeper(interval_seconds=settings.AUTOPAY_SWEEP_INTERVAL_SECONDS)
+metrics.register("autopay_sweep", autopay_sweeper.stats)
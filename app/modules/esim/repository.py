@@ -1,17 +1,18 @@
+from app.common.metrics import metrics
+from app.infrastructure.documents import TrackedDocument, WriteStats
 from app.infrastructure.firestore import get_db
-from typing import List, Optional
-import anyio
+from typing import Iterable, List, Optional
+from google.api_core.exceptions import FailedPrecondition
 from google.cloud.exceptions import Conflict
 
-class EsimRepository:
-    def __init__(self):
-        self._db = None
+esim_write_stats = WriteStats()
+metrics.register("esim_writes", esim_write_stats.stats)
+
 
+class EsimRepository:
     @property
     def db(self):
-        if self._db is None:
-            self._db = get_db()
-        return self._db
+        return get_db()
 
     @property
     def collection(self):
@@ -21,65 +22,110 @@ class EsimRepository:
     def reservation_collection(self):
         return self.db.collection("esim_reservations")
 
+    @property
+    def autopay_job_collection(self):
+        return self.db.collection("autopay_jobs")
+
     async def get_esim(self, esim_id: str) -> Optional[dict]:
         doc_ref = self.collection.document(esim_id)
-        doc = await anyio.to_thread.run_sync(doc_ref.get)
+        doc = await doc_ref.get()
         if doc.exists:
-            return doc.to_dict()
+            return TrackedDocument(doc.to_dict())
         return None
 
     async def save_esim(self, esim_data: dict):
+        """Write an eSIM: only changed fields for documents read through this repository.
+
+        Plain dicts (new records) are written in full; a loaded document with
+        no changes is not written at all.
+        """
         doc_ref = self.collection.document(esim_data["id"])
-        await anyio.to_thread.run_sync(doc_ref.set, esim_data)
+        if isinstance(esim_data, TrackedDocument) and esim_data.exists:
+            changes = esim_data.changes()
+            if not changes:
+                esim_write_stats.skipped += 1
+                return
+            await doc_ref.update(changes)
+            esim_write_stats.partial_updates += 1
+            esim_write_stats.fields_written += len(changes)
+            esim_data.mark_clean()
+            return
+        await doc_ref.set(dict(esim_data))
+        esim_write_stats.full_writes += 1
+        esim_write_stats.fields_written += len(esim_data)
+        if isinstance(esim_data, TrackedDocument):
+            esim_data.mark_clean()
+
+    async def save_esims(self, esims: Iterable[dict]) -> int:
+        """Flush pending changes of several loaded eSIMs in one batch commit."""
+        dirty = [esim for esim in esims if isinstance(esim, TrackedDocument) and esim.exists and esim.dirty]
+        if len(dirty) <= 1:
+            for esim in dirty:
+                await self.save_esim(esim)
+            return len(dirty)
+        batch = self.db.batch()
+        for esim in dirty:
+            changes = esim.changes()
+            batch.update(self.collection.document(esim["id"]), changes)
+            esim_write_stats.partial_updates += 1
+            esim_write_stats.fields_written += len(changes)
+        await batch.commit()
+        esim_write_stats.batches += 1
+        for esim in dirty:
+            esim.mark_clean()
+        return len(dirty)
 
     async def get_user_esims(self, user_id: str) -> List[dict]:
         query = self.collection.where("user_id", "==", user_id)
-        docs = await anyio.to_thread.run_sync(query.get)
-        return [doc.to_dict() for doc in docs]
+        docs = await query.get()
+        return [TrackedDocument(doc.to_dict()) for doc in docs]
 
     async def get_all_allocated_imsis(self) -> List[str]:
         query = self.collection.where("user_id", "!=", None)
-        docs = await anyio.to_thread.run_sync(query.get)
+        docs = await query.get()
         return [doc.to_dict().get("imsi") for doc in docs if doc.to_dict().get("imsi")]
 
+    async def get_allocated_esims(self) -> List[dict]:
+        query = self.collection.where("user_id", "!=", None)
+        docs = await query.get()
+        return [TrackedDocument(doc.to_dict()) for doc in docs]
+
     async def get_unassigned_esims(self) -> List[dict]:
         query = self.collection.where("user_id", "==", None)
-        docs = await anyio.to_thread.run_sync(query.get)
+        docs = await query.get()
         return [doc.to_dict() for doc in docs]
 
     async def update_activation_code_by_iccid(self, iccid: str, activation_code: str) -> bool:
         query = self.collection.where("iccid", "==", iccid).limit(1)
-        docs = await anyio.to_thread.run_sync(query.get)
+        docs = await query.get()
         found = False
         for doc in docs:
-            await anyio.to_thread.run_sync(doc.reference.update, {"activation_code": activation_code})
+            await self.collection.document(doc.id).update({"activation_code": activation_code})
             found = True
         return found
 
     async def get_esim_by_imsi(self, imsi: str) -> Optional[dict]:
         query = self.collection.where("imsi", "==", imsi).limit(1)
-        docs = await anyio.to_thread.run_sync(query.get)
+        docs = await query.get()
         for doc in docs:
-            return doc.to_dict()
+            return TrackedDocument(doc.to_dict())
         return None
 
     async def create_reservation(self, imsi: str, payload: dict) -> bool:
         ref = self.reservation_collection.document(imsi)
         try:
-            await anyio.to_thread.run_sync(ref.create, payload)
+            await ref.create(payload)
             return True
         except Conflict:
             return False
-        except Exception:
-            return False
 
     async def get_reserved_imsis(self) -> List[str]:
-        docs = await anyio.to_thread.run_sync(self.reservation_collection.get)
+        docs = await self.reservation_collection.get()
         return [doc.id for doc in docs]
 
     async def get_reservation_by_payment_id(self, payment_id: str) -> Optional[dict]:
         query = self.reservation_collection.where("payment_id", "==", payment_id).limit(1)
-        docs = await anyio.to_thread.run_sync(query.get)
+        docs = await query.get()
         for doc in docs:
             data = doc.to_dict() or {}
             data["imsi"] = doc.id
@@ -88,4 +134,65 @@ class EsimRepository:
 
     async def delete_reservation(self, imsi: str) -> None:
         ref = self.reservation_collection.document(imsi)
-        await anyio.to_thread.run_sync(ref.delete)
+        await ref.delete()
+
+
+    async def create_autopay_job(self, esim_id: str, payload: dict) -> bool:
+        """Enqueue at most one autopay job per eSIM (``autopay_jobs/{esim_id}``)."""
+        ref = self.autopay_job_collection.document(esim_id)
+        try:
+            await ref.create(payload)
+            return True
+        except Conflict:
+            return False
+
+    async def get_autopay_job(self, esim_id: str) -> Optional[dict]:
+        doc = await self.autopay_job_collection.document(esim_id).get()
+        if doc.exists:
+            return doc.to_dict()
+        return None
+
+    async def claim_autopay_job(self, esim_id: str, now_ts: float, lease_seconds: float) -> Optional[dict]:
+        """Mark a due job as running; None if it is not due or another worker won the race."""
+        ref = self.autopay_job_collection.document(esim_id)
+        doc = await ref.get()
+        if not doc.exists:
+            return None
+        job = doc.to_dict() or {}
+        if job.get("status") == "running" and float(job.get("locked_until", 0) or 0) > now_ts:
+            return None
+        if job.get("status") == "queued" and float(job.get("next_attempt_at", 0) or 0) > now_ts:
+            return None
+
+        job["status"] = "running"
+        job["locked_until"] = now_ts + lease_seconds
+        job["attempts"] = int(job.get("attempts", 0) or 0) + 1
+        try:
+            # Optimistic claim: fails if the job changed since we read it
+            await ref.update(
+                {"status": job["status"], "locked_until": job["locked_until"], "attempts": job["attempts"]},
+                option=self.db.write_option(last_update_time=doc.update_time),
+            )
+        except FailedPrecondition:
+            return None
+        return job
+
+    async def update_autopay_job(self, esim_id: str, fields: dict) -> None:
+        await self.autopay_job_collection.document(esim_id).update(fields)
+
+    async def delete_autopay_job(self, esim_id: str) -> None:
+        await self.autopay_job_collection.document(esim_id).delete()
+
+    async def list_due_autopay_jobs(self, now_ts: float, limit: int = 100) -> List[str]:
+        query = self.autopay_job_collection.where("status", "in", ["queued", "running"]).limit(limit)
+        docs = await query.get()
+        due = []
+        for doc in docs:
+            job = doc.to_dict() or {}
+            if job.get("status") == "running":
+                # Worker died mid-job: the lease expired without completion
+                if float(job.get("locked_until", 0) or 0) <= now_ts:
+                    due.append(doc.id)
+            elif float(job.get("next_attempt_at", 0) or 0) <= now_ts:
+                due.append(doc.id)
+        return due
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from app.modules.esim.autopay import autopay_sweeper
 from app.modules.esim.service import EsimService
 from app.modules.esim.schemas import (
     Esim, Tariff, ActivateRequest, 
@@ -7,23 +8,25 @@ from app.modules.esim.schemas import (
 )
 from app.core.dependencies import get_current_user, require_app_permission, require_admin_api_key
 from app.core.jwt import decode_token
+from app.core.container import get_esim_service
 from app.modules.users.schemas import User
 from app.common.responses import DataResponse, ResponseBase
-from typing import List
+from typing import List, Optional
 
 router = APIRouter()
-service = EsimService()
 
 @router.get("/esims", response_model=DataResponse[List[Esim]])
 async def get_esims(
-    current_user: User = Depends(require_app_permission("vink-sim"))
+    current_user: User = Depends(require_app_permission("vink-sim")),
+    service: EsimService = Depends(get_esim_service),
 ):
     esims = await service.get_user_esims(current_user)
     return DataResponse(data=esims)
 
 @router.get("/esims/unassigned", response_model=DataResponse[List[Esim]])
 async def get_unassigned_esims(
-    _admin_key: str = Depends(require_admin_api_key)
+    _admin_key: str = Depends(require_admin_api_key),
+    service: EsimService = Depends(get_esim_service),
 ):
     esims = await service.get_unassigned_esims()
     return DataResponse(data=esims)
@@ -31,7 +34,8 @@ async def get_unassigned_esims(
 @router.get("/esims/{id}", response_model=DataResponse[Esim])
 async def get_esim_by_id(
     id: str,
-    current_user: User = Depends(require_app_permission("vink-sim"))
+    current_user: User = Depends(require_app_permission("vink-sim")),
+    service: EsimService = Depends(get_esim_service),
 ):
     esim = await service.get_esim_by_id(current_user, id)
     return DataResponse(data=esim)
@@ -40,7 +44,8 @@ async def get_esim_by_id(
 async def activate_esim(
     id: str,
     request: ActivateRequest,
-    current_user: User = Depends(require_app_permission("vink-sim"))
+    current_user: User = Depends(require_app_permission("vink-sim")),
+    service: EsimService = Depends(get_esim_service),
 ):
     esim = await service.activate_esim(current_user, id, request.activation_code)
     return DataResponse(data=esim)
@@ -48,7 +53,8 @@ async def activate_esim(
 @router.post("/esims/{id}/deactivate")
 async def deactivate_esim(
     id: str,
-    current_user: User = Depends(require_app_permission("vink-sim"))
+    current_user: User = Depends(require_app_permission("vink-sim")),
+    service: EsimService = Depends(get_esim_service),
 ):
     await service.deactivate_esim(current_user, id)
     return ResponseBase()
@@ -57,7 +63,8 @@ async def deactivate_esim(
 async def update_esim_settings(
     id: str,
     request: UpdateSettingsRequest,
-    current_user: User = Depends(require_app_permission("vink-sim"))
+    current_user: User = Depends(require_app_permission("vink-sim")),
+    service: EsimService = Depends(get_esim_service),
 ):
     esim = await service.update_esim_settings(current_user, id, request)
     return DataResponse(data=esim)
@@ -65,19 +72,23 @@ async def update_esim_settings(
 @router.get("/esims/{id}/usage", response_model=DataResponse[UsageData])
 async def get_esim_usage(
     id: str,
-    current_user: User = Depends(require_app_permission("vink-sim"))
+    current_user: User = Depends(require_app_permission("vink-sim")),
+    service: EsimService = Depends(get_esim_service),
 ):
     usage = await service.get_esim_usage(current_user, id)
     return DataResponse(data=usage)
 
 @router.get("/tariffs", response_model=DataResponse[List[Tariff]])
-async def get_tariffs():
+async def get_tariffs(
+    service: EsimService = Depends(get_esim_service),
+):
     tariffs = await service.get_tariffs()
     return DataResponse(data=tariffs)
 
 @router.post("/esims/purchase", response_model=DataResponse[Esim])
 async def purchase_esim(
-    current_user: User = Depends(require_app_permission("vink-sim"))
+    current_user: User = Depends(require_app_permission("vink-sim")),
+    service: EsimService = Depends(get_esim_service),
 ):
     esim = await service.purchase_esim(current_user)
     return DataResponse(data=esim)
@@ -85,23 +96,35 @@ async def purchase_esim(
 @router.post("/esims/unassign")
 async def unassign_imsi(
     request: UnassignImsiRequest,
-    _admin_key: str = Depends(require_admin_api_key)
+    _admin_key: str = Depends(require_admin_api_key),
+    service: EsimService = Depends(get_esim_service),
 ):
     await service.unassign_imsi_admin(request.imsi)
     return ResponseBase()
 
 @router.post("/esims/internal/sync-activation-codes")
 async def sync_esim_activation_codes(
-    _admin_key: str = Depends(require_admin_api_key)
+    _admin_key: str = Depends(require_admin_api_key),
+    service: EsimService = Depends(get_esim_service),
 ):
     result = await service.sync_activation_codes()
     return DataResponse(data=result)
 
 
+@router.post("/esims/internal/autopay-sweep")
+async def run_esim_autopay_sweep_internal(
+    concurrency: Optional[int] = Query(None, ge=1, le=50),
+    _admin_key: str = Depends(require_admin_api_key)
+):
+    result = await autopay_sweeper.run_once(concurrency=concurrency)
+    return DataResponse(data=result)
+
+
 @router.post("/esims/internal/{id}/run-autopay")
 async def run_esim_autopay_internal(
     id: str,
-    _admin_key: str = Depends(require_admin_api_key)
+    _admin_key: str = Depends(require_admin_api_key),
+    service: EsimService = Depends(get_esim_service),
 ):
     result = await service.run_autopay_for_esim_admin(id)
     return DataResponse(data=result)
@@ -56,6 +56,9 @@ class Esim(BaseModel):
     data_limit: float = 0.0
     provider_balance: Optional[float] = 0.0
     activation_code: Optional[str] = None
+    is_stale: bool = Field(False, description="Provider data is served from cache because the provider is unavailable")
+    autopay_status: Optional[str] = Field(None, description="Auto top-up state: queued, running, succeeded, failed or skipped")
+    autopay_last_status: Optional[str] = Field(None, description="Detailed outcome of the last auto top-up attempt")
 
     class Config:
         from_attributes = True
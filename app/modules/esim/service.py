@@ -1,5 +1,9 @@
 from app.modules.esim.repository import EsimRepository
+from app.infrastructure.leases import lease_manager
+from app.modules.esim.allocator import free_imsi_allocator
+from app.modules.esim.autopay import autopay_status_for, autopay_worker
 from app.providers.esim_provider.client import EsimProviderClient
+from app.providers.esim_provider.cache import ImsiInfoResult
 from app.providers.epay.client import EpayClient
 from app.providers.epay.schemas import EpayCardIdPaymentRequest
 from app.core.config import settings
@@ -7,26 +11,31 @@ from app.modules.payment.repository import PaymentRepository
 from app.modules.payment.schemas import PaymentRecord, PaymentStatus, PaymentType
 from app.modules.users.repository import UserRepository
 from app.modules.esim.schemas import Esim, Tariff, UpdateSettingsRequest, UsageData
+from app.modules.esim.tariffs import TariffIndex, tariff_store
 from app.modules.users.schemas import User
 from app.common.exceptions import NotFoundError, AppError
 from app.common.mcc_codes import get_country_by_mcc
 from app.common.logging import logger
 from typing import List, Optional, Tuple
-import httpx
 import uuid
 import datetime
 import time
 import asyncio
 
 class EsimService:
-    def __init__(self):
+    def __init__(
+        self,
+        provider: Optional[EsimProviderClient] = None,
+        epay: Optional[EpayClient] = None,
+    ):
         self.repository = EsimRepository()
         self.user_repository = UserRepository()
         self.payment_repository = PaymentRepository()
-        self.provider = EsimProviderClient()
-        self.epay = EpayClient()
-        self._rates_cache: List[Tariff] = []
-        self._rates_last_updated = 0.0
+        self.provider = provider or EsimProviderClient()
+        self.allocator = free_imsi_allocator
+        self.epay = epay or EpayClient()
+        self.tariffs = tariff_store
+        self.leases = lease_manager
 
     async def _maybe_trigger_autopay(
         self,
@@ -35,15 +44,24 @@ class EsimService:
         provider_balance_mb: float,
         current_rate_usd_per_mb: Optional[float],
         country_name: str = "Global",
-    ) -> None:
+        balance_checked_at: Optional[float] = None,
+        last_mcc: Optional[int] = None,
+    ) -> str:
+        """Cheap eligibility checks on the read path; the charge runs in the autopay worker.
+
+        ``balance_checked_at`` (when the caller read the balance from the
+        provider) and ``last_mcc`` are stored on the job so the worker can
+        skip its own provider lookup while that reading is still fresh.
+        Returns "queued" when a job was enqueued, otherwise the reason it was not.
+        """
         if not settings.EPAY_ESIM_AUTOPAY_ENABLED:
-            return
+            return "disabled"
         if provider_balance_mb > settings.EPAY_ESIM_AUTOPAY_THRESHOLD_MB:
-            return
+            return "above_threshold"
         if current_rate_usd_per_mb is None or current_rate_usd_per_mb <= 0:
             esim_data["autopay_last_status"] = "no_tariff_rate"
             await self.repository.save_esim(esim_data)
-            return
+            return "no_tariff_rate"
 
         package_mb = float(settings.EPAY_ESIM_AUTOPAY_PACKAGE_MB)
         charge_usd = float(current_rate_usd_per_mb) * package_mb
@@ -51,44 +69,141 @@ class EsimService:
         if charge_usd <= 0:
             esim_data["autopay_last_status"] = "invalid_tariff_rate"
             await self.repository.save_esim(esim_data)
-            return
+            return "invalid_tariff_rate"
 
         now_ts = time.time()
         cooldown_seconds = max(1, settings.EPAY_ESIM_AUTOPAY_COOLDOWN_MINUTES) * 60
         last_attempt_ts = float(esim_data.get("autopay_last_attempt_ts", 0) or 0)
         if (now_ts - last_attempt_ts) < cooldown_seconds:
-            return
-        if esim_data.get("autopay_in_progress"):
-            return
+            return "cooldown"
+        if esim_data.get("autopay_status") in ("queued", "running"):
+            # The status alone can be stale (job finished without a final write); trust the job
+            if await self.repository.get_autopay_job(esim_data["id"]) is not None:
+                return "in_progress"
+
+        created = await self.repository.create_autopay_job(
+            esim_data["id"],
+            {
+                "esim_id": esim_data["id"],
+                "user_id": user.id,
+                "status": "queued",
+                "attempts": 0,
+                "next_attempt_at": now_ts,
+                "enqueued_at": now_ts,
+                "provider_balance_mb": float(provider_balance_mb),
+                "balance_checked_at": balance_checked_at,
+                "last_mcc": last_mcc,
+            },
+        )
+        if not created:
+            return "in_progress"
+        esim_data["autopay_status"] = "queued"
+        esim_data["autopay_queued_ts"] = now_ts
+        await self.repository.save_esim(esim_data)
+        autopay_worker.submit(esim_data["id"])
+        return "queued"
 
-        esim_data["autopay_in_progress"] = True
-        esim_data["autopay_last_attempt_ts"] = now_ts
+    async def process_autopay_job(self, esim_id: str, job: dict) -> str:
+        """Run one queued autopay (called by the autopay worker)."""
+        esim_data = await self.repository.get_esim(esim_id)
+        if not esim_data or esim_data.get("user_id") != job.get("user_id"):
+            if esim_data:
+                # One job per eSIM, so this is the only one: settle it for the new owner
+                esim_data["autopay_status"] = "skipped"
+                esim_data["autopay_last_status"] = "esim_reassigned"
+                await self.repository.save_esim(esim_data)
+            return "esim_reassigned"
+        user = await self.user_repository.get_user(job["user_id"])
+        if not user:
+            await self.set_autopay_status(esim_id, "skipped", "user_not_found")
+            return "user_not_found"
+
+        checked_at = float(job.get("balance_checked_at") or 0)
+        if time.time() - checked_at < settings.ESIM_IMSI_CACHE_TTL_SECONDS:
+            # Enqueued from a provider reading (e.g. the sweep's listing) that is still fresh
+            provider_balance = float(job.get("provider_balance_mb") or 0.0)
+            last_mcc = job.get("last_mcc")
+        else:
+            # Re-check with live provider data: the balance may have changed since enqueue
+            imsi_info = (await self.provider.lookup_imsi_info(esim_data["imsi"], force_refresh=True)).info
+            provider_balance = float(imsi_info.BALANCE) if imsi_info.BALANCE is not None else 0.0
+            last_mcc = getattr(imsi_info, "LASTMCC", None)
+        if provider_balance > settings.EPAY_ESIM_AUTOPAY_THRESHOLD_MB:
+            await self.set_autopay_status(esim_id, "skipped", "not_needed")
+            return "not_needed"
+        country_name, current_rate = await self._resolve_country_and_rate(last_mcc)
+        if current_rate is None or current_rate <= 0:
+            await self.set_autopay_status(esim_id, "skipped", "no_tariff_rate")
+            return "no_tariff_rate"
+
+        return await self._run_autopay(user, esim_data, provider_balance, current_rate, country_name)
+
+    async def set_autopay_status(self, esim_id: str, status: str, last_status: Optional[str] = None) -> None:
+        esim_data = await self.repository.get_esim(esim_id)
+        if not esim_data:
+            return
+        esim_data["autopay_status"] = status
+        if last_status:
+            esim_data["autopay_last_status"] = last_status
         await self.repository.save_esim(esim_data)
 
+    async def _run_autopay(
+        self,
+        user: User,
+        esim_data: dict,
+        provider_balance_mb: float,
+        current_rate_usd_per_mb: float,
+        country_name: str,
+    ) -> str:
+        """Charge the saved card and top up, holding the per-eSIM autopay lease.
+
+        The eSIM document is written once, with the outcome.
+        """
+        package_mb = float(settings.EPAY_ESIM_AUTOPAY_PACKAGE_MB)
+        charge_usd = round(float(current_rate_usd_per_mb) * package_mb, 2)
+        if charge_usd <= 0:
+            await self.set_autopay_status(esim_data["id"], "skipped", "invalid_tariff_rate")
+            return "invalid_tariff_rate"
+
+        lease = await self.leases.acquire(
+            f"autopay:{esim_data['id']}", float(settings.AUTOPAY_LEASE_SECONDS)
+        )
+        if lease is None:
+            # Another run holds the lease; the worker requeues the job instead of dropping it
+            return "lease_busy"
+
+        now_ts = time.time()
+        esim_data["autopay_last_attempt_ts"] = now_ts
         payment_record: Optional[PaymentRecord] = None
         try:
+            if lease.taken_over:
+                # The previous holder died mid-run (possibly after charging); never charge twice.
+                logger.error("eSIM autopay interrupted earlier for esim_id=%s; not retrying", esim_data["id"])
+                esim_data["autopay_last_status"] = "interrupted"
+                return "interrupted"
+
             selected_card = ""
             try:
                 saved_cards = await self._call_epay_with_deadline(
-                    self.epay.get_saved_cards(user.id),
+                    self.epay.list_saved_cards(user.id),
                     operation=f"autopay-saved-cards user={user.id}",
                 )
-                if saved_cards:
-                    selected_card = self._pick_latest_card_id(saved_cards)
             except AppError as exc:
                 logger.warning(
                     "eSIM autopay saved-card lookup fell back to local cache user=%s error=%s",
                     user.id,
                     exc,
                 )
+                saved_cards = self.epay.peek_saved_cards(user.id)
+            if saved_cards:
+                selected_card = self._pick_latest_card_id(saved_cards)
 
             if not selected_card:
                 selected_card = await self._get_local_saved_card_id_fallback(user.id)
 
             if not selected_card:
                 esim_data["autopay_last_status"] = "no_saved_card"
-                await self.repository.save_esim(esim_data)
-                return
+                return "no_saved_card"
 
             payment_id = str(uuid.uuid4())
             invoice_id = self._generate_autopay_invoice_id(esim_data.get("imsi", ""))
@@ -158,8 +273,7 @@ class EsimService:
                 payment_record.reason_code = payment_resp.code
                 await self.payment_repository.update_payment(payment_record)
                 esim_data["autopay_last_status"] = f"payment_{(payment_resp.status or 'failed').lower()}"
-                await self.repository.save_esim(esim_data)
-                return
+                return esim_data["autopay_last_status"]
 
             payment_record.status = (
                 PaymentStatus.AUTH if payment_resp.status == "AUTH" else PaymentStatus.CHARGE
@@ -178,7 +292,6 @@ class EsimService:
             esim_data["autopay_last_rate_usd_per_mb"] = float(current_rate_usd_per_mb)
             esim_data["autopay_last_amount_usd"] = round(charge_usd, 4)
             esim_data["autopay_last_country"] = country_name
-            await self.repository.save_esim(esim_data)
         except AppError as exc:
             logger.error("eSIM autopay ePay error for esim_id=%s: %s", esim_data.get("id"), exc)
             if payment_record and payment_record.status == PaymentStatus.PENDING:
@@ -187,7 +300,6 @@ class EsimService:
                 payment_record.reason_code = 502
                 await self.payment_repository.update_payment(payment_record)
             esim_data["autopay_last_status"] = "payment_error"
-            await self.repository.save_esim(esim_data)
         except Exception as exc:
             logger.error("eSIM autopay failed for esim_id=%s: %s", esim_data.get("id"), exc)
             if payment_record and payment_record.status == PaymentStatus.PENDING:
@@ -196,10 +308,14 @@ class EsimService:
                 payment_record.reason_code = -1
                 await self.payment_repository.update_payment(payment_record)
             esim_data["autopay_last_status"] = "error"
-            await self.repository.save_esim(esim_data)
         finally:
-            esim_data["autopay_in_progress"] = False
-            await self.repository.save_esim(esim_data)
+            esim_data.pop("autopay_in_progress", None)  # legacy flag, superseded by the lease
+            esim_data["autopay_status"] = autopay_status_for(esim_data.get("autopay_last_status"))
+            try:
+                await self.repository.save_esim(esim_data)
+            finally:
+                await self.leases.release(lease)
+        return esim_data.get("autopay_last_status") or "error"
 
     @staticmethod
     def _pick_latest_card_id(cards) -> str:
@@ -235,70 +351,42 @@ class EsimService:
             raise AppError(502, "ePay request timed out")
 
     async def _get_local_saved_card_id_fallback(self, user_id: str) -> str:
-        records = await self.payment_repository.list_payments(user_id, limit=100)
-        for record in records:
-            if record.status not in (PaymentStatus.AUTH, PaymentStatus.CHARGE):
-                continue
-            if record.card_id:
-                return record.card_id
-        return ""
-
-    async def _fetch_rates(self) -> List[Tariff]:
-        # Update cache if older than 1 hour (3600 seconds)
-        if self._rates_cache and (time.time() - self._rates_last_updated < 3600):
-            return self._rates_cache
-
-        url = "https://imsimarket.com/js/data/alternative.rates.json"
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(url)
-                response.raise_for_status()
-                data = response.json()
-                
-                tariffs = []
-                for rate in data:
-                    tariffs.append(
-                        Tariff(
-                            plmn=rate.get("PLMN"),
-                            network_name=rate.get("NetworkName"),
-                            country_name=rate.get("CountryName"),
-                            data_rate=float(rate.get("DataRate", 0.0))
-                        )
-                    )
-                
-                self._rates_cache = tariffs
-                self._rates_last_updated = time.time()
-                return tariffs
-            except Exception as e:
-                logger.error(f"Failed to fetch tariffs: {e}")
-                # Return cached outdated or empty if fails
-                return self._rates_cache
+        cards = await self.payment_repository.list_known_cards(user_id)
+        return cards[0]["card_id"] if cards else ""
 
     async def reserve_esim_for_payment(self, payment_id: str, user_id: str) -> dict:
-        all_imsis_provider = await self.provider.list_imsis()
-        allocated_imsis = set(await self.repository.get_all_allocated_imsis())
-        reserved_imsis = set(await self.repository.get_reserved_imsis())
-
-        for item in all_imsis_provider:
-            if item.imsi in allocated_imsis or item.imsi in reserved_imsis:
-                continue
+        payload = {
+            "payment_id": payment_id,
+            "user_id": user_id,
+            "reserved_at": datetime.datetime.utcnow().isoformat(),
+        }
+        imsi_info, item = await self._acquire_confirmed_imsi(payload)
+        return {
+            "imsi": item.imsi,
+            "msisdn": imsi_info.MSISDN or item.msisdn,
+            "balance": float(
+                imsi_info.BALANCE if imsi_info.BALANCE is not None else (getattr(item, "balance", 0.0) or 0.0)
+            ),
+        }
 
-            payload = {
-                "payment_id": payment_id,
-                "user_id": user_id,
-                "reserved_at": datetime.datetime.utcnow().isoformat(),
-            }
-            created = await self.repository.create_reservation(item.imsi, payload)
-            if not created:
-                continue
-
-            return {
-                "imsi": item.imsi,
-                "msisdn": item.msisdn,
-                "balance": float(getattr(item, "balance", 0.0) or 0.0),
-            }
+    async def _acquire_confirmed_imsi(self, payload: dict):
+        """Reserve a free IMSI via the allocator and confirm it with the provider."""
+        while True:
+            item = await self.allocator.acquire(self.provider, payload)
+            if not item:
+                raise AppError(409, "No available eSIMs in stock")
 
-        raise AppError(409, "No available eSIMs in stock")
+            # The inventory snapshot may be up to a refresh interval old
+            try:
+                imsi_info = await self.provider.confirm_imsi(item.imsi)
+            except Exception:
+                await self.repository.delete_reservation(item.imsi)
+                self.allocator.release(item.imsi)
+                raise
+            if imsi_info:
+                return imsi_info, item
+            await self.repository.delete_reservation(item.imsi)
+            self.allocator.discard(item.imsi)
 
     async def release_reserved_esim(self, payment_id: str) -> None:
         reservation = await self.repository.get_reservation_by_payment_id(payment_id)
@@ -307,6 +395,7 @@ class EsimService:
         imsi = reservation.get("imsi")
         if imsi:
             await self.repository.delete_reservation(imsi)
+            self.allocator.release(imsi)
 
     async def purchase_reserved_esim(self, user: User, payment_id: str) -> Esim:
         reservation = await self.repository.get_reservation_by_payment_id(payment_id)
@@ -317,9 +406,11 @@ class EsimService:
         if not imsi:
             raise AppError(409, "Reserved eSIM invalid")
 
-        all_imsis_provider = await self.provider.list_imsis()
-        target_imsi_item = next((item for item in all_imsis_provider if item.imsi == imsi), None)
+        target_imsi_item = self.provider.inventory.get(imsi)
         if not target_imsi_item:
+            all_imsis_provider = await self.provider.list_inventory()
+            target_imsi_item = next((item for item in all_imsis_provider if item.imsi == imsi), None)
+        if not target_imsi_item or not await self.provider.confirm_imsi(imsi):
             await self.repository.delete_reservation(imsi)
             raise AppError(409, "Reserved eSIM is no longer available")
 
@@ -345,6 +436,9 @@ class EsimService:
                 existing_record["iccid"] = iccid
             existing_record["provider"] = "Vink"
             existing_record["updated_at"] = datetime.datetime.utcnow().isoformat()
+            # Autopay state (status, cooldown, last charge) belonged to the previous owner
+            for key in [key for key in existing_record if key.startswith("autopay_")]:
+                del existing_record[key]
             await self.repository.save_esim(existing_record)
         else:
             esim_id = str(uuid.uuid4())
@@ -369,9 +463,18 @@ class EsimService:
         return await self.get_esim_by_id(user, esim_id)
 
     async def get_tariffs(self) -> List[Tariff]:
-        return await self._fetch_rates()
+        index = self.tariffs.current()
+        if not self.tariffs.loaded:
+            # Cold start without a snapshot: an empty list would read as "no tariffs"
+            raise AppError(503, "Tariffs are not loaded yet, retry shortly")
+        return index.tariffs
 
-    async def _resolve_country_and_rate(self, last_mcc: Optional[str]) -> Tuple[str, Optional[float]]:
+    async def get_tariff_index(self) -> TariffIndex:
+        # Refreshed in the background by the app lifespan; never blocks here
+        return self.tariffs.current()
+
+    @staticmethod
+    def _country_and_rate(last_mcc: Optional[str], tariff_index: TariffIndex) -> Tuple[str, Optional[float]]:
         country_name = "Global"
         current_rate = None
 
@@ -383,80 +486,102 @@ class EsimService:
 
             if mapped_country != "Unknown":
                 country_name = mapped_country
-                all_tariffs = await self.get_tariffs()
-                country_rates = [t.data_rate for t in all_tariffs if t.country_name == country_name]
-                if country_rates:
-                    current_rate = min(country_rates)
+                current_rate = tariff_index.best_rate(country_name)
 
         return country_name, current_rate
 
+    async def _resolve_country_and_rate(self, last_mcc: Optional[str]) -> Tuple[str, Optional[float]]:
+        if not last_mcc:
+            return "Global", None
+        return self._country_and_rate(last_mcc, await self.get_tariff_index())
+
     async def get_user_esims(self, user: User) -> List[Esim]:
         # 1. Get allocated IMSIs from DB
         user_esims_data = await self.repository.get_user_esims(user.id)
         
         # Prefetch rates once
-        all_tariffs = await self.get_tariffs()
-        
-        esims = []
-        for data in user_esims_data:
-            imsi_info = None
+        tariff_index = await self.get_tariff_index()
+
+        # 2. Sync every eSIM with the provider concurrently, bounded per request
+        semaphore = asyncio.Semaphore(max(1, settings.ESIM_PROVIDER_SYNC_CONCURRENCY))
+        esims = list(
+            await asyncio.gather(
+                *[self._build_user_esim(user, data, tariff_index, semaphore) for data in user_esims_data]
+            )
+        )
+
+        # 3. Persist provider-side changes (ICCID/MSISDN) of all eSIMs in one commit
+        await self.repository.save_esims(user_esims_data)
+        return esims
+
+    async def _fetch_imsi_info_bounded(self, imsi: str, semaphore: asyncio.Semaphore) -> Optional[ImsiInfoResult]:
+        """Provider lookup for one eSIM; ``None`` on timeout/error so siblings still render."""
+        async with semaphore:
             try:
-                # 2. Sync with Provider "Master Profile" data
-                imsi_info = await self.provider.get_imsi_info(data["imsi"])
+                return await asyncio.wait_for(
+                    self.provider.lookup_imsi_info(imsi),
+                    timeout=float(settings.ESIM_PROVIDER_SYNC_TIMEOUT_SECONDS),
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Provider IMSI lookup timed out imsi=%s", imsi)
             except Exception:
                 pass
+        # Degrade to the last known provider answer, flagged as stale
+        cached = self.provider.peek_imsi_info(imsi)
+        if cached:
+            return ImsiInfoResult(info=cached.info, fetched_at=cached.fetched_at, stale=True)
+        return None
 
-            activation_code = data.get("activation_code", "UNKNOWN")
+    async def _build_user_esim(
+        self,
+        user: User,
+        data: dict,
+        tariff_index: TariffIndex,
+        semaphore: asyncio.Semaphore,
+    ) -> Esim:
+        # Sync with Provider "Master Profile" data
+        lookup = await self._fetch_imsi_info_bounded(data["imsi"], semaphore)
+        imsi_info = lookup.info if lookup else None
 
-            provider_balance = 0.0
-            last_mcc = None
-            if imsi_info:
-                if imsi_info.BALANCE is not None:
-                    provider_balance = float(imsi_info.BALANCE)
-                last_mcc = getattr(imsi_info, "LASTMCC", None)
-                
-                # Sync ICCID if missing or different in DB
-                if imsi_info.ICCID and data.get("iccid") != imsi_info.ICCID:
-                    data["iccid"] = imsi_info.ICCID
-                    data["msisdn"] = imsi_info.MSISDN
-                    await self.repository.save_esim(data)
-
-            # Map MCC to Country and find best rate
-            country_name = "Global"
-            current_rate = None
-            if last_mcc:
-                try:
-                    mapped_country = get_country_by_mcc(int(last_mcc))
-                except Exception:
-                    mapped_country = "Unknown"
-                if mapped_country != "Unknown":
-                    country_name = mapped_country
-                    country_rates = [t.data_rate for t in all_tariffs if t.country_name == country_name]
-                    if country_rates:
-                        current_rate = min(country_rates)
-
-            # Auto-recharge: if remaining balance <= threshold, charge tariff-derived amount and add 3GB
-            await self._maybe_trigger_autopay(user, data, provider_balance, current_rate, country_name)
-
-            esim = Esim(
-                id=data["id"],
-                user_id=user.id,
-                name=data.get("name", "Vink eSIM"),
-                imsi=data["imsi"],
-                iccid=imsi_info.ICCID if imsi_info else data.get("iccid"),
-                msisdn=imsi_info.MSISDN if imsi_info else data.get("msisdn"),
-                data_used=max(0.0, data.get("data_limit", 0.0) - provider_balance), 
-                data_limit=data.get("data_limit", 0.0),
-                is_active=bool(imsi_info.MSISDN if imsi_info else data.get("msisdn")), 
-                activation_code=activation_code,
-                provider_balance=provider_balance,
-                country=country_name,
-                provider="Vink",
-                current_rate=current_rate
-            )
-            esims.append(esim)
-                
-        return esims
+        activation_code = data.get("activation_code", "UNKNOWN")
+
+        provider_balance = 0.0
+        last_mcc = None
+        if imsi_info:
+            if imsi_info.BALANCE is not None:
+                provider_balance = float(imsi_info.BALANCE)
+            last_mcc = getattr(imsi_info, "LASTMCC", None)
+            
+            # Sync ICCID if missing or different in DB (flushed by get_user_esims in one batch)
+            if imsi_info.ICCID and data.get("iccid") != imsi_info.ICCID:
+                data["iccid"] = imsi_info.ICCID
+                data["msisdn"] = imsi_info.MSISDN
+
+        # Map MCC to Country and find best rate
+        country_name, current_rate = self._country_and_rate(last_mcc, tariff_index)
+
+        # Auto-recharge: if remaining balance <= threshold, charge tariff-derived amount and add 3GB
+        await self._maybe_trigger_autopay(user, data, provider_balance, current_rate, country_name)
+
+        return Esim(
+            id=data["id"],
+            user_id=user.id,
+            name=data.get("name", "Vink eSIM"),
+            imsi=data["imsi"],
+            iccid=imsi_info.ICCID if imsi_info else data.get("iccid"),
+            msisdn=imsi_info.MSISDN if imsi_info else data.get("msisdn"),
+            data_used=max(0.0, data.get("data_limit", 0.0) - provider_balance), 
+            data_limit=data.get("data_limit", 0.0),
+            is_active=bool(imsi_info.MSISDN if imsi_info else data.get("msisdn")), 
+            activation_code=activation_code,
+            provider_balance=provider_balance,
+            country=country_name,
+            provider="Vink",
+            current_rate=current_rate,
+            is_stale=bool(lookup and lookup.stale),
+            autopay_status=data.get("autopay_status"),
+            autopay_last_status=data.get("autopay_last_status"),
+        )
 
     async def get_esim_by_id(self, user: User, esim_id: str) -> Esim:
         # Check DB ownership
@@ -464,8 +589,9 @@ class EsimService:
         if not data or data.get("user_id") != user.id:
             raise NotFoundError("eSIM not found")
             
-        # Fetch provider info
-        imsi_info = await self.provider.get_imsi_info(data["imsi"])
+        # Fetch provider info (cached; stale copy if the provider is down)
+        lookup = await self.provider.lookup_imsi_info(data["imsi"])
+        imsi_info = lookup.info
 
         activation_code = data.get("activation_code", "UNKNOWN")
         
@@ -485,7 +611,10 @@ class EsimService:
             activation_code=activation_code,
             country=country_name,
             provider="Vink",
-            current_rate=current_rate
+            current_rate=current_rate,
+            is_stale=lookup.stale,
+            autopay_status=data.get("autopay_status"),
+            autopay_last_status=data.get("autopay_last_status"),
         )
 
     async def activate_esim(self, user: User, esim_id: str, code: str) -> Esim:
@@ -618,36 +747,32 @@ class EsimService:
         # EXPLANATION: Based on user clarification, IMSIs are pre-funded for initial purchase.
         # This endpoint assigns the first available (unallocated) IMSI to the user.
         
-        # 1. Fetch all IMSI from Provider ("Master Profile" full list)
-        all_imsis_provider = await self.provider.list_imsis()
-        
-        # 2. Fetch all allocated IMSIs from DB
-        allocated = await self.repository.get_all_allocated_imsis()
-        
-        # 3. Find one unallocated (exclusive allocation logic)
-        target_imsi_item = None
-        for item in all_imsis_provider:
-             if item.imsi not in allocated:
-                 target_imsi_item = item
-                 break
-        
-        if not target_imsi_item:
-            raise AppError(503, "No available eSIMs in stock")
+        # 1. Claim a free IMSI from the allocator pool (Firestore-create guarded)
+        #    and confirm it with the provider
+        payload = {
+            "payment_id": None,
+            "user_id": user.id,
+            "reserved_at": datetime.datetime.utcnow().isoformat(),
+        }
+        try:
+            _, target_imsi_item = await self._acquire_confirmed_imsi(payload)
+        except AppError as e:
+            if e.status_code == 409:
+                raise AppError(503, "No available eSIMs in stock")
+            raise
 
-        # Fetch ICCID to store it
-        iccid = None
+        # 2. Allocate and return fully populated eSIM info
         try:
-             imsi_info = await self.provider.get_imsi_info(target_imsi_item.imsi)
-             iccid = imsi_info.ICCID
+            return await self._allocate_specific_imsi_to_user(user, target_imsi_item)
         except Exception:
-             pass
-        
-        # 4. Allocate and return fully populated eSIM info
-        return await self._allocate_specific_imsi_to_user(user, target_imsi_item)
+            self.allocator.release(target_imsi_item.imsi)
+            raise
+        finally:
+            await self.repository.delete_reservation(target_imsi_item.imsi)
 
     async def get_unassigned_esims(self) -> List[Esim]:
-        # 1. Fetch all IMSI from Provider
-        all_imsis_provider = await self.provider.list_imsis()
+        # 1. IMSI list from the shared provider inventory snapshot
+        all_imsis_provider = await self.provider.list_inventory()
         
         # 2. Fetch all allocated IMSIs from DB
         allocated_imsis = await self.repository.get_all_allocated_imsis()
@@ -697,6 +822,7 @@ class EsimService:
         esim_data["updated_at"] = datetime.datetime.utcnow().isoformat()
         
         await self.repository.save_esim(esim_data)
+        self.allocator.release(imsi)
 
     async def sync_activation_codes(self) -> dict:
         snapshots = await self.provider.fetch_esim_snapshots()
@@ -716,6 +842,95 @@ class EsimService:
             "updated_local_records": updated_count
         }
 
+    async def run_autopay_sweep(self, concurrency: Optional[int] = None) -> dict:
+        """Autopay every allocated eSIM at or under the threshold, using one provider list call."""
+        started = time.perf_counter()
+        inventory = await self.provider.list_inventory(force_refresh=True)
+        listed_at = time.time()
+        balances = {item.imsi: float(item.balance or 0.0) for item in inventory}
+        threshold = settings.EPAY_ESIM_AUTOPAY_THRESHOLD_MB
+        candidates = [
+            esim_data
+            for esim_data in await self.repository.get_allocated_esims()
+            if esim_data.get("imsi") in balances and balances[esim_data["imsi"]] <= threshold
+        ]
+
+        semaphore = asyncio.Semaphore(max(1, concurrency or settings.AUTOPAY_SWEEP_CONCURRENCY))
+        users: dict = {}
+        outcomes = await asyncio.gather(
+            *[
+                self._sweep_one(esim_data, balances[esim_data["imsi"]], listed_at, users, semaphore)
+                for esim_data in candidates
+            ]
+        )
+
+        report = {"charged": [], "skipped": [], "failed": [], "in_progress": []}
+        for esim_id, outcome, detail in outcomes:
+            report[outcome].append({"esim_id": esim_id, "status": detail})
+        summary = {
+            "checked": len(balances),
+            "candidates": len(candidates),
+            **{key: len(value) for key, value in report.items()},
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "details": report,
+        }
+        logger.info(
+            "Autopay sweep: %s candidates, %s charged, %s skipped, %s failed in %.0f ms",
+            summary["candidates"],
+            summary["charged"],
+            summary["skipped"],
+            summary["failed"],
+            summary["duration_ms"],
+        )
+        return summary
+
+    async def _sweep_one(
+        self,
+        esim_data: dict,
+        provider_balance: float,
+        listed_at: float,
+        users: dict,
+        semaphore: asyncio.Semaphore,
+    ) -> Tuple[str, str, str]:
+        esim_id = esim_data["id"]
+        async with semaphore:
+            try:
+                user_id = esim_data["user_id"]
+                if user_id not in users:
+                    users[user_id] = await self.user_repository.get_user(user_id)
+                user = users[user_id]
+                if not user:
+                    return esim_id, "skipped", "user_not_found"
+
+                lookup = await self.provider.lookup_imsi_info(esim_data["imsi"])
+                last_mcc = getattr(lookup.info, "LASTMCC", None)
+                country_name, current_rate = await self._resolve_country_and_rate(last_mcc)
+                # The listing balance rides along on the job, so the inline run skips a forced lookup
+                decision = await self._maybe_trigger_autopay(
+                    user,
+                    esim_data,
+                    provider_balance,
+                    current_rate,
+                    country_name,
+                    balance_checked_at=listed_at,
+                    last_mcc=last_mcc,
+                )
+                if decision == "in_progress":
+                    return esim_id, "in_progress", decision
+                if decision != "queued":
+                    return esim_id, "skipped", decision
+
+                last_status = await autopay_worker.process(esim_id)
+                if last_status is None:
+                    # Picked up (or being retried) by the worker instead
+                    return esim_id, "in_progress", "queued"
+                if last_status == "success":
+                    return esim_id, "charged", last_status
+                return esim_id, autopay_status_for(last_status), last_status
+            except Exception as exc:
+                logger.error("Autopay sweep failed for esim_id=%s: %s", esim_id, exc)
+                return esim_id, "failed", "error"
+
     async def run_autopay_for_esim_admin(self, esim_id: str) -> dict:
         esim_data = await self.repository.get_esim(esim_id)
         if not esim_data:
@@ -740,6 +955,8 @@ class EsimService:
         last_mcc = getattr(imsi_info, "LASTMCC", None) if 'imsi_info' in locals() and imsi_info else None
         country_name, current_rate = await self._resolve_country_and_rate(last_mcc)
         await self._maybe_trigger_autopay(user, esim_data, provider_balance, current_rate, country_name)
+        # Admin runs are synchronous: process the job now instead of waiting for the worker
+        await autopay_worker.process(esim_id)
         refreshed = await self.repository.get_esim(esim_id)
 
         return {
@@ -748,5 +965,6 @@ class EsimService:
             "provider_balance_mb": provider_balance,
             "autopay_last_status_before": before_status,
             "autopay_last_status_after": refreshed.get("autopay_last_status") if refreshed else None,
+            "autopay_status": refreshed.get("autopay_status") if refreshed else None,
             "autopay_last_success_ts": refreshed.get("autopay_last_success_ts") if refreshed else None,
         }
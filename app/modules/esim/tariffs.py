@@ -0,0 +1,373 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.common.logging import logger
+from app.common.metrics import metrics
+from app.infrastructure.firestore import get_db
+from app.modules.esim.schemas import Tariff
+
+
+class TariffIndex:
+    """Tariffs compiled once per refresh for dictionary lookups on the request path.
+
+    - ``best_rate(country)``: cheapest ``data_rate`` in a country;
+    - ``networks(country)``: the country's tariffs ordered by rate (cheapest first);
+    - ``by_plmn(plmn)``: tariff for an operator code.
+    """
+
+    def __init__(self, tariffs: Iterable[Tariff]) -> None:
+        started = time.perf_counter()
+        self.tariffs: List[Tariff] = list(tariffs)
+
+        by_country: Dict[str, List[Tariff]] = {}
+        self._by_plmn: Dict[str, Tariff] = {}
+        for tariff in self.tariffs:
+            by_country.setdefault(tariff.country_name, []).append(tariff)
+            # Keep the cheapest entry if the feed repeats a PLMN
+            current = self._by_plmn.get(tariff.plmn)
+            if current is None or tariff.data_rate < current.data_rate:
+                self._by_plmn[tariff.plmn] = tariff
+
+        self._networks: Dict[str, List[Tariff]] = {
+            country: sorted(items, key=lambda t: t.data_rate) for country, items in by_country.items()
+        }
+        self._best_rate: Dict[str, float] = {
+            country: items[0].data_rate for country, items in self._networks.items()
+        }
+        self.build_ms = (time.perf_counter() - started) * 1000
+
+    def __len__(self) -> int:
+        return len(self.tariffs)
+
+    def best_rate(self, country_name: str) -> Optional[float]:
+        return self._best_rate.get(country_name)
+
+    def networks(self, country_name: str) -> List[Tariff]:
+        return self._networks.get(country_name, [])
+
+    def by_plmn(self, plmn: str) -> Optional[Tariff]:
+        return self._by_plmn.get(plmn)
+
+    def stats(self) -> dict:
+        return {
+            "tariffs": len(self.tariffs),
+            "countries": len(self._networks),
+            "plmns": len(self._by_plmn),
+            "build_ms": round(self.build_ms, 3),
+        }
+
+
+EMPTY_TARIFF_INDEX = TariffIndex([])
+
+
+def parse_rates(data: list) -> List[Tariff]:
+    return [
+        Tariff(
+            plmn=rate.get("PLMN"),
+            network_name=rate.get("NetworkName"),
+            country_name=rate.get("CountryName"),
+            data_rate=float(rate.get("DataRate", 0.0)),
+        )
+        for rate in data
+    ]
+
+
+@dataclass
+class TariffSnapshot:
+    version: str
+    fetched_at: float
+    tariffs: List[Tariff]
+
+    @classmethod
+    def from_tariffs(cls, tariffs: List[Tariff], fetched_at: float) -> "TariffSnapshot":
+        rows = cls._rows(tariffs)
+        version = hashlib.sha256(json.dumps(rows, separators=(",", ":")).encode()).hexdigest()[:16]
+        return cls(version=version, fetched_at=fetched_at, tariffs=tariffs)
+
+    @staticmethod
+    def _rows(tariffs: List[Tariff]) -> list:
+        return [[t.plmn, t.network_name, t.country_name, t.data_rate] for t in tariffs]
+
+    def dumps(self) -> str:
+        # Positional rows keep the payload well under Firestore's 1 MiB document limit
+        return json.dumps(
+            {"version": self.version, "fetched_at": self.fetched_at, "rows": self._rows(self.tariffs)},
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def loads(cls, payload: str) -> "TariffSnapshot":
+        data = json.loads(payload)
+        tariffs = [
+            Tariff(plmn=plmn, network_name=network, country_name=country, data_rate=rate)
+            for plmn, network, country, rate in data["rows"]
+        ]
+        return cls(version=data["version"], fetched_at=float(data["fetched_at"]), tariffs=tariffs)
+
+
+class FirestoreTariffSnapshotStore:
+    """Keeps the last good tariff table in ``tariff_snapshots/current``."""
+
+    @property
+    def db(self):
+        return get_db()
+
+    def _ref(self):
+        return self.db.collection("tariff_snapshots").document("current")
+
+    async def load(self) -> Optional[TariffSnapshot]:
+        doc = await self._ref().get()
+        if not doc.exists:
+            return None
+        payload = (doc.to_dict() or {}).get("payload")
+        return TariffSnapshot.loads(payload) if payload else None
+
+    async def save(self, snapshot: TariffSnapshot) -> None:
+        await self._ref().set(
+            {"version": snapshot.version, "fetched_at": snapshot.fetched_at, "payload": snapshot.dumps()}
+        )
+
+
+class FileTariffSnapshotStore:
+    """Local JSON snapshot, e.g. baked into the image or on a mounted volume."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    # File I/O and JSON (de)serialisation run in a worker thread so a large
+    # snapshot does not stall the event loop
+
+    async def load(self) -> Optional[TariffSnapshot]:
+        return await asyncio.to_thread(self._load)
+
+    async def save(self, snapshot: TariffSnapshot) -> None:
+        await asyncio.to_thread(self._save, snapshot)
+
+    def _load(self) -> Optional[TariffSnapshot]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r", encoding="utf-8") as f:
+            return TariffSnapshot.loads(f.read())
+
+    def _save(self, snapshot: TariffSnapshot) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(snapshot.dumps())
+        os.replace(tmp_path, self.path)
+
+
+def _snapshot_store_from_settings():
+    backend = settings.TARIFF_SNAPSHOT_BACKEND
+    if backend == "firestore":
+        return FirestoreTariffSnapshotStore()
+    if backend == "file":
+        return FileTariffSnapshotStore(settings.TARIFF_SNAPSHOT_PATH)
+    return None
+
+
+class TariffStore:
+    """Process-wide tariff index refreshed off the request path.
+
+    The app lifespan calls ``start`` (one bounded warm-up load, then a
+    background loop with jittered intervals) and ``stop``. Readers get the
+    current index immediately; a failed refresh keeps the last good index
+    and is retried after ``retry_seconds``. Outside the lifespan (scripts,
+    tests) a stale read schedules a background refresh instead of waiting.
+
+    With a snapshot store, every refresh that changes the table persists a
+    versioned snapshot, and ``start`` loads it instead of downloading the
+    feed, so new instances serve rates from their first request.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        refresh_seconds: float,
+        jitter: float,
+        retry_seconds: float,
+        timeout_seconds: float,
+        snapshots=None,
+    ) -> None:
+        self.url = url
+        self.refresh_seconds = refresh_seconds
+        self.jitter = jitter
+        self.retry_seconds = retry_seconds
+        self.timeout_seconds = timeout_seconds
+        self.snapshots = snapshots
+        self._index: TariffIndex = EMPTY_TARIFF_INDEX
+        self._version: Optional[str] = None
+        self._loaded_at = 0.0
+        self._attempted_at = 0.0
+        self._loop_task: Optional[asyncio.Task] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_duration_ms = 0.0
+        self.snapshot_loads = 0
+        self.snapshot_saves = 0
+
+    @property
+    def index(self) -> TariffIndex:
+        return self._index
+
+    @property
+    def loaded(self) -> bool:
+        """False until a download or snapshot has installed a table."""
+        return self._version is not None
+
+    def current(self) -> TariffIndex:
+        """Current index; never waits on the rates download."""
+        running = self._loop_task is not None and not self._loop_task.done()
+        now = time.time()
+        if (
+            not running
+            and now - self._loaded_at >= self.refresh_seconds
+            and now - self._attempted_at >= self.retry_seconds
+        ):
+            self.refresh_in_background()
+        return self._index
+
+    def refresh_in_background(self) -> None:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
+
+    async def refresh(self) -> bool:
+        started = time.perf_counter()
+        self._attempted_at = time.time()
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
+                response = await client.get(self.url)
+                response.raise_for_status()
+                tariffs = parse_rates(response.json())
+            if not tariffs:
+                raise ValueError("rates feed returned no tariffs")
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error(f"Failed to fetch tariffs: {e}")
+            return False
+        finally:
+            self.last_duration_ms = (time.perf_counter() - started) * 1000
+
+        snapshot = TariffSnapshot.from_tariffs(tariffs, fetched_at=time.time())
+        changed = snapshot.version != self._version
+        self._install(snapshot)
+        self.refreshes += 1
+        self.last_error = None
+        logger.info(
+            "Tariff index built: %s tariffs, %s countries in %.2f ms (version %s)",
+            len(tariffs),
+            self._index.stats()["countries"],
+            self._index.build_ms,
+            snapshot.version,
+        )
+        if changed:
+            await self._save_snapshot(snapshot)
+        return True
+
+    def _install(self, snapshot: TariffSnapshot) -> None:
+        self._index = TariffIndex(snapshot.tariffs)
+        self._version = snapshot.version
+        self._loaded_at = snapshot.fetched_at
+
+    async def load_snapshot(self) -> bool:
+        if self.snapshots is None:
+            return False
+        try:
+            snapshot = await self.snapshots.load()
+        except Exception as e:
+            logger.warning(f"Failed to load tariff snapshot: {e}")
+            return False
+        if not snapshot or not snapshot.tariffs:
+            return False
+        self._install(snapshot)
+        self.snapshot_loads += 1
+        logger.info(
+            "Tariff snapshot %s loaded: %s tariffs, %.0fs old",
+            snapshot.version,
+            len(snapshot.tariffs),
+            time.time() - snapshot.fetched_at,
+        )
+        return True
+
+    async def _save_snapshot(self, snapshot: TariffSnapshot) -> None:
+        if self.snapshots is None:
+            return
+        try:
+            await self.snapshots.save(snapshot)
+            self.snapshot_saves += 1
+        except Exception as e:
+            logger.warning(f"Failed to persist tariff snapshot: {e}")
+
+    def next_delay(self, succeeded: bool) -> float:
+        base = self.refresh_seconds if succeeded else self.retry_seconds
+        # Spread refreshes so instances started together do not fetch in lockstep
+        return max(1.0, base * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def _run(self, first_delay: float) -> None:
+        await asyncio.sleep(first_delay)
+        while True:
+            succeeded = await self.refresh()
+            await asyncio.sleep(self.next_delay(succeeded))
+
+    async def start(self, warm_up_timeout: float) -> None:
+        if await self.load_snapshot():
+            # Serve the snapshot now; download only once it is due
+            age = time.time() - self._loaded_at
+            first_delay = max(0.0, self.refresh_seconds - age)
+        else:
+            succeeded = False
+            try:
+                succeeded = await asyncio.wait_for(self.refresh(), timeout=warm_up_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Tariff warm-up exceeded %.1fs; continuing in background", warm_up_timeout)
+            first_delay = self.next_delay(succeeded)
+        self._loop_task = asyncio.create_task(self._run(first_delay))
+
+    async def stop(self) -> None:
+        for task in (self._loop_task, self._refresh_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._loop_task = None
+        self._refresh_task = None
+
+    def stats(self) -> dict:
+        return {
+            **self._index.stats(),
+            "loaded": self.loaded,
+            "version": self._version,
+            "age_seconds": round(time.time() - self._loaded_at, 1) if self._loaded_at else None,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_duration_ms": round(self.last_duration_ms, 1),
+            "snapshot_loads": self.snapshot_loads,
+            "snapshot_saves": self.snapshot_saves,
+            "running": self._loop_task is not None and not self._loop_task.done(),
+        }
+
+
+tariff_store = TariffStore(
+    url=settings.TARIFF_RATES_URL,
+    refresh_seconds=settings.TARIFF_REFRESH_SECONDS,
+    jitter=settings.TARIFF_REFRESH_JITTER,
+    retry_seconds=settings.TARIFF_REFRESH_RETRY_SECONDS,
+    timeout_seconds=settings.TARIFF_HTTP_TIMEOUT_SECONDS,
+    snapshots=_snapshot_store_from_settings(),
+)
+metrics.register("tariffs", tariff_store.stats)
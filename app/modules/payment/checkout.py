@@ -0,0 +1,108 @@
+import json
+import time
+from dataclasses import dataclass
+from string import Template
+from typing import Optional
+
+from app.core.config import settings
+from app.common.cache import TTLCache
+from app.common.locks import KeyedLock
+from app.common.metrics import metrics
+from app.providers.epay.schemas import EpayTokenResponse
+
+_CHECKOUT_PAGE = Template(
+    """
+<!doctype html>
+<html>
+  <head>
+    <meta charset="utf-8" />
+    <meta name="viewport" content="width=device-width, initial-scale=1" />
+    <title>ePay Checkout</title>
+    <script src="$payment_page_js"></script>
+  </head>
+  <body>
+    <h3>Redirecting to ePay...</h3>
+    <p>payment_id: $payment_id</p>
+    <p>invoice_id: $invoice_id</p>
+    <script>
+      const auth = $auth_json;
+      const paymentObject = $payment_json;
+      paymentObject.auth = auth;
+      window.halyk.pay(paymentObject);
+    </script>
+  </body>
+</html>
+"""
+)
+
+
+def _script_json(value: dict) -> str:
+    # "</" would end the inline <script> early
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+
+
+def render_checkout_page(payment_id: str, invoice_id: str, auth: dict, payment: dict) -> str:
+    return _CHECKOUT_PAGE.substitute(
+        payment_page_js=settings.EPAY_PAYMENT_PAGE_JS,
+        payment_id=payment_id,
+        invoice_id=invoice_id,
+        auth_json=_script_json(auth),
+        payment_json=_script_json(payment),
+    )
+
+
+@dataclass
+class CheckoutSession:
+    token: EpayTokenResponse
+    expires_at: float
+    html: Optional[str] = None
+
+    @property
+    def auth(self) -> dict:
+        return {
+            "access_token": self.token.access_token,
+            "expires_in": self.token.expires_in,
+            "token_type": self.token.token_type,
+            "scope": self.token.scope,
+        }
+
+
+class PaymentTokenCache:
+    """Payment-scoped ePay tokens per payment_id, reused until shortly before they expire.
+
+    ``initiate_payment`` stores the token it obtained; the checkout page
+    reuses it (and the page rendered from it) on every open or reload
+    instead of requesting a new token from ePay. ``locks`` lets concurrent
+    reloads of one checkout share a single token request. Tokens stay in
+    process memory only: an instance that did not serve ``initiate``
+    requests its own token.
+    """
+
+    def __init__(self, max_entries: int, expiry_margin_seconds: float) -> None:
+        self.expiry_margin_seconds = expiry_margin_seconds
+        self._sessions: TTLCache[str, CheckoutSession] = TTLCache(max_entries, 3600)
+        self.locks = KeyedLock()
+
+    def session_for(self, token: EpayTokenResponse) -> CheckoutSession:
+        return CheckoutSession(token=token, expires_at=time.time() + float(token.expires_in))
+
+    def usable(self, session: Optional[CheckoutSession]) -> bool:
+        return session is not None and time.time() < session.expires_at - self.expiry_margin_seconds
+
+    def get(self, payment_id: str) -> Optional[CheckoutSession]:
+        session = self._sessions.get(payment_id)
+        return session if self.usable(session) else None
+
+    def put(self, payment_id: str, session: CheckoutSession) -> None:
+        ttl = session.expires_at - self.expiry_margin_seconds - time.time()
+        self._sessions.set(payment_id, session, ttl_seconds=ttl)
+
+    def stats(self) -> dict:
+        return self._sessions.stats()
+
+
+payment_token_cache = PaymentTokenCache(
+    max_entries=settings.EPAY_PAYMENT_TOKEN_CACHE_MAX_ENTRIES,
+    expiry_margin_seconds=settings.EPAY_PAYMENT_TOKEN_EXPIRY_MARGIN_SECONDS,
+)
+metrics.register("payment_tokens", payment_token_cache.stats)
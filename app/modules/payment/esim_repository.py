@@ -1,19 +1,13 @@
 from typing import Optional
 
-import anyio
-
+from app.infrastructure.documents import TrackedDocument
 from app.infrastructure.firestore import get_db
 
 
 class PaymentEsimRepository:
-    def __init__(self) -> None:
-        self._db = None
-
     @property
     def db(self):
-        if self._db is None:
-            self._db = get_db()
-        return self._db
+        return get_db()
 
     @property
     def collection(self):
@@ -21,24 +15,30 @@ class PaymentEsimRepository:
 
     async def get_user_esim(self, user_id: str, esim_id: str) -> Optional[dict]:
         doc_ref = self.collection.document(esim_id)
-        doc = await anyio.to_thread.run_sync(doc_ref.get)
+        doc = await doc_ref.get()
         if not doc.exists:
             return None
         data = doc.to_dict()
         if data.get("user_id") != user_id:
             return None
-        return data
+        return TrackedDocument(data)
 
     async def get_user_esim_by_imsi(self, user_id: str, imsi: str) -> Optional[dict]:
         query = self.collection.where("imsi", "==", imsi).limit(1)
-        docs = await anyio.to_thread.run_sync(query.get)
+        docs = await query.get()
         for doc in docs:
             data = doc.to_dict()
             if data.get("user_id") != user_id:
                 return None
-            return data
+            return TrackedDocument(data)
         return None
 
     async def update_esim(self, esim_data: dict) -> None:
         doc_ref = self.collection.document(esim_data["id"])
-        await anyio.to_thread.run_sync(doc_ref.set, esim_data)
+        if isinstance(esim_data, TrackedDocument) and esim_data.exists:
+            changes = esim_data.changes()
+            if changes:
+                await doc_ref.update(changes)
+                esim_data.mark_clean()
+            return
+        await doc_ref.set(dict(esim_data))
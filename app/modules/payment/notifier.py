@@ -0,0 +1,54 @@
+import asyncio
+from typing import Dict, Optional, Set
+
+from app.common.metrics import metrics
+
+
+class PaymentStatusNotifier:
+    """Wakes requests waiting on a payment when its record is written.
+
+    ``PaymentRepository.update_payment`` publishes every write, so webhook
+    processing, the pending reconciler and admin actions all notify without
+    knowing about waiters. Only waiters in this process are woken; callers
+    also re-read the record periodically to see updates made by other
+    instances.
+    """
+
+    def __init__(self) -> None:
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self.published = 0
+        self.woken = 0
+
+    def publish(self, payment_id: str, status: str) -> None:
+        self.published += 1
+        for waiter in self._waiters.pop(payment_id, set()):
+            if not waiter.done():
+                waiter.set_result(status)
+                self.woken += 1
+
+    async def wait(self, payment_id: str, timeout: float) -> Optional[str]:
+        """Status from the next write to this payment, or None after ``timeout`` seconds."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(payment_id, set()).add(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(payment_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    self._waiters.pop(payment_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "payments_watched": len(self._waiters),
+            "waiters": sum(len(waiters) for waiters in self._waiters.values()),
+            "published": self.published,
+            "woken": self.woken,
+        }
+
+
+payment_notifier = PaymentStatusNotifier()
+metrics.register("payment_status_waiters", payment_notifier.stats)
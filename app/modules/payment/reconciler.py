@@ -0,0 +1,161 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Set
+
+from app.core.config import settings
+from app.common.logging import logger
+from app.common.metrics import metrics
+from app.modules.payment.repository import PaymentRepository
+from app.modules.payment.schemas import PaymentRecord, PaymentStatus
+
+
+class PendingPaymentReconciler:
+    """Resolves payments stuck in PENDING past ``EPAY_PENDING_TTL_MINUTES``.
+
+    Every ``interval_seconds`` it lists stale pending entries from the
+    ``payment_records`` index and runs ``PaymentService.reconcile_pending_payment``
+    on them, at most ``concurrency`` at a time: sync with ePay, otherwise
+    mark failed and release the eSIM reservation. Read endpoints never do
+    this inline; they ``submit`` stale records they happen to see, which
+    also covers payments created before the index carried a status.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float,
+        concurrency: int,
+        batch_size: int,
+        repository: Optional[PaymentRepository] = None,
+    ) -> None:
+        self.interval_seconds = interval_seconds
+        self.concurrency = max(1, concurrency)
+        self.batch_size = batch_size
+        self.repository = repository or PaymentRepository()
+        self._service = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[str] = set()
+        self._background: Set[asyncio.Task] = set()
+
+        self.runs = 0
+        self.resolved = 0
+        self.expired = 0
+        self.errors = 0
+        self.last_run_ms = 0.0
+
+    @property
+    def service(self):
+        if self._service is None:
+            from app.core.container import container
+
+            return container.payment_service
+        return self._service
+
+    @staticmethod
+    def is_stale(record: PaymentRecord) -> bool:
+        if record.status != PaymentStatus.PENDING or not record.created_at:
+            return False
+        created_at = record.created_at
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        ttl = timedelta(minutes=max(1, int(settings.EPAY_PENDING_TTL_MINUTES)))
+        return datetime.now(timezone.utc) - created_at >= ttl
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self.interval_seconds > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        tasks = [task for task in (self._task, *self._background) if task is not None]
+        self._task = None
+        self._semaphore = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._background.clear()
+
+    @property
+    def running(self) -> bool:
+        return self._semaphore is not None
+
+    def submit(self, record: PaymentRecord) -> None:
+        """Reconcile a stale record seen by a read endpoint, without waiting on it."""
+        if not self.running or record.id in self._inflight:
+            return
+        task = asyncio.create_task(self._reconcile(record.user_id, record.id, self._semaphore))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    # ------------------------------------------------------------------
+    # Reconciliation
+    # ------------------------------------------------------------------
+
+    async def run_once(self) -> int:
+        started = time.perf_counter()
+        ttl = timedelta(minutes=max(1, int(settings.EPAY_PENDING_TTL_MINUTES)))
+        entries = await self.repository.list_stale_pending_payments(
+            datetime.now(timezone.utc) - ttl, limit=self.batch_size
+        )
+        semaphore = self._semaphore or asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(
+            *(self._reconcile(entry["user_id"], entry["payment_id"], semaphore) for entry in entries)
+        )
+        self.runs += 1
+        self.last_run_ms = (time.perf_counter() - started) * 1000
+        if entries:
+            logger.info("Pending reconciler checked %s payments in %.0f ms", len(entries), self.last_run_ms)
+        return len(entries)
+
+    async def _reconcile(self, user_id: str, payment_id: str, semaphore: asyncio.Semaphore) -> None:
+        if payment_id in self._inflight:
+            return
+        self._inflight.add(payment_id)
+        try:
+            async with semaphore:
+                record = await self.repository.get_payment(user_id, payment_id)
+                if record is None or not self.is_stale(record):
+                    return
+                record = await self.service.reconcile_pending_payment(record)
+                if record.reason == "expired_pending_timeout":
+                    self.expired += 1
+                else:
+                    self.resolved += 1
+        except Exception as exc:
+            self.errors += 1
+            logger.warning("Pending reconcile failed payment=%s: %s", payment_id, exc)
+        finally:
+            self._inflight.discard(payment_id)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as exc:
+                logger.error("Pending payment reconcile run failed: %s", exc)
+            await asyncio.sleep(self.interval_seconds * random.uniform(0.9, 1.1))
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "inflight": len(self._inflight),
+            "runs": self.runs,
+            "resolved": self.resolved,
+            "expired": self.expired,
+            "errors": self.errors,
+            "last_run_ms": round(self.last_run_ms, 1),
+        }
+
+
+pending_reconciler = PendingPaymentReconciler(
+    interval_seconds=settings.PAYMENT_RECONCILE_INTERVAL_SECONDS,
+    concurrency=settings.PAYMENT_RECONCILE_CONCURRENCY,
+    batch_size=settings.PAYMENT_RECONCILE_BATCH_SIZE,
+)
+metrics.register("pending_reconciler", pending_reconciler.stats)
@@ -1,7 +1,10 @@
+from datetime import datetime, timezone
 from typing import List, Optional
-import anyio
+
+from google.api_core.exceptions import FailedPrecondition
 
 from app.infrastructure.firestore import get_db
+from app.modules.payment.notifier import payment_notifier
 from app.modules.payment.schemas import PaymentRecord, PaymentStatus
 from app.common.logging import logger
 
@@ -12,14 +15,9 @@ class PaymentRepository:
     Collection path: ``users/{user_id}/payments/{payment_id}``
     """
 
-    def __init__(self) -> None:
-        self._db = None
-
     @property
     def db(self):
-        if self._db is None:
-            self._db = get_db()
-        return self._db
+        return get_db()
 
     # ------------------------------------------------------------------
     # Helpers
@@ -34,18 +32,23 @@ class PaymentRepository:
 
     async def create_payment(self, record: PaymentRecord) -> PaymentRecord:
         ref = self._payments_ref(record.user_id).document(record.id)
-        await anyio.to_thread.run_sync(ref.set, record.dict())
+        await ref.set(record.dict())
         index_ref = self.db.collection("payment_records").document(record.id)
-        await anyio.to_thread.run_sync(
-            index_ref.set,
-            {"payment_id": record.id, "user_id": record.user_id, "invoice_id": record.invoice_id},
+        await index_ref.set(
+            {
+                "payment_id": record.id,
+                "user_id": record.user_id,
+                "invoice_id": record.invoice_id,
+                "status": PaymentStatus(record.status).value,
+                "created_at": record.created_at,
+            },
         )
         logger.info("Payment record created: %s (user=%s)", record.id, record.user_id)
         return record
 
     async def get_payment(self, user_id: str, payment_id: str) -> Optional[PaymentRecord]:
         ref = self._payments_ref(user_id).document(payment_id)
-        doc = await anyio.to_thread.run_sync(ref.get)
+        doc = await ref.get()
         if doc.exists:
             return PaymentRecord(**doc.to_dict())
         return None
@@ -57,7 +60,7 @@ class PaymentRepository:
             .where("invoice_id", "==", invoice_id)
             .limit(1)
         )
-        docs = await anyio.to_thread.run_sync(ref.get)
+        docs = await ref.get()
         for doc in docs:
             return PaymentRecord(**doc.to_dict())
         return None
@@ -70,7 +73,7 @@ class PaymentRepository:
         ``payment_invoices/{invoice_id}`` mapping document.
         """
         ref = self.db.collection("payment_invoices").document(invoice_id)
-        doc = await anyio.to_thread.run_sync(ref.get)
+        doc = await ref.get()
         if not doc.exists:
             return None
         mapping = doc.to_dict()
@@ -81,11 +84,27 @@ class PaymentRepository:
         return await self.get_payment(user_id, payment_id)
 
     async def update_payment(self, record: PaymentRecord) -> PaymentRecord:
-        from datetime import datetime
-
         record.updated_at = datetime.utcnow()
-        ref = self._payments_ref(record.user_id).document(record.id)
-        await anyio.to_thread.run_sync(lambda: ref.set(record.dict(), merge=True))
+        status = PaymentStatus(record.status)
+        batch = self.db.batch()
+        batch.set(self._payments_ref(record.user_id).document(record.id), record.dict(), merge=True)
+        # Keep the status on the top-level index current for the pending reconciler
+        batch.set(
+            self.db.collection("payment_records").document(record.id),
+            {
+                "payment_id": record.id,
+                "user_id": record.user_id,
+                "invoice_id": record.invoice_id,
+                "status": status.value,
+                "created_at": record.created_at,
+            },
+            merge=True,
+        )
+        if record.card_id and status in (PaymentStatus.AUTH, PaymentStatus.CHARGE):
+            # Committed with the payment so the card projection never misses a success
+            batch.set(self._user_cards_ref(record.user_id), self._card_projection([record]), merge=True)
+        await batch.commit()
+        payment_notifier.publish(record.id, status.value)
         logger.info("Payment record updated: %s status=%s", record.id, record.status)
         return record
 
@@ -95,24 +114,95 @@ class PaymentRepository:
             .order_by("created_at", direction="DESCENDING")
             .limit(limit)
         )
-        docs = await anyio.to_thread.run_sync(ref.get)
+        docs = await ref.get()
         return [PaymentRecord(**doc.to_dict()) for doc in docs]
 
+    async def list_stale_pending_payments(self, created_before: datetime, limit: int = 100) -> List[dict]:
+        """Index entries (``payment_records``) of payments still pending since before ``created_before``.
+
+        Filters the age in Python so the query needs no composite index;
+        pending payments are few and short-lived.
+        """
+        query = self.db.collection("payment_records").where("status", "==", PaymentStatus.PENDING.value).limit(limit)
+        docs = await query.get()
+        stale = []
+        for doc in docs:
+            entry = doc.to_dict() or {}
+            created_at = entry.get("created_at")
+            if not created_at or not entry.get("user_id"):
+                continue
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            if created_at < created_before:
+                stale.append(entry)
+        return stale
+
+    # ------------------------------------------------------------------
+    # Card projection (``user_cards/{user_id}``)
+    # ------------------------------------------------------------------
+
+    def _user_cards_ref(self, user_id: str):
+        return self.db.collection("user_cards").document(user_id)
+
+    @staticmethod
+    def _card_projection(records: List[PaymentRecord]) -> dict:
+        cards = {}
+        for record in records:
+            last_success_at = record.updated_at or record.created_at
+            current = cards.get(record.card_id)
+            if current is not None and current["last_success_at"] >= last_success_at:
+                continue
+            cards[record.card_id] = {
+                "card_id": record.card_id,
+                "card_mask": record.card_mask or "",
+                "card_type": record.card_type,
+                "last_success_at": last_success_at,
+            }
+        return {"cards": cards}
+
+    async def list_known_cards(self, user_id: str) -> List[dict]:
+        """Cards used in successful payments, most recently used first.
+
+        One document read. Users whose projection does not exist yet are
+        backfilled from their payment history on first use.
+        """
+        doc = await self._user_cards_ref(user_id).get()
+        if doc.exists:
+            cards = list(((doc.to_dict() or {}).get("cards") or {}).values())
+        else:
+            records = [
+                record
+                for record in await self.list_payments(user_id, limit=200)
+                if record.card_id and record.status in (PaymentStatus.AUTH, PaymentStatus.CHARGE)
+            ]
+            projection = self._card_projection(records)
+            # merge: never overwrite a success recorded while we were scanning
+            await self._user_cards_ref(user_id).set(projection, merge=True)
+            cards = list(projection["cards"].values())
+
+        def _ts(card: dict) -> float:
+            value = card.get("last_success_at")
+            if value is None:
+                return 0.0
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            return value.timestamp()
+
+        return sorted(cards, key=_ts, reverse=True)
+
     # ------------------------------------------------------------------
     # Invoice → user mapping (for webhook resolution)
     # ------------------------------------------------------------------
 
     async def create_invoice_mapping(self, invoice_id: str, user_id: str, payment_id: str) -> None:
         ref = self.db.collection("payment_invoices").document(invoice_id)
-        await anyio.to_thread.run_sync(
-            ref.set,
+        await ref.set(
             {"user_id": user_id, "payment_id": payment_id, "invoice_id": invoice_id},
         )
 
     async def create_checkout_mapping(self, payment_id: str, user_id: str, checkout_token: str) -> None:
         ref = self.db.collection("payment_checkout").document(payment_id)
-        await anyio.to_thread.run_sync(
-            ref.set,
+        await ref.set(
             {
                 "payment_id": payment_id,
                 "user_id": user_id,
@@ -122,7 +212,7 @@ class PaymentRepository:
 
     async def resolve_checkout_payment(self, payment_id: str, checkout_token: str) -> Optional[PaymentRecord]:
         ref = self.db.collection("payment_checkout").document(payment_id)
-        doc = await anyio.to_thread.run_sync(ref.get)
+        doc = await ref.get()
         if not doc.exists:
             return None
         mapping = doc.to_dict()
@@ -135,10 +225,70 @@ class PaymentRepository:
 
     async def get_payment_any_user(self, payment_id: str) -> Optional[PaymentRecord]:
         index_ref = self.db.collection("payment_records").document(payment_id)
-        index_doc = await anyio.to_thread.run_sync(index_ref.get)
+        index_doc = await index_ref.get()
         if not index_doc.exists:
             return None
         user_id = index_doc.to_dict().get("user_id")
         if not user_id:
             return None
         return await self.get_payment(user_id, payment_id)
+
+    # ------------------------------------------------------------------
+    # Webhook inbox (``webhook_inbox/{item_id}``)
+    # ------------------------------------------------------------------
+
+    @property
+    def webhook_inbox(self):
+        return self.db.collection("webhook_inbox")
+
+    async def add_webhook(self, item_id: str, item: dict) -> None:
+        await self.webhook_inbox.document(item_id).set(item)
+
+    async def claim_webhook(self, item_id: str, now_ts: float, lease_seconds: float) -> Optional[dict]:
+        """Mark a due inbox item as processing; None if it is not due, gone or claimed elsewhere."""
+        ref = self.webhook_inbox.document(item_id)
+        doc = await ref.get()
+        if not doc.exists:
+            return None
+        item = doc.to_dict() or {}
+        status = item.get("status")
+        if status == "dead":
+            return None
+        if status == "processing" and float(item.get("locked_until", 0) or 0) > now_ts:
+            return None
+        if status == "pending" and float(item.get("next_attempt_at", 0) or 0) > now_ts:
+            return None
+
+        item["status"] = "processing"
+        item["locked_until"] = now_ts + lease_seconds
+        item["attempts"] = int(item.get("attempts", 0) or 0) + 1
+        try:
+            await ref.update(
+                {"status": item["status"], "locked_until": item["locked_until"], "attempts": item["attempts"]},
+                option=self.db.write_option(last_update_time=doc.update_time),
+            )
+        except FailedPrecondition:
+            return None
+        return item
+
+    async def update_webhook(self, item_id: str, fields: dict) -> None:
+        await self.webhook_inbox.document(item_id).update(fields)
+
+    async def delete_webhook(self, item_id: str) -> None:
+        await self.webhook_inbox.document(item_id).delete()
+
+    async def list_due_webhooks(self, now_ts: float, limit: int = 200) -> List[dict]:
+        """Pending or abandoned inbox items, oldest delivery first."""
+        query = self.webhook_inbox.where("status", "in", ["pending", "processing"]).limit(limit)
+        docs = await query.get()
+        due = []
+        for doc in docs:
+            item = doc.to_dict() or {}
+            if item.get("status") == "processing":
+                if float(item.get("locked_until", 0) or 0) > now_ts:
+                    continue
+            elif float(item.get("next_attempt_at", 0) or 0) > now_ts:
+                continue
+            due.append({**item, "id": doc.id})
+        due.sort(key=lambda item: float(item.get("received_at", 0) or 0))
+        return due
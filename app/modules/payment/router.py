@@ -1,10 +1,10 @@
 from fastapi import APIRouter, Depends, Request, Query
 from typing import List, Optional
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 import json
 
-from app.core.dependencies import require_app_permission, require_admin_api_key
-from app.modules.users.schemas import User
+from app.core.config import settings
+from app.core.dependencies import AuthClaims, require_app_claims, require_admin_api_key
 from app.modules.payment.schemas import (
     InitiatePaymentRequest,
     InitiatePaymentResponse,
@@ -16,16 +16,14 @@ from app.modules.payment.schemas import (
     ChargeRequest,
 )
 from app.modules.payment.service import PaymentService
+from app.modules.payment.webhooks import webhook_inbox
+from app.core.container import get_payment_service
 from app.common.responses import DataResponse
 from app.common.logging import logger
 
 router = APIRouter()
 
 
-def _get_service() -> PaymentService:
-    return PaymentService()
-
-
 # ======================================================================
 # User-facing endpoints (require vink app permission)
 # ======================================================================
@@ -37,10 +35,10 @@ def _get_service() -> PaymentService:
 )
 async def initiate_payment(
     req: InitiatePaymentRequest,
-    current_user: User = Depends(require_app_permission("vink")),
-    service: PaymentService = Depends(_get_service),
+    claims: AuthClaims = Depends(require_app_claims("vink")),
+    service: PaymentService = Depends(get_payment_service),
 ):
-    result = await service.initiate_payment(current_user.id, req)
+    result = await service.initiate_payment(claims.user_id, req)
     return DataResponse(data=result, message="Payment session created")
 
 
@@ -53,7 +51,7 @@ async def initiate_payment(
 async def payment_checkout_page(
     payment_id: str,
     token: str,
-    service: PaymentService = Depends(_get_service),
+    service: PaymentService = Depends(get_payment_service),
 ):
     html = await service.get_checkout_html(payment_id, token)
     return HTMLResponse(content=html, status_code=200)
@@ -66,10 +64,10 @@ async def payment_checkout_page(
 )
 async def recurrent_payment(
     req: RecurrentPaymentRequest,
-    current_user: User = Depends(require_app_permission("vink")),
-    service: PaymentService = Depends(_get_service),
+    claims: AuthClaims = Depends(require_app_claims("vink")),
+    service: PaymentService = Depends(get_payment_service),
 ):
-    result = await service.pay_with_saved_card(current_user.id, req)
+    result = await service.pay_with_saved_card(claims.user_id, req)
     return DataResponse(data=result, message="Recurrent payment processed")
 
 
@@ -79,10 +77,10 @@ async def recurrent_payment(
     summary="List saved cards for current user",
 )
 async def get_saved_cards(
-    current_user: User = Depends(require_app_permission("vink")),
-    service: PaymentService = Depends(_get_service),
+    claims: AuthClaims = Depends(require_app_claims("vink")),
+    service: PaymentService = Depends(get_payment_service),
 ):
-    result = await service.get_saved_cards(current_user.id)
+    result = await service.get_saved_cards(claims.user_id)
     return DataResponse(data=result)
 
 
@@ -92,10 +90,10 @@ async def get_saved_cards(
 )
 async def deactivate_card(
     card_id: str,
-    current_user: User = Depends(require_app_permission("vink")),
-    service: PaymentService = Depends(_get_service),
+    claims: AuthClaims = Depends(require_app_claims("vink")),
+    service: PaymentService = Depends(get_payment_service),
 ):
-    await service.deactivate_card(current_user.id, card_id)
+    await service.deactivate_card(claims.user_id, card_id)
     return DataResponse(message="Card deactivated")
 
 
@@ -106,10 +104,10 @@ async def deactivate_card(
 )
 async def cancel_payment(
     payment_id: str,
-    current_user: User = Depends(require_app_permission("vink")),
-    service: PaymentService = Depends(_get_service),
+    claims: AuthClaims = Depends(require_app_claims("vink")),
+    service: PaymentService = Depends(get_payment_service),
 ):
-    record = await service.cancel_payment(current_user.id, payment_id)
+    record = await service.cancel_payment(claims.user_id, payment_id)
     return DataResponse(
         data=PaymentStatusOut(
             payment_id=record.id,
@@ -130,10 +128,10 @@ async def cancel_payment(
     summary="List payment history for current user",
 )
 async def list_payments(
-    current_user: User = Depends(require_app_permission("vink")),
-    service: PaymentService = Depends(_get_service),
+    claims: AuthClaims = Depends(require_app_claims("vink")),
+    service: PaymentService = Depends(get_payment_service),
 ):
-    result = await service.list_payments(current_user.id)
+    result = await service.list_payments(claims.user_id)
     return DataResponse(data=result)
 
 
@@ -144,14 +142,57 @@ async def list_payments(
 )
 async def get_payment_status(
     payment_id: str,
-    sync: bool = Query(True, description="If true, reconcile pending status with ePay before response"),
-    current_user: User = Depends(require_app_permission("vink")),
-    service: PaymentService = Depends(_get_service),
+    sync: bool = Query(False, description="If true, reconcile pending status with ePay before response"),
+    claims: AuthClaims = Depends(require_app_claims("vink")),
+    service: PaymentService = Depends(get_payment_service),
 ):
-    result = await service.get_payment_status(current_user.id, payment_id, sync_with_epay=sync)
+    result = await service.get_payment_status(claims.user_id, payment_id, sync_with_epay=sync)
     return DataResponse(data=result)
 
 
+@router.get(
+    "/payments/status/{payment_id}/wait",
+    response_model=DataResponse[PaymentStatusOut],
+    summary="Long-poll until a payment leaves pending",
+)
+async def wait_payment_status(
+    payment_id: str,
+    timeout: float = Query(
+        settings.PAYMENT_STATUS_WAIT_SECONDS,
+        gt=0,
+        le=settings.PAYMENT_STATUS_MAX_WAIT_SECONDS,
+        description="Seconds to wait; the current (possibly pending) status is returned when it elapses",
+    ),
+    claims: AuthClaims = Depends(require_app_claims("vink")),
+    service: PaymentService = Depends(get_payment_service),
+):
+    result = await service.wait_for_payment_status(claims.user_id, payment_id, timeout)
+    return DataResponse(data=result)
+
+
+@router.get(
+    "/payments/status/{payment_id}/events",
+    summary="Server-Sent Events stream of a payment's status",
+)
+async def payment_status_events(
+    payment_id: str,
+    timeout: float = Query(
+        settings.PAYMENT_STATUS_WAIT_SECONDS,
+        gt=0,
+        le=settings.PAYMENT_STATUS_MAX_WAIT_SECONDS,
+        description="Seconds to keep the stream open while the payment is pending",
+    ),
+    claims: AuthClaims = Depends(require_app_claims("vink")),
+    service: PaymentService = Depends(get_payment_service),
+):
+    events = await service.stream_payment_status(claims.user_id, payment_id, timeout)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ======================================================================
 # Webhook (public — called by ePay servers, no auth)
 # ======================================================================
@@ -161,11 +202,13 @@ async def get_payment_status(
     summary="ePay postLink / failurePostLink callback",
     include_in_schema=False,
 )
-async def epay_webhook(request: Request, service: PaymentService = Depends(_get_service)):
+async def epay_webhook(request: Request, service: PaymentService = Depends(get_payment_service)):
     """Receive ePay webhook notifications.
 
     This endpoint is called by ePay's servers on payment success or failure.
-    It accepts both JSON and form-encoded bodies.
+    It accepts both JSON and form-encoded bodies. The body is stored in the
+    webhook inbox and processed by background workers, so the ACK does not
+    wait on ePay or the eSIM provider.
     """
     content_type = request.headers.get("content-type", "")
     logger.info(
@@ -200,7 +243,12 @@ async def epay_webhook(request: Request, service: PaymentService = Depends(_get_
             body.get("code"),
             body.get("reasonCode"),
         )
-        await service.handle_webhook_raw(body)
+        try:
+            await webhook_inbox.accept(body)
+        except Exception as exc:
+            # Inbox unavailable: do not drop the callback, process it inline
+            logger.warning("Webhook inbox write failed, processing inline: %s", exc)
+            await service.handle_webhook_raw(body)
     except Exception as exc:
         logger.exception("Webhook processing failed: %s", exc)
         # Keep HTTP 200 ACK contract for provider callbacks
@@ -222,7 +270,7 @@ async def admin_charge_payment(
     payment_id: str,
     body: Optional[ChargeRequest] = None,
     _admin: dict = Depends(require_admin_api_key),
-    service: PaymentService = Depends(_get_service),
+    service: PaymentService = Depends(get_payment_service),
 ):
     record = await service.charge_payment(payment_id, body.amount if body else None)
     return DataResponse(data=record.dict(), message="Payment charged")
@@ -236,7 +284,7 @@ async def admin_refund_payment(
     payment_id: str,
     body: Optional[RefundRequest] = None,
     _admin: dict = Depends(require_admin_api_key),
-    service: PaymentService = Depends(_get_service),
+    service: PaymentService = Depends(get_payment_service),
 ):
     record = await service.refund_payment(payment_id, body.amount if body else None)
     return DataResponse(data=record.dict(), message="Payment refunded")
@@ -249,7 +297,7 @@ async def admin_refund_payment(
 async def admin_verify_payment(
     invoice_id: str,
     _admin: dict = Depends(require_admin_api_key),
-    service: PaymentService = Depends(_get_service),
+    service: PaymentService = Depends(get_payment_service),
 ):
     result = await service.verify_payment_from_epay(invoice_id)
     return DataResponse(data=result, message="Status retrieved from ePay")
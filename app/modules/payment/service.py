@@ -1,16 +1,18 @@
 import uuid
 import secrets
 import asyncio
-from datetime import timezone
 from datetime import datetime
-from typing import List, Optional
-import json
+from typing import AsyncIterator, List, Optional
 
 from app.core.config import settings
 from app.common.logging import logger
 from app.common.exceptions import BadRequestError, NotFoundError, AppError
 from app.modules.payment.repository import PaymentRepository
+from app.modules.payment.checkout import CheckoutSession, payment_token_cache, render_checkout_page
 from app.modules.payment.esim_repository import PaymentEsimRepository
+from app.modules.payment.notifier import payment_notifier
+from app.modules.payment.reconciler import PendingPaymentReconciler, pending_reconciler
+from app.modules.payment.webhooks import webhook_guard
 from app.modules.payment.schemas import (
     PaymentRecord,
     PaymentStatus,
@@ -30,20 +32,31 @@ from app.providers.esim_provider.client import EsimProviderClient
 from app.providers.epay.schemas import (
     EpayPostlinkPayload,
     EpayCardIdPaymentRequest,
+    EpaySavedCard,
 )
 
+# Outcomes confirmed by ePay; a FAILED result may just mean the check-status
+# call was inconclusive, so its redeliveries are processed again
+_SETTLED_STATUSES = (PaymentStatus.AUTH, PaymentStatus.CHARGE, PaymentStatus.REFUND, PaymentStatus.CANCEL)
+
 
 class PaymentService:
     """Orchestrates ePay payment flows."""
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        esim_service: Optional[EsimService] = None,
+        wallet_service: Optional[WalletService] = None,
+        epay: Optional[EpayClient] = None,
+        esim_provider: Optional[EsimProviderClient] = None,
+    ) -> None:
         self.repo = PaymentRepository()
         self.esim_repo = PaymentEsimRepository()
         self.user_repo = UserRepository()
-        self.esim_service = EsimService()
-        self.wallet_service = WalletService()
-        self.epay = EpayClient()
-        self.esim_provider = EsimProviderClient()
+        self.epay = epay or EpayClient()
+        self.esim_provider = esim_provider or EsimProviderClient()
+        self.esim_service = esim_service or EsimService(provider=self.esim_provider, epay=self.epay)
+        self.wallet_service = wallet_service or WalletService()
 
     # ------------------------------------------------------------------
     # 1. One-time payment initiation
@@ -116,6 +129,7 @@ class PaymentService:
             target_imsi=target_esim.get("imsi") if target_esim else None,
             reserved_esim_imsi=reserved_esim.get("imsi") if reserved_esim else None,
         )
+        checkout_session = payment_token_cache.session_for(token_resp)
         try:
             await self.repo.create_payment(record)
             await self.repo.create_invoice_mapping(invoice_id, user_id, payment_id)
@@ -124,6 +138,7 @@ class PaymentService:
             if payment_type == PaymentType.PURCHASE:
                 await self.esim_service.release_reserved_esim(payment_id)
             raise
+        payment_token_cache.put(payment_id, checkout_session)
 
         checkout_url = self._url_join(
             settings.EPAY_CHECKOUT_BASE_URL,
@@ -164,26 +179,30 @@ class PaymentService:
         if not record.back_link:
             raise BadRequestError("Payment back_link is missing")
 
-        payment_token = await self.epay.obtain_payment_token(
+        async with payment_token_cache.locks.hold(payment_id):
+            # Only this instance's copy is reused; the token is never persisted
+            session = payment_token_cache.get(payment_id)
+            if session is None:
+                payment_token = await self.epay.obtain_payment_token(
+                    invoice_id=record.invoice_id,
+                    amount=record.amount,
+                    currency=record.currency,
+                    post_link=self._url_join(settings.EPAY_POSTLINK_BASE_URL, "/api/v1/payments/webhook"),
+                    failure_post_link=self._url_join(settings.EPAY_POSTLINK_BASE_URL, "/api/v1/payments/webhook"),
+                    secret_hash=record.secret_hash,
+                )
+                session = payment_token_cache.session_for(payment_token)
+            if session.html is None:
+                session.html = self._render_checkout(record, session)
+            payment_token_cache.put(payment_id, session)
+        return session.html
+
+    def _render_checkout(self, record: PaymentRecord, session: CheckoutSession) -> str:
+        return render_checkout_page(
+            payment_id=record.id,
             invoice_id=record.invoice_id,
-            amount=record.amount,
-            currency=record.currency,
-            post_link=self._url_join(settings.EPAY_POSTLINK_BASE_URL, "/api/v1/payments/webhook"),
-            failure_post_link=self._url_join(settings.EPAY_POSTLINK_BASE_URL, "/api/v1/payments/webhook"),
-            secret_hash=record.secret_hash,
-        )
-
-        auth_json = json.dumps(
-            {
-                "access_token": payment_token.access_token,
-                "expires_in": payment_token.expires_in,
-                "token_type": payment_token.token_type,
-                "scope": payment_token.scope,
-            },
-            ensure_ascii=False,
-        )
-        payment_json = json.dumps(
-            {
+            auth=session.auth,
+            payment={
                 "invoiceId": record.invoice_id,
                 "invoiceIdAlt": record.invoice_id,
                 "backLink": record.back_link,
@@ -198,32 +217,8 @@ class PaymentService:
                 "currency": record.currency,
                 "cardSave": bool(record.save_card_requested),
             },
-            ensure_ascii=False,
         )
 
-        return f"""
-<!doctype html>
-<html>
-  <head>
-    <meta charset=\"utf-8\" />
-    <meta name=\"viewport\" content=\"width=device-width, initial-scale=1\" />
-    <title>ePay Checkout</title>
-    <script src=\"{settings.EPAY_PAYMENT_PAGE_JS}\"></script>
-  </head>
-  <body>
-    <h3>Redirecting to ePay...</h3>
-    <p>payment_id: {record.id}</p>
-    <p>invoice_id: {record.invoice_id}</p>
-    <script>
-      const auth = {auth_json};
-      const paymentObject = {payment_json};
-      paymentObject.auth = auth;
-            window.halyk.pay(paymentObject);
-    </script>
-  </body>
-</html>
-"""
-
     # ------------------------------------------------------------------
     # 2. Recurrent payment (server-to-server using saved card)
     # ------------------------------------------------------------------
@@ -372,6 +367,9 @@ class PaymentService:
         1. Locate internal payment record via invoice_id.
         2. Verify the transaction status with ePay ``check-status`` API.
         3. Update internal record and adjust user balance on success.
+
+        Deliveries for one invoice are serialised and redeliveries of an
+        already processed (invoice, code) pair are skipped (``webhook_guard``).
         """
         logger.info(
             "Webhook received: invoice=%s code=%s reason=%s",
@@ -380,10 +378,34 @@ class PaymentService:
             payload.reason,
         )
 
+        if self._webhook_duplicate(payload):
+            return
+        async with webhook_guard.hold(payload.invoiceId):
+            # A concurrent duplicate may have finished while we waited
+            if self._webhook_duplicate(payload):
+                return
+            status = await self._process_webhook(payload)
+            if status in _SETTLED_STATUSES:
+                webhook_guard.remember(payload.invoiceId, payload.code, status.value)
+
+    def _webhook_duplicate(self, payload: EpayPostlinkPayload) -> bool:
+        status = webhook_guard.processed_status(payload.invoiceId, payload.code)
+        if status is None:
+            return False
+        logger.info(
+            "Webhook duplicate skipped: invoice=%s code=%s already %s",
+            payload.invoiceId,
+            payload.code,
+            status,
+        )
+        return True
+
+    async def _process_webhook(self, payload: EpayPostlinkPayload) -> Optional[PaymentStatus]:
+        """Apply one callback; returns the final status, or None if a redelivery should be processed again."""
         record = await self.repo.find_payment_by_invoice(payload.invoiceId)
         if not record:
             logger.error("Webhook: no payment record for invoice=%s", payload.invoiceId)
-            return
+            return None
 
         previous_status = record.status
 
@@ -412,6 +434,7 @@ class PaymentService:
                 record.status = PaymentStatus.CHARGE
                 if record.save_card_requested and payload.cardId:
                     await self.user_repo.update_user(record.user_id, {"default_card_id": payload.cardId})
+                self._remember_saved_card(record)
                 try:
                     await self._apply_success_effect(record, previous_status=previous_status)
                 except Exception as exc:
@@ -426,7 +449,7 @@ class PaymentService:
                 record.reason_code = -31
 
             await self.repo.update_payment(record)
-            return
+            return record.status if record.status != PaymentStatus.PENDING else None
 
         if status_resp.resultCode == "100" and status_resp.transaction:
             txn = status_resp.transaction
@@ -445,6 +468,7 @@ class PaymentService:
 
             if epay_status in ("AUTH", "CHARGE"):
                 record.status = PaymentStatus.AUTH if epay_status == "AUTH" else PaymentStatus.CHARGE
+                self._remember_saved_card(record)
 
                 # Credit user balance for one-time / recurrent payments
                 try:
@@ -477,6 +501,7 @@ class PaymentService:
 
         await self.repo.update_payment(record)
         logger.info("Webhook processed: payment=%s → %s", record.id, record.status)
+        return record.status
 
     # ------------------------------------------------------------------
     # 5. Saved card management
@@ -485,30 +510,32 @@ class PaymentService:
     async def get_saved_cards(self, user_id: str) -> List[SavedCardOut]:
         try:
             epay_cards = await self._call_epay_with_deadline(
-                self.epay.get_saved_cards(user_id),
+                self.epay.list_saved_cards(user_id),
                 operation=f"saved-cards account={user_id}",
             )
-            return [
-                SavedCardOut(
-                    id=c.ID,
-                    card_mask=c.CardMask or "",
-                    card_type=None,
-                    payer_name=c.PayerName,
-                    created_date=c.CreatedDate,
-                )
-                for c in epay_cards
-            ]
         except AppError as exc:
             logger.warning(
                 "Saved-cards fallback to local cache user=%s error=%s",
                 user_id,
                 exc.detail.get("message") if isinstance(exc.detail, dict) else str(exc),
             )
-            return await self._get_local_saved_cards_fallback(user_id)
+            epay_cards = self.epay.peek_saved_cards(user_id)
+            if epay_cards is None:
+                return await self._get_local_saved_cards_fallback(user_id)
+        return [
+            SavedCardOut(
+                id=c.ID,
+                card_mask=c.CardMask or "",
+                card_type=None,
+                payer_name=c.PayerName,
+                created_date=c.CreatedDate,
+            )
+            for c in epay_cards
+        ]
 
     async def deactivate_card(self, user_id: str, card_id: str) -> dict:
         return await self._call_epay_with_deadline(
-            self.epay.deactivate_card(card_id),
+            self.epay.deactivate_card(card_id, account_id=user_id),
             operation=f"deactivate-card id={card_id}",
         )
 
@@ -559,16 +586,76 @@ class PaymentService:
         await self.repo.update_payment(record)
         return record
 
-    async def get_payment_status(self, user_id: str, payment_id: str, sync_with_epay: bool = True) -> PaymentStatusOut:
+    async def get_payment_status(self, user_id: str, payment_id: str, sync_with_epay: bool = False) -> PaymentStatusOut:
         record = await self.repo.get_payment(user_id, payment_id)
         if not record:
             raise NotFoundError("Payment not found")
 
-        record = await self._expire_stale_pending_payment(record)
-
         if sync_with_epay and record.status == PaymentStatus.PENDING:
             record = await self._sync_payment_status_from_epay(record)
+        elif PendingPaymentReconciler.is_stale(record):
+            pending_reconciler.submit(record)
+
+        return self._status_out(record)
+
+    async def wait_for_payment_status(self, user_id: str, payment_id: str, timeout_seconds: float) -> PaymentStatusOut:
+        """Long poll: return once the payment leaves PENDING, or its current status after ``timeout_seconds``."""
+        record = None
+        async for record in self._watch_payment(user_id, payment_id, timeout_seconds):
+            pass
+        return self._status_out(record)
+
+    async def stream_payment_status(
+        self, user_id: str, payment_id: str, timeout_seconds: float
+    ) -> AsyncIterator[str]:
+        """Server-Sent Events: a ``status`` event now and on every change, until final or timed out."""
+        record = await self._load_payment(user_id, payment_id)
+
+        async def events() -> AsyncIterator[str]:
+            last_status = None
+            async for current in self._watch_payment(user_id, payment_id, timeout_seconds, first=record):
+                if current.status == last_status:
+                    # Keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                last_status = current.status
+                yield f"event: status\ndata: {self._status_out(current).model_dump_json()}\n\n"
+
+        return events()
+
+    async def _load_payment(self, user_id: str, payment_id: str) -> PaymentRecord:
+        record = await self.repo.get_payment(user_id, payment_id)
+        if not record:
+            raise NotFoundError("Payment not found")
+        return record
 
+    async def _watch_payment(
+        self,
+        user_id: str,
+        payment_id: str,
+        timeout_seconds: float,
+        first: Optional[PaymentRecord] = None,
+    ) -> AsyncIterator[PaymentRecord]:
+        """Yield the record now and after every wake-up while it is PENDING.
+
+        Wakes on ``payment_notifier`` (writes in this process) or every
+        ``PAYMENT_STATUS_RECHECK_SECONDS`` to pick up writes made by other
+        instances. Never calls ePay.
+        """
+        record = first or await self._load_payment(user_id, payment_id)
+        yield record
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout_seconds
+        while record.status == PaymentStatus.PENDING:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            await payment_notifier.wait(payment_id, min(remaining, settings.PAYMENT_STATUS_RECHECK_SECONDS))
+            record = await self.repo.get_payment(user_id, payment_id) or record
+            yield record
+
+    @staticmethod
+    def _status_out(record: PaymentRecord) -> PaymentStatusOut:
         return PaymentStatusOut(
             payment_id=record.id,
             invoice_id=record.invoice_id,
@@ -581,9 +668,10 @@ class PaymentService:
 
     async def list_payments(self, user_id: str) -> List[PaymentStatusOut]:
         records = await self.repo.list_payments(user_id)
-        normalized_records: List[PaymentRecord] = []
         for record in records:
-            normalized_records.append(await self._expire_stale_pending_payment(record))
+            # Resolved in the background; this request stays a plain read
+            if PendingPaymentReconciler.is_stale(record):
+                pending_reconciler.submit(record)
         return [
             PaymentStatusOut(
                 payment_id=r.id,
@@ -594,7 +682,7 @@ class PaymentService:
                 card_mask=r.card_mask,
                 created_at=r.created_at,
             )
-            for r in normalized_records
+            for r in records
         ]
 
     async def verify_payment_from_epay(self, invoice_id: str) -> dict:
@@ -721,6 +809,14 @@ class PaymentService:
         await self.esim_service.purchase_reserved_esim(user, record.id)
 
     async def _sync_payment_status_from_epay(self, record: PaymentRecord) -> PaymentRecord:
+        busy = webhook_guard.locks.locked(record.invoice_id)
+        async with webhook_guard.hold(record.invoice_id):
+            if busy:
+                # A webhook for this invoice was running; sync from what it wrote
+                record = await self.repo.get_payment(record.user_id, record.id) or record
+            return await self._sync_payment_status_locked(record)
+
+    async def _sync_payment_status_locked(self, record: PaymentRecord) -> PaymentRecord:
         try:
             status_resp = await self._call_epay_with_deadline(
                 self.epay.check_transaction_status(record.invoice_id),
@@ -775,6 +871,7 @@ class PaymentService:
                 await self.esim_service.release_reserved_esim(record.id)
 
         if record.status in (PaymentStatus.AUTH, PaymentStatus.CHARGE):
+            self._remember_saved_card(record)
             try:
                 await self._apply_success_effect(record, previous_status=previous_status)
             except Exception as exc:
@@ -788,21 +885,9 @@ class PaymentService:
         await self.repo.update_payment(record)
         return record
 
-    async def _expire_stale_pending_payment(self, record: PaymentRecord) -> PaymentRecord:
-        if record.status != PaymentStatus.PENDING:
-            return record
-
-        created_at = record.created_at
-        if not created_at:
-            return record
-
-        if created_at.tzinfo is None:
-            created_at = created_at.replace(tzinfo=timezone.utc)
-        now = datetime.now(timezone.utc)
-        elapsed_seconds = (now - created_at).total_seconds()
-        ttl_seconds = max(1, int(settings.EPAY_PENDING_TTL_MINUTES)) * 60
-
-        if elapsed_seconds < ttl_seconds:
+    async def reconcile_pending_payment(self, record: PaymentRecord) -> PaymentRecord:
+        """Resolve a payment pending past ``EPAY_PENDING_TTL_MINUTES`` (run by ``pending_reconciler``)."""
+        if not PendingPaymentReconciler.is_stale(record):
             return record
 
         record = await self._sync_payment_status_from_epay(record)
@@ -863,34 +948,43 @@ class PaymentService:
         return max(base_deadline, derived_min_deadline)
 
     async def _get_local_saved_cards_fallback(self, user_id: str) -> List[SavedCardOut]:
-        records = await self.repo.list_payments(user_id, limit=200)
-        seen: set[str] = set()
-        cards: List[SavedCardOut] = []
-
-        for record in records:
-            if record.status not in (PaymentStatus.AUTH, PaymentStatus.CHARGE):
-                continue
-            if not record.card_id:
-                continue
-            if record.card_id in seen:
-                continue
-            seen.add(record.card_id)
-            cards.append(
-                SavedCardOut(
-                    id=record.card_id,
-                    card_mask=record.card_mask or "",
-                    card_type=record.card_type,
-                    payer_name=None,
-                    created_date=record.created_at.isoformat() if record.created_at else None,
-                )
+        return [
+            SavedCardOut(
+                id=card["card_id"],
+                card_mask=card.get("card_mask") or "",
+                card_type=card.get("card_type"),
+                payer_name=None,
+                created_date=card["last_success_at"].isoformat() if card.get("last_success_at") else None,
             )
+            for card in await self.repo.list_known_cards(user_id)
+        ]
 
-        return cards
+    def _remember_saved_card(self, record: PaymentRecord) -> None:
+        """Add a card saved by a successful payment to the cached saved-card list."""
+        if not record.save_card_requested or not record.card_id:
+            return
+        self.epay.saved_cards.upsert(
+            record.user_id,
+            EpaySavedCard(
+                ID=record.card_id,
+                CardMask=record.card_mask,
+                AccountID=record.user_id,
+                CreatedDate=datetime.utcnow().isoformat(),
+                PaymentAvailable=True,
+            ),
+        )
 
     async def _ensure_saved_card_available(self, user_id: str, card_id: str) -> None:
         try:
             epay_cards = await self._call_epay_with_deadline(
-                self.epay.get_saved_cards(user_id),
+                self.epay.list_saved_cards(user_id),
+                operation=f"validate-saved-card account={user_id}",
+            )
+            if any(card.ID == card_id for card in epay_cards):
+                return
+            # The cached list may predate a card saved through another instance
+            epay_cards = await self._call_epay_with_deadline(
+                self.epay.list_saved_cards(user_id, force_refresh=True),
                 operation=f"validate-saved-card account={user_id}",
             )
             if any(card.ID == card_id for card in epay_cards):
@@ -902,6 +996,9 @@ class PaymentService:
                 card_id,
                 exc.detail.get("message") if isinstance(exc.detail, dict) else str(exc),
             )
+            cached = self.epay.peek_saved_cards(user_id)
+            if cached and any(card.ID == card_id for card in cached):
+                return
 
         fallback_cards = await self._get_local_saved_cards_fallback(user_id)
         if any(card.id == card_id for card in fallback_cards):
@@ -0,0 +1,276 @@
+import asyncio
+import random
+import time
+import uuid
+import zlib
+from typing import AsyncContextManager, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.common.cache import TTLCache
+from app.common.locks import KeyedLock
+from app.common.logging import logger
+from app.common.metrics import metrics
+from app.modules.payment.repository import PaymentRepository
+
+
+class WebhookGuard:
+    """Per-invoice serialisation and duplicate suppression for ePay callbacks.
+
+    ePay sends postLink and failurePostLink and redelivers on timeouts.
+    ``hold(invoice_id)`` makes deliveries for one invoice run one at a time,
+    so the second of two concurrent duplicates reads the status the first
+    one wrote and never re-applies success effects. ``remember`` records a
+    settled payment status for an (invoice, callback code) pair for
+    ``ttl_seconds``; a redelivery of the same pair is answered from that
+    record without calling ePay or Firestore.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int) -> None:
+        self.locks = KeyedLock()
+        self._processed: TTLCache[Tuple[str, str], str] = TTLCache(max_entries, ttl_seconds)
+        self.duplicates = 0
+
+    @staticmethod
+    def _key(invoice_id: str, code: Optional[str]) -> Tuple[str, str]:
+        return (invoice_id, (code or "").lower())
+
+    def hold(self, invoice_id: str) -> AsyncContextManager[None]:
+        return self.locks.hold(invoice_id)
+
+    def processed_status(self, invoice_id: str, code: Optional[str]) -> Optional[str]:
+        status = self._processed.get(self._key(invoice_id, code))
+        if status is not None:
+            self.duplicates += 1
+        return status
+
+    def remember(self, invoice_id: str, code: Optional[str], status: str) -> None:
+        self._processed.set(self._key(invoice_id, code), status)
+
+    def stats(self) -> dict:
+        return {**self._processed.stats(), "duplicates_skipped": self.duplicates, "locks": self.locks.stats()}
+
+
+class WebhookInbox:
+    """Durable intake for ePay postLink callbacks (``webhook_inbox/{item_id}``).
+
+    The webhook endpoint only persists the raw body with ``accept`` and
+    returns; the verify + side-effect work in ``PaymentService.handle_webhook_raw``
+    runs on a pool of workers. Items are routed to a worker by a hash of
+    their invoice id, so deliveries for one invoice are handled one at a time
+    in arrival order. Failures are retried with exponential backoff; after
+    ``max_attempts`` the item is kept with ``status="dead"`` for manual
+    replay. A periodic recovery scan re-queues items left by restarts,
+    crashed workers or backoff.
+
+    A retried item runs after later deliveries for the same invoice; that is
+    safe because processing re-reads the transaction status from ePay
+    instead of trusting the callback body.
+    """
+
+    def __init__(
+        self,
+        worker_count: int,
+        max_attempts: int,
+        retry_base_seconds: float,
+        lease_seconds: float,
+        recovery_scan_seconds: float,
+        repository: Optional[PaymentRepository] = None,
+    ) -> None:
+        self.worker_count = max(1, worker_count)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_seconds = retry_base_seconds
+        self.lease_seconds = lease_seconds
+        self.recovery_scan_seconds = recovery_scan_seconds
+        self.repository = repository or PaymentRepository()
+        self._service = None
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        # item_id -> received_at for everything sitting in a worker queue
+        self._queued: Dict[str, float] = {}
+
+        self.accepted = 0
+        self.processed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.recovered = 0
+        self.backlog = 0
+
+    @property
+    def service(self):
+        if self._service is None:
+            from app.core.container import container
+
+            return container.payment_service
+        return self._service
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        self._queues = [asyncio.Queue() for _ in range(self.worker_count)]
+        self._tasks = [asyncio.create_task(self._work(queue)) for queue in self._queues]
+        self._tasks.append(asyncio.create_task(self._recover_periodically()))
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        self._queues = []
+        self._queued.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._queues)
+
+    # ------------------------------------------------------------------
+    # Intake
+    # ------------------------------------------------------------------
+
+    async def accept(self, body: dict) -> str:
+        """Persist a callback body and hand it to a worker.
+
+        Outside the lifespan (no workers) the item is processed inline. Raises
+        if the inbox write fails, so the caller can fall back to processing
+        the body directly.
+        """
+        item_id = uuid.uuid4().hex
+        now_ts = time.time()
+        invoice_id = str(body.get("invoiceId") or body.get("invoiceID") or "")
+        await self.repository.add_webhook(
+            item_id,
+            {
+                "invoice_id": invoice_id,
+                "payload": body,
+                "status": "pending",
+                "attempts": 0,
+                "received_at": now_ts,
+                "next_attempt_at": now_ts,
+            },
+        )
+        self.accepted += 1
+        if self.running:
+            self.submit(item_id, invoice_id, now_ts)
+        else:
+            await self.process(item_id)
+        return item_id
+
+    def submit(self, item_id: str, invoice_id: str, received_at: float) -> bool:
+        if not self.running or item_id in self._queued:
+            return False
+        self._queued[item_id] = received_at
+        self._queues[self._shard(invoice_id)].put_nowait(item_id)
+        return True
+
+    def _shard(self, invoice_id: str) -> int:
+        # Stable across processes, unlike hash() on str
+        return zlib.crc32(invoice_id.encode("utf-8")) % len(self._queues)
+
+    # ------------------------------------------------------------------
+    # Processing
+    # ------------------------------------------------------------------
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            item_id = await queue.get()
+            try:
+                await self.process(item_id)
+            except Exception as exc:
+                logger.error("Webhook worker crashed on item=%s: %s", item_id, exc)
+            finally:
+                self._queued.pop(item_id, None)
+                queue.task_done()
+
+    async def process(self, item_id: str) -> Optional[str]:
+        """Claim and handle one inbox item; returns processed / retry / dead, or None if not claimed."""
+        item = await self.repository.claim_webhook(item_id, time.time(), self.lease_seconds)
+        if item is None:
+            return None
+
+        try:
+            await self.service.handle_webhook_raw(item.get("payload") or {})
+        except Exception as exc:
+            attempts = int(item.get("attempts", 1))
+            if attempts >= self.max_attempts:
+                self.dead_lettered += 1
+                logger.error(
+                    "Webhook item=%s invoice=%s dead-lettered after %s attempts: %s",
+                    item_id,
+                    item.get("invoice_id"),
+                    attempts,
+                    exc,
+                )
+                await self.repository.update_webhook(
+                    item_id, {"status": "dead", "last_error": str(exc), "failed_at": time.time()}
+                )
+                return "dead"
+            self.retried += 1
+            delay = self.retry_base_seconds * (2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+            logger.warning(
+                "Webhook item=%s invoice=%s attempt %s failed, retrying in %.0fs: %s",
+                item_id,
+                item.get("invoice_id"),
+                attempts,
+                delay,
+                exc,
+            )
+            await self.repository.update_webhook(
+                item_id,
+                {"status": "pending", "next_attempt_at": time.time() + delay, "last_error": str(exc)},
+            )
+            return "retry"
+
+        self.processed += 1
+        await self.repository.delete_webhook(item_id)
+        return "processed"
+
+    async def recover(self) -> int:
+        """Queue inbox items that are due: never picked up, backing off, or abandoned mid-run."""
+        due = await self.repository.list_due_webhooks(time.time())
+        self.backlog = len(due)
+        queued = 0
+        for item in due:
+            if self.submit(item["id"], str(item.get("invoice_id") or ""), float(item.get("received_at", 0) or 0)):
+                queued += 1
+        self.recovered += queued
+        return queued
+
+    async def _recover_periodically(self) -> None:
+        while True:
+            try:
+                await self.recover()
+            except Exception as exc:
+                logger.warning("Webhook inbox recovery scan failed: %s", exc)
+            await asyncio.sleep(self.recovery_scan_seconds * random.uniform(0.9, 1.1))
+
+    def stats(self) -> dict:
+        oldest = min(self._queued.values()) if self._queued else None
+        return {
+            "running": self.running,
+            "workers": len(self._queues),
+            "queue_depth": len(self._queued),
+            "lag_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+            "last_scan_backlog": self.backlog,
+            "accepted": self.accepted,
+            "processed": self.processed,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "recovered": self.recovered,
+        }
+
+
+webhook_inbox = WebhookInbox(
+    worker_count=settings.WEBHOOK_WORKER_COUNT,
+    max_attempts=settings.WEBHOOK_MAX_ATTEMPTS,
+    retry_base_seconds=settings.WEBHOOK_RETRY_BASE_SECONDS,
+    lease_seconds=settings.WEBHOOK_LEASE_SECONDS,
+    recovery_scan_seconds=settings.WEBHOOK_RECOVERY_SCAN_SECONDS,
+)
+metrics.register("webhook_inbox", webhook_inbox.stats)
+
+webhook_guard = WebhookGuard(
+    ttl_seconds=settings.WEBHOOK_DEDUP_TTL_SECONDS,
+    max_entries=settings.WEBHOOK_DEDUP_MAX_ENTRIES,
+)
+metrics.register("webhook_dedup", webhook_guard.stats)
@@ -0,0 +1,52 @@
+from typing import Awaitable, Callable, Optional
+
+from app.core.config import settings
+from app.common.cache import TTLCache
+from app.common.metrics import metrics
+from app.modules.users.schemas import User
+
+
+class UserCache:
+    """Authenticated-user lookups for ``get_current_user``, cached per user id.
+
+    ``UserRepository`` writes to ``users/{id}`` invalidate the entry in this
+    process; other instances see the change once their entry expires, so
+    the TTL bounds how stale a profile can be. Code that makes decisions on
+    fields such as ``balance`` must re-read the user instead of trusting the
+    request's ``current_user``.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int) -> None:
+        self._users: TTLCache[str, User] = TTLCache(max_entries, ttl_seconds)
+        # Bumped on every invalidation; a load that overlaps one is not cached
+        self._generation = 0
+        self.invalidations = 0
+
+    async def get(self, user_id: str, loader: Callable[[str], Awaitable[Optional[User]]]) -> Optional[User]:
+        user = self._users.get(user_id)
+        if user is not None:
+            return user.model_copy()
+        generation = self._generation
+        user = await loader(user_id)
+        if user is not None and generation == self._generation:
+            self._users.set(user_id, user.model_copy())
+        return user
+
+    def invalidate(self, user_id: str) -> None:
+        self.invalidations += 1
+        self._generation += 1
+        self._users.pop(user_id)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._users.clear()
+
+    def stats(self) -> dict:
+        return {**self._users.stats(), "invalidations": self.invalidations}
+
+
+user_cache = UserCache(
+    ttl_seconds=settings.AUTH_USER_CACHE_TTL_SECONDS,
+    max_entries=settings.AUTH_USER_CACHE_MAX_ENTRIES,
+)
+metrics.register("auth_users", user_cache.stats)
@@ -1,17 +1,12 @@
 from app.infrastructure.firestore import get_db
+from app.modules.users.cache import user_cache
 from app.modules.users.schemas import User
 from typing import Optional
-import anyio
 
 class UserRepository:
-    def __init__(self):
-        self._db = None
-
     @property
     def db(self):
-        if self._db is None:
-            self._db = get_db()
-        return self._db
+        return get_db()
 
     @property
     def collection(self):
@@ -19,17 +14,28 @@ class UserRepository:
 
     async def get_user(self, user_id: str) -> Optional[User]:
         doc_ref = self.collection.document(user_id)
-        doc = await anyio.to_thread.run_sync(doc_ref.get)
+        doc = await doc_ref.get()
         if doc.exists:
             return User(**doc.to_dict())
         return None
 
+    async def get_cached_user(self, user_id: str) -> Optional[User]:
+        """``get_user`` through the per-instance auth cache; may be up to a TTL stale."""
+        return await user_cache.get(user_id, self.get_user)
+
     async def update_user(self, user_id: str, data: dict) -> Optional[User]:
         ref = self.collection.document(user_id)
-        await anyio.to_thread.run_sync(ref.update, data)
-        doc = await anyio.to_thread.run_sync(ref.get)
+        try:
+            await ref.update(data)
+            doc = await ref.get()
+        finally:
+            # Invalidate once both have finished, so a load that overlapped either is not cached
+            user_cache.invalidate(user_id)
         return User(**doc.to_dict())
 
     async def delete_user(self, user_id: str):
         ref = self.collection.document(user_id)
-        await anyio.to_thread.run_sync(ref.delete)
+        try:
+            await ref.delete()
+        finally:
+            user_cache.invalidate(user_id)
@@ -8,9 +8,19 @@ from typing import Optional
 import uuid
 
 class UserService:
-    def __init__(self):
+    def __init__(self, esim_service=None, wallet_service: Optional[WalletService] = None):
         self.repository = UserRepository()
-        self.wallet_service = WalletService()
+        self.wallet_service = wallet_service or WalletService()
+        self._esim_service = esim_service
+
+    @property
+    def esim_service(self):
+        # EsimService is resolved lazily to avoid a circular import; the shared
+        # instance comes from the app container unless one was injected
+        if self._esim_service is None:
+            from app.core.container import container
+            self._esim_service = container.esim_service
+        return self._esim_service
 
     async def get_profile(self, user_id: str) -> User:
         user = await self.repository.get_user(user_id)
@@ -19,12 +29,8 @@ class UserService:
         return user
 
     async def get_subscriber_info(self, user: User) -> dict:
-        # Use local import to avoid circular dependency if EsimService imports UserService
-        from app.modules.esim.service import EsimService
-        esim_service = EsimService()
-        
         # 1. Get allocated esims
-        esims = await esim_service.get_user_esims(user)
+        esims = await self.esim_service.get_user_esims(user)
         
         # 2. Structure as per API
         return {
@@ -59,9 +65,7 @@ class UserService:
                 raise AppError(400, "Insufficient funds in your account balance")
             
             # Delegate to EsimService
-            from app.modules.esim.service import EsimService
-            esim_service = EsimService()
-            await esim_service.top_up_esim_by_imsi(user, imsi, amount)
+            await self.esim_service.top_up_esim_by_imsi(user, imsi, amount)
             
             # Deduct from Wallet
             new_balance = user.balance - amount
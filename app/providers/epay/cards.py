@@ -0,0 +1,112 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.common.cache import TTLCache
+from app.common.logging import logger
+from app.common.metrics import metrics
+from app.providers.epay.schemas import EpaySavedCard
+
+SavedCardsLoader = Callable[[str], Awaitable[List[EpaySavedCard]]]
+
+
+@dataclass
+class SavedCardsEntry:
+    cards: List[EpaySavedCard]
+    fetched_at: float
+
+
+class SavedCardCache:
+    """Read-through cache for ``GET /cards/{accountId}`` keyed by account (user id).
+
+    Shared by the saved-cards endpoint, recurrent payments and autopay.
+    Entries are fresh for ``ttl_seconds``; when ePay fails, an entry up to
+    ``max_stale_seconds`` old is served instead. Deactivating a card
+    invalidates the account; a successful payment that saved a card adds it
+    to the cached list.
+    """
+
+    def __init__(self, ttl_seconds: float, max_stale_seconds: float, max_entries: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._entries: TTLCache[str, SavedCardsEntry] = TTLCache(max_entries, max(ttl_seconds, max_stale_seconds))
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._generations: Dict[str, int] = {}
+
+        self.fresh_hits = 0
+        self.loads = 0
+        self.stale_served = 0
+        self.invalidations = 0
+        self.upserts = 0
+
+    async def get(self, account_id: str, loader: SavedCardsLoader, force_refresh: bool = False) -> List[EpaySavedCard]:
+        entry = None if force_refresh else self._entries.get(account_id)
+        if entry is not None and time.time() - entry.fetched_at < self.ttl_seconds:
+            self.fresh_hits += 1
+            return list(entry.cards)
+
+        try:
+            return list(await self._load(account_id, loader))
+        except Exception:
+            fallback = self.peek(account_id)
+            if fallback is None:
+                raise
+            self.stale_served += 1
+            logger.warning("ePay unavailable, serving cached saved cards account=%s", account_id)
+            return fallback
+
+    def peek(self, account_id: str) -> Optional[List[EpaySavedCard]]:
+        """Last known card list regardless of freshness."""
+        entry = self._entries.peek(account_id)
+        return list(entry.cards) if entry is not None else None
+
+    def invalidate(self, account_id: str) -> None:
+        self.invalidations += 1
+        self._generations[account_id] = self._generations.get(account_id, 0) + 1
+        self._entries.pop(account_id)
+
+    def upsert(self, account_id: str, card: EpaySavedCard) -> None:
+        """Add or replace a card in a cached list (no-op if the account is not cached)."""
+        entry = self._entries.peek(account_id)
+        if entry is None:
+            return
+        self.upserts += 1
+        cards = [existing for existing in entry.cards if existing.ID != card.ID]
+        cards.append(card)
+        self._entries.set(account_id, SavedCardsEntry(cards=cards, fetched_at=entry.fetched_at))
+
+    async def _load(self, account_id: str, loader: SavedCardsLoader) -> List[EpaySavedCard]:
+        task = self._inflight.get(account_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(account_id, loader))
+            self._inflight[account_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(account_id, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, account_id: str, loader: SavedCardsLoader) -> List[EpaySavedCard]:
+        generation = self._generations.get(account_id, 0)
+        self.loads += 1
+        cards = await loader(account_id)
+        # A deactivation while this load was in flight makes its answer suspect
+        if self._generations.get(account_id, 0) == generation:
+            self._entries.set(account_id, SavedCardsEntry(cards=list(cards), fetched_at=time.time()))
+        return cards
+
+    def stats(self) -> dict:
+        return {
+            **self._entries.stats(),
+            "fresh_hits": self.fresh_hits,
+            "loads": self.loads,
+            "stale_served": self.stale_served,
+            "invalidations": self.invalidations,
+            "upserts": self.upserts,
+        }
+
+
+saved_card_cache = SavedCardCache(
+    ttl_seconds=settings.EPAY_SAVED_CARDS_TTL_SECONDS,
+    max_stale_seconds=settings.EPAY_SAVED_CARDS_MAX_STALE_SECONDS,
+    max_entries=settings.EPAY_SAVED_CARDS_CACHE_MAX_ENTRIES,
+)
+metrics.register("saved_cards", saved_card_cache.stats)
@@ -1,12 +1,15 @@
 import httpx
-import time
 import asyncio
 import json
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
 from app.core.config import settings
 from app.common.logging import logger
 from app.common.exceptions import AppError
+from app.common.metrics import metrics
+from app.infrastructure.http import HostPoolGroup
+from app.infrastructure.tokens import TokenManager, token_manager
+from app.providers.epay.cards import SavedCardCache, saved_card_cache
 from app.providers.epay.schemas import (
     EpayTokenResponse,
     EpayStatusResponse,
@@ -16,6 +19,20 @@ from app.providers.epay.schemas import (
 )
 
 
+# Warm connections to every ePay host (primary and fallbacks), owned by the app lifespan.
+epay_http = HostPoolGroup(
+    "epay",
+    timeout=httpx.Timeout(
+        settings.EPAY_HTTP_TIMEOUT_SECONDS,
+        connect=settings.EPAY_HTTP_CONNECT_TIMEOUT_SECONDS,
+    ),
+    max_connections_per_host=settings.EPAY_HTTP_MAX_CONNECTIONS_PER_HOST,
+    max_keepalive_per_host=settings.EPAY_HTTP_MAX_KEEPALIVE_PER_HOST,
+    keepalive_expiry=settings.EPAY_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+)
+metrics.register("epay_http", epay_http.stats)
+
+
 class EpayClient:
     """HTTP client for the Halyk ePay gateway.
 
@@ -27,7 +44,15 @@ class EpayClient:
     - Charge (confirm) and refund operations.
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        http: Optional[HostPoolGroup] = None,
+        tokens: Optional[TokenManager] = None,
+        saved_cards: Optional[SavedCardCache] = None,
+    ) -> None:
+        self._http = http or epay_http
+        self._tokens = tokens or token_manager
+        self.saved_cards = saved_cards or saved_card_cache
         self.oauth_url: str = settings.EPAY_OAUTH_URL
         self.api_url: str = settings.EPAY_API_URL
         self.oauth_fallback_url: Optional[str] = settings.EPAY_OAUTH_FALLBACK_URL
@@ -38,9 +63,9 @@ class EpayClient:
         self.timeout_seconds: float = float(settings.EPAY_HTTP_TIMEOUT_SECONDS)
         self.retries: int = max(1, int(settings.EPAY_HTTP_RETRIES))
 
-        # Cached service-level token (client_credentials, scope=webapi …)
-        self._service_token: Optional[str] = None
-        self._service_token_expires_at: float = 0.0
+        # Service-level token (client_credentials, scope=webapi …) is cached
+        # process-wide by the token manager, not per client instance.
+        self._service_token_key = f"epay_service:{self.client_id}:{self.terminal_id}"
 
     # ------------------------------------------------------------------
     # Token helpers
@@ -48,9 +73,9 @@ class EpayClient:
 
     async def _obtain_service_token(self) -> str:
         """Obtain / refresh a *service* token (client_credentials, broad scope)."""
-        if self._service_token and time.time() < (self._service_token_expires_at - 120):
-            return self._service_token
+        return await self._tokens.get_token(self._service_token_key, self._fetch_service_token)
 
+    async def _fetch_service_token(self) -> Tuple[str, float]:
         form = {
             "grant_type": "client_credentials",
             "scope": "webapi usermanagement email_send verification statement statistics payment",
@@ -60,10 +85,8 @@ class EpayClient:
         }
         data = await self._post_form(self._oauth_urls(), form, auth_header=None)
         resp = EpayTokenResponse(**data)
-        self._service_token = resp.access_token
-        self._service_token_expires_at = time.time() + resp.expires_in
         logger.info("ePay service token obtained (expires_in=%s)", resp.expires_in)
-        return self._service_token
+        return resp.access_token, resp.expires_in
 
     async def obtain_payment_token(
         self,
@@ -211,7 +234,14 @@ class EpayClient:
             return []
         return [EpaySavedCard(**item) for item in data]
 
-    async def deactivate_card(self, card_id: str) -> dict:
+    async def list_saved_cards(self, account_id: str, force_refresh: bool = False) -> List[EpaySavedCard]:
+        """Saved cards through the shared per-account cache (see SavedCardCache)."""
+        return await self.saved_cards.get(account_id, self.get_saved_cards, force_refresh=force_refresh)
+
+    def peek_saved_cards(self, account_id: str) -> Optional[List[EpaySavedCard]]:
+        return self.saved_cards.peek(account_id)
+
+    async def deactivate_card(self, card_id: str, account_id: Optional[str] = None) -> dict:
         """POST /card/deactivate/:cardID"""
         token = await self._obtain_service_token()
         data = await self._post_json(
@@ -219,6 +249,8 @@ class EpayClient:
             None,
             token,
         )
+        if account_id:
+            self.saved_cards.invalidate(account_id)
         logger.info("ePay card deactivated: %s", card_id)
         return data
 
@@ -258,43 +290,43 @@ class EpayClient:
         for url in urls:
             for attempt in range(1, self.retries + 1):
                 logger.info("ePay POST (form) → %s (attempt %s/%s)", url, attempt, self.retries)
-                async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
+                client = self._http.for_url(url)
+                try:
+                    resp = await client.request("POST", url, data=form, headers=headers)
+                    resp.raise_for_status()
                     try:
-                        resp = await client.post(url, data=form, headers=headers)
-                        resp.raise_for_status()
-                        try:
-                            return resp.json()
-                        except Exception as exc:
-                            logger.error("ePay invalid JSON response: %s %s", url, str(exc))
-                            raise AppError(502, "ePay invalid response")
-                    except httpx.HTTPStatusError as exc:
-                        status_code = exc.response.status_code
-                        logger.error(
-                            "ePay HTTP error: %s %s — %s",
-                            status_code,
-                            url,
-                            exc.response.text[:500],
-                        )
-                        if 400 <= status_code < 500 and status_code not in (408, 429):
-                            raise self._build_upstream_error(exc.response)
-                        if attempt < self.retries:
-                            await self._sleep_backoff(attempt)
-                            continue
-                        # try next fallback URL
-                        break
-                    except httpx.HTTPError as exc:
-                        last_error = exc
-                        logger.warning("ePay network error: %s — %s", url, exc)
-                        if attempt < self.retries:
-                            await self._sleep_backoff(attempt)
-                    except AppError:
-                        raise
+                        return resp.json()
                     except Exception as exc:
-                        logger.exception("ePay unexpected error: %s %s", url, str(exc))
-                        if attempt < self.retries:
-                            await self._sleep_backoff(attempt)
-                            continue
-                        break
+                        logger.error("ePay invalid JSON response: %s %s", url, str(exc))
+                        raise AppError(502, "ePay invalid response")
+                except httpx.HTTPStatusError as exc:
+                    status_code = exc.response.status_code
+                    logger.error(
+                        "ePay HTTP error: %s %s — %s",
+                        status_code,
+                        url,
+                        exc.response.text[:500],
+                    )
+                    if 400 <= status_code < 500 and status_code not in (408, 429):
+                        raise self._build_upstream_error(exc.response)
+                    if attempt < self.retries:
+                        await self._sleep_backoff(attempt)
+                        continue
+                    # try next fallback URL
+                    break
+                except httpx.HTTPError as exc:
+                    last_error = exc
+                    logger.warning("ePay network error: %s — %s", url, exc)
+                    if attempt < self.retries:
+                        await self._sleep_backoff(attempt)
+                except AppError:
+                    raise
+                except Exception as exc:
+                    logger.exception("ePay unexpected error: %s %s", url, str(exc))
+                    if attempt < self.retries:
+                        await self._sleep_backoff(attempt)
+                        continue
+                    break
 
         logger.error("ePay gateway unreachable for all oauth URLs: %s", urls)
         raise AppError(502, "ePay gateway unreachable")
@@ -306,46 +338,46 @@ class EpayClient:
         for url_index, url in enumerate(urls):
             for attempt in range(1, self.retries + 1):
                 logger.info("ePay POST (json) → %s (attempt %s/%s)", url, attempt, self.retries)
-                async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
+                client = self._http.for_url(url)
+                try:
+                    resp = await client.request("POST", url, json=body, headers=headers)
+                    resp.raise_for_status()
                     try:
-                        resp = await client.post(url, json=body, headers=headers)
-                        resp.raise_for_status()
-                        try:
-                            return resp.json()
-                        except Exception:
-                            return {"raw": resp.text}
-                    except httpx.HTTPStatusError as exc:
-                        status_code = exc.response.status_code
-                        logger.error(
-                            "ePay HTTP error: %s %s — %s",
-                            status_code,
-                            url,
-                            exc.response.text[:500],
-                        )
-                        # Some ePay endpoints differ by host/base-path.
-                        # If current URL returns 404 and we have other candidates,
-                        # continue with next URL before failing the request.
-                        if status_code == 404 and url_index < (len(urls) - 1):
-                            logger.warning("ePay endpoint not found on this base, trying next URL: %s", url)
-                            break
-                        if 400 <= status_code < 500 and status_code not in (408, 429):
-                            raise self._build_upstream_error(exc.response)
-                        if attempt < self.retries:
-                            await self._sleep_backoff(attempt)
-                            continue
-                        break
-                    except httpx.HTTPError as exc:
-                        logger.warning("ePay network error: %s — %s", url, exc)
-                        if attempt < self.retries:
-                            await self._sleep_backoff(attempt)
-                    except AppError:
-                        raise
-                    except Exception as exc:
-                        logger.exception("ePay unexpected error: %s %s", url, str(exc))
-                        if attempt < self.retries:
-                            await self._sleep_backoff(attempt)
-                            continue
+                        return resp.json()
+                    except Exception:
+                        return {"raw": resp.text}
+                except httpx.HTTPStatusError as exc:
+                    status_code = exc.response.status_code
+                    logger.error(
+                        "ePay HTTP error: %s %s — %s",
+                        status_code,
+                        url,
+                        exc.response.text[:500],
+                    )
+                    # Some ePay endpoints differ by host/base-path.
+                    # If current URL returns 404 and we have other candidates,
+                    # continue with next URL before failing the request.
+                    if status_code == 404 and url_index < (len(urls) - 1):
+                        logger.warning("ePay endpoint not found on this base, trying next URL: %s", url)
                         break
+                    if 400 <= status_code < 500 and status_code not in (408, 429):
+                        raise self._build_upstream_error(exc.response)
+                    if attempt < self.retries:
+                        await self._sleep_backoff(attempt)
+                        continue
+                    break
+                except httpx.HTTPError as exc:
+                    logger.warning("ePay network error: %s — %s", url, exc)
+                    if attempt < self.retries:
+                        await self._sleep_backoff(attempt)
+                except AppError:
+                    raise
+                except Exception as exc:
+                    logger.exception("ePay unexpected error: %s %s", url, str(exc))
+                    if attempt < self.retries:
+                        await self._sleep_backoff(attempt)
+                        continue
+                    break
 
         logger.error("ePay gateway unreachable for all api URLs: %s", urls)
         raise AppError(502, "ePay gateway unreachable")
@@ -355,41 +387,41 @@ class EpayClient:
         for url in urls:
             for attempt in range(1, self.retries + 1):
                 logger.info("ePay GET → %s (attempt %s/%s)", url, attempt, self.retries)
-                async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
+                client = self._http.for_url(url)
+                try:
+                    resp = await client.request("GET", url, headers=headers)
+                    resp.raise_for_status()
                     try:
-                        resp = await client.get(url, headers=headers)
-                        resp.raise_for_status()
-                        try:
-                            return resp.json()
-                        except Exception as exc:
-                            logger.error("ePay invalid JSON response: %s %s", url, str(exc))
-                            raise AppError(502, "ePay invalid response")
-                    except httpx.HTTPStatusError as exc:
-                        status_code = exc.response.status_code
-                        logger.error(
-                            "ePay HTTP error: %s %s — %s",
-                            status_code,
-                            url,
-                            exc.response.text[:500],
-                        )
-                        if 400 <= status_code < 500 and status_code not in (408, 429):
-                            raise self._build_upstream_error(exc.response)
-                        if attempt < self.retries:
-                            await self._sleep_backoff(attempt)
-                            continue
-                        break
-                    except httpx.HTTPError as exc:
-                        logger.warning("ePay network error: %s — %s", url, exc)
-                        if attempt < self.retries:
-                            await self._sleep_backoff(attempt)
-                    except AppError:
-                        raise
+                        return resp.json()
                     except Exception as exc:
-                        logger.exception("ePay unexpected error: %s %s", url, str(exc))
-                        if attempt < self.retries:
-                            await self._sleep_backoff(attempt)
-                            continue
-                        break
+                        logger.error("ePay invalid JSON response: %s %s", url, str(exc))
+                        raise AppError(502, "ePay invalid response")
+                except httpx.HTTPStatusError as exc:
+                    status_code = exc.response.status_code
+                    logger.error(
+                        "ePay HTTP error: %s %s — %s",
+                        status_code,
+                        url,
+                        exc.response.text[:500],
+                    )
+                    if 400 <= status_code < 500 and status_code not in (408, 429):
+                        raise self._build_upstream_error(exc.response)
+                    if attempt < self.retries:
+                        await self._sleep_backoff(attempt)
+                        continue
+                    break
+                except httpx.HTTPError as exc:
+                    logger.warning("ePay network error: %s — %s", url, exc)
+                    if attempt < self.retries:
+                        await self._sleep_backoff(attempt)
+                except AppError:
+                    raise
+                except Exception as exc:
+                    logger.exception("ePay unexpected error: %s %s", url, str(exc))
+                    if attempt < self.retries:
+                        await self._sleep_backoff(attempt)
+                        continue
+                    break
 
         logger.error("ePay gateway unreachable for all api URLs: %s", urls)
         raise AppError(502, "ePay gateway unreachable")
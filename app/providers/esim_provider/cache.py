@@ -0,0 +1,142 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.common.cache import TTLCache
+from app.common.logging import logger
+from app.common.metrics import metrics
+from app.providers.esim_provider.schemas import ImsiInfoResponse
+
+ImsiLoader = Callable[[str], Awaitable[ImsiInfoResponse]]
+
+
+@dataclass
+class ImsiInfoResult:
+    info: ImsiInfoResponse
+    fetched_at: float
+    # True only when the provider failed and we fell back to an old answer
+    stale: bool = False
+
+
+class ImsiInfoCache:
+    """Read-through cache for ``GET /imsi/{imsi}`` keyed by IMSI.
+
+    age < ttl                      -> served from cache
+    age < ttl + revalidate window  -> served from cache, refreshed in background
+    older / missing                -> fetched inline; if the provider fails, any
+                                      entry younger than max_stale is served
+                                      with ``stale=True``
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        revalidate_seconds: float,
+        max_stale_seconds: float,
+        max_entries: int,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.revalidate_seconds = revalidate_seconds
+        self._entries: TTLCache[str, ImsiInfoResult] = TTLCache(max_entries, max_stale_seconds)
+        # imsi -> (load task, generation it started at)
+        self._inflight: Dict[str, Tuple[asyncio.Task, int]] = {}
+        self._generations: Dict[str, int] = {}
+        self._background: Set[asyncio.Task] = set()
+
+        self.fresh_hits = 0
+        self.revalidations = 0
+        self.loads = 0
+        self.stale_served = 0
+        self.invalidations = 0
+
+    async def get(self, imsi: str, loader: ImsiLoader, force_refresh: bool = False) -> ImsiInfoResult:
+        entry = None if force_refresh else self._entries.get(imsi)
+        if entry is not None:
+            age = time.time() - entry.fetched_at
+            if age < self.ttl_seconds:
+                self.fresh_hits += 1
+                return entry
+            if age < self.ttl_seconds + self.revalidate_seconds:
+                self.revalidations += 1
+                if imsi not in self._inflight:
+                    task = self._start_load(imsi, loader)
+                    self._background.add(task)
+                    task.add_done_callback(self._finish_background)
+                return entry
+
+        try:
+            return await self._load(imsi, loader)
+        except Exception:
+            # An explicit refresh wants the provider's answer, not a stale copy
+            fallback = None if force_refresh else self.peek(imsi)
+            if fallback is None:
+                raise
+            self.stale_served += 1
+            logger.warning("Provider unavailable, serving stale IMSI info imsi=%s", imsi)
+            return ImsiInfoResult(info=fallback.info, fetched_at=fallback.fetched_at, stale=True)
+
+    def peek(self, imsi: str) -> Optional[ImsiInfoResult]:
+        """Last known answer regardless of freshness (without counting a lookup)."""
+        return self._entries.peek(imsi)
+
+    def invalidate(self, imsi: str) -> None:
+        """Forget an IMSI after a state-changing provider call (top-up, assign, revoke)."""
+        self.invalidations += 1
+        self._generations[imsi] = self._generations.get(imsi, 0) + 1
+        self._entries.pop(imsi)
+
+    async def _load(self, imsi: str, loader: ImsiLoader) -> ImsiInfoResult:
+        inflight = self._inflight.get(imsi)
+        # A load started before the last invalidation may return pre-write data
+        if inflight is not None and inflight[1] == self._generations.get(imsi, 0):
+            task = inflight[0]
+        else:
+            task = self._start_load(imsi, loader)
+        return await asyncio.shield(task)
+
+    def _start_load(self, imsi: str, loader: ImsiLoader) -> asyncio.Task:
+        generation = self._generations.get(imsi, 0)
+        task = asyncio.create_task(self._fetch(imsi, loader, generation))
+        self._inflight[imsi] = (task, generation)
+        task.add_done_callback(lambda done: self._forget_load(imsi, done))
+        return task
+
+    def _forget_load(self, imsi: str, task: asyncio.Task) -> None:
+        inflight = self._inflight.get(imsi)
+        if inflight is not None and inflight[0] is task:
+            del self._inflight[imsi]
+
+    async def _fetch(self, imsi: str, loader: ImsiLoader, generation: int) -> ImsiInfoResult:
+        self.loads += 1
+        info = await loader(imsi)
+        result = ImsiInfoResult(info=info, fetched_at=time.time())
+        # Skip caching if the IMSI was invalidated while this load was in flight.
+        if self._generations.get(imsi, 0) == generation:
+            self._entries.set(imsi, result)
+        return result
+
+    def _finish_background(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning("Background IMSI refresh failed: %s", task.exception())
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "fresh_hits": self.fresh_hits,
+            "revalidations": self.revalidations,
+            "loads": self.loads,
+            "stale_served": self.stale_served,
+            "invalidations": self.invalidations,
+        }
+
+
+imsi_info_cache = ImsiInfoCache(
+    ttl_seconds=settings.ESIM_IMSI_CACHE_TTL_SECONDS,
+    revalidate_seconds=settings.ESIM_IMSI_CACHE_REVALIDATE_SECONDS,
+    max_stale_seconds=settings.ESIM_IMSI_CACHE_MAX_STALE_SECONDS,
+    max_entries=settings.ESIM_IMSI_CACHE_MAX_ENTRIES,
+)
+metrics.register("imsi_info_cache", imsi_info_cache.stats)
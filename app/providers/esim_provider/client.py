@@ -6,44 +6,63 @@ from app.providers.esim_provider.schemas import (
 )
 from app.common.exceptions import AppError
 from app.common.logging import logger
-from typing import List, Optional, Dict
+from app.common.metrics import metrics
+from app.infrastructure.http import PooledHttpClient
+from app.infrastructure.tokens import TokenManager, token_manager
+from app.providers.esim_provider.cache import ImsiInfoCache, ImsiInfoResult, imsi_info_cache
+from app.providers.esim_provider.inventory import ImsiInventory, imsi_inventory
+from typing import List, Optional, Dict, Tuple
 import json
-import time
 import csv
 import io
 
+# One pooled connection set to the provider per process; opened/closed by the app lifespan.
+provider_http = PooledHttpClient(
+    "esim_provider",
+    timeout=settings.IMSI_HTTP_TIMEOUT_SECONDS,
+    max_connections=settings.IMSI_HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.IMSI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.IMSI_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    http2=settings.IMSI_HTTP2_ENABLED,
+)
+metrics.register("esim_provider_http", provider_http.stats)
+
 class EsimProviderClient:
-    def __init__(self):
+    def __init__(
+        self,
+        http: Optional[PooledHttpClient] = None,
+        tokens: Optional[TokenManager] = None,
+        imsi_cache: Optional[ImsiInfoCache] = None,
+        inventory: Optional[ImsiInventory] = None,
+    ):
+        self._http = http or provider_http
+        self._tokens = tokens or token_manager
+        self._imsi_cache = imsi_cache or imsi_info_cache
+        self.inventory = inventory or imsi_inventory
         self.base_url = settings.IMSI_API_URL
         self.username = settings.IMSI_USERNAME
         self.password = settings.IMSI_PASSWORD
-        self._token: Optional[str] = None
-        self._token_expires_at: Optional[float] = None
+        self._token_key = f"esim_provider:{self.base_url}:{self.username}"
 
     async def _get_token(self) -> str:
-        # Check if token exists and is valid (with 60s buffer)
-        if self._token and self._token_expires_at:
-            if time.time() < (self._token_expires_at - 60):
-                return self._token
-            
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/token",
-                    data={"username": self.username, "password": self.password},
-                    headers={"Content-Type": "application/x-www-form-urlencoded"}
-                )
-                response.raise_for_status()
-                data = response.json()
-                token_resp = ImsiTokenResponse(**data)
-                
-                self._token = token_resp.access_token
-                # Set expiration time (current time + expires_in)
-                self._token_expires_at = time.time() + token_resp.expires_in
-                return self._token
-            except httpx.HTTPError as e:
-                logger.error(f"Provider Auth Failed: {e}")
-                raise AppError(503, "Provider unavailable")
+        # Shared across client instances; refreshed once for all concurrent callers
+        return await self._tokens.get_token(self._token_key, self._fetch_token)
+
+    async def _fetch_token(self) -> Tuple[str, float]:
+        try:
+            response = await self._http.request(
+                "POST",
+                f"{self.base_url}/token",
+                data={"username": self.username, "password": self.password},
+                headers={"Content-Type": "application/x-www-form-urlencoded"}
+            )
+            response.raise_for_status()
+            data = response.json()
+            token_resp = ImsiTokenResponse(**data)
+            return token_resp.access_token, token_resp.expires_in
+        except httpx.HTTPError as e:
+            logger.error(f"Provider Auth Failed: {e}")
+            raise AppError(503, "Provider unavailable")
 
     async def _request(self, method: str, endpoint: str, data: dict = None, retry_auth: bool = True) -> dict:
         token = await self._get_token()
@@ -53,36 +72,34 @@ class EsimProviderClient:
             "Authorization": f"Bearer {token}"
         }
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            try:
-                if method == "GET":
-                    response = await client.get(url, headers=headers)
-                elif method == "POST":
-                    response = await client.post(url, headers=headers, json=data)
-                else:
-                    raise ValueError(f"Unsupported method {method}")
-                
-                # Retrieve new token if unauthorized
-                if response.status_code == 401 and retry_auth:
-                    logger.warning(f"Provider Token Expired (401). Retrying request: {url}")
-                    self._token = None
-                    self._token_expires_at = 0
-                    return await self._request(method, endpoint, data, retry_auth=False)
+        try:
+            if method == "GET":
+                response = await self._http.request("GET", url, headers=headers)
+            elif method == "POST":
+                response = await self._http.request("POST", url, headers=headers, json=data)
+            else:
+                raise ValueError(f"Unsupported method {method}")
+            
+            # Retrieve new token if unauthorized
+            if response.status_code == 401 and retry_auth:
+                logger.warning(f"Provider Token Expired (401). Retrying request: {url}")
+                self._tokens.invalidate(self._token_key, token)
+                return await self._request(method, endpoint, data, retry_auth=False)
 
-                response.raise_for_status()
+            response.raise_for_status()
+            
+            try:
+                return response.json()
+            except json.JSONDecodeError:
+                return json.loads(response.text)
                 
-                try:
-                    return response.json()
-                except json.JSONDecodeError:
-                    return json.loads(response.text)
-                    
-            except httpx.HTTPError as e:
-                status_code = response.status_code if 'response' in locals() else 502
-                error_text = response.text if 'response' in locals() else str(e)
-                logger.error(f"Provider Request Failed: {e} | URL: {url} | Details: {error_text}")
-                # Sometimes 4xx errors return valid JSON body with error info
-                # We should propagate specific errors if possible
-                raise AppError(status_code, "Provider Error")
+        except httpx.HTTPError as e:
+            status_code = response.status_code if 'response' in locals() else 502
+            error_text = response.text if 'response' in locals() else str(e)
+            logger.error(f"Provider Request Failed: {e} | URL: {url} | Details: {error_text}")
+            # Sometimes 4xx errors return valid JSON body with error info
+            # We should propagate specific errors if possible
+            raise AppError(status_code, "Provider Error")
 
     async def get_balance(self) -> ImsiFuelResponse:
         # Provider Endpoint: GET /fuel
@@ -92,6 +109,16 @@ class EsimProviderClient:
         return ImsiFuelResponse(**data)
 
     async def get_imsi_info(self, imsi: str) -> ImsiInfoResponse:
+        return (await self.lookup_imsi_info(imsi)).info
+
+    async def lookup_imsi_info(self, imsi: str, force_refresh: bool = False) -> ImsiInfoResult:
+        """Cached IMSI info plus freshness metadata (see ImsiInfoCache)."""
+        return await self._imsi_cache.get(imsi, self._fetch_imsi_info, force_refresh=force_refresh)
+
+    def peek_imsi_info(self, imsi: str) -> Optional[ImsiInfoResult]:
+        return self._imsi_cache.peek(imsi)
+
+    async def _fetch_imsi_info(self, imsi: str) -> ImsiInfoResponse:
         # Provider Endpoint: GET /imsi/{imsi}
         data = await self._request("GET", f"/imsi/{imsi}")
         # API Doc says: returns Dict stringified
@@ -99,6 +126,25 @@ class EsimProviderClient:
             data = json.loads(data)
         return ImsiInfoResponse(**data)
 
+    async def list_inventory(self, force_refresh: bool = False) -> List[ImsiListItem]:
+        """Reseller inventory from the shared snapshot (see ImsiInventory)."""
+        return await self.inventory.items(self.list_imsis, force_refresh=force_refresh)
+
+    async def confirm_imsi(self, imsi: str) -> Optional[ImsiInfoResponse]:
+        """Re-check one IMSI with the provider before handing it out.
+
+        Returns None (and drops it from the inventory snapshot) if the provider
+        no longer knows the IMSI; provider outages are raised as usual.
+        """
+        try:
+            result = await self.lookup_imsi_info(imsi, force_refresh=True)
+        except AppError as e:
+            if 400 <= e.status_code < 500:
+                self.inventory.discard(imsi)
+                return None
+            raise
+        return result.info
+
     async def list_imsis(self) -> List[ImsiListItem]:
         # Provider Endpoint: GET /list
         data = await self._request("GET", "/list")
@@ -129,7 +175,10 @@ class EsimProviderClient:
     async def top_up(self, imsi: str, amount: float) -> TopUpResponse:
         # Provider Endpoint: GET /topup/{imsi}/{amount}
         url = f"/topup/{imsi}/{amount}"
-        data = await self._request("GET", url)
+        try:
+            data = await self._request("GET", url)
+        finally:
+            self._imsi_cache.invalidate(imsi)
         if isinstance(data, str):
             data = json.loads(data)
         
@@ -150,14 +199,20 @@ class EsimProviderClient:
 
     async def assign_msisdn(self, imsi: str, msisdn: str) -> AssignResponse:
         # Provider Endpoint: GET /assign/{imsi}/{msisdn}
-        data = await self._request("GET", f"/assign/{imsi}/{msisdn}")
+        try:
+            data = await self._request("GET", f"/assign/{imsi}/{msisdn}")
+        finally:
+            self._imsi_cache.invalidate(imsi)
         if isinstance(data, str):
             data = json.loads(data)
         return AssignResponse(**data)
     
     async def revoke_msisdn(self, imsi: str) -> RevokeResponse:
         # Provider Endpoint: GET /revoke/{imsi}
-        data = await self._request("GET", f"/revoke/{imsi}")
+        try:
+            data = await self._request("GET", f"/revoke/{imsi}")
+        finally:
+            self._imsi_cache.invalidate(imsi)
         if isinstance(data, str):
             data = json.loads(data)
         return RevokeResponse(**data)
@@ -174,85 +229,83 @@ class EsimProviderClient:
         
         logger.info(f"Fetching snapshots from: {url}")
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            try:
-                response = await client.get(url, headers=headers)
-                
-                if response.status_code == 401:
-                    logger.warning("Provider Token Expired (401) during snapshot. Retrying...")
-                    self._token = None
-                    self._token_expires_at = 0
-                    token = await self._get_token()
-                    headers["Authorization"] = f"Bearer {token}"
-                    response = await client.get(url, headers=headers)
+        try:
+            response = await self._http.request("GET", url, headers=headers, timeout=60.0)
+            
+            if response.status_code == 401:
+                logger.warning("Provider Token Expired (401) during snapshot. Retrying...")
+                self._tokens.invalidate(self._token_key, token)
+                token = await self._get_token()
+                headers["Authorization"] = f"Bearer {token}"
+                response = await self._http.request("GET", url, headers=headers, timeout=60.0)
 
-                logger.info(f"Snapshot status: {response.status_code}")
-                
-                if response.status_code != 200:
-                     logger.error(f"Snapshot request failed. Body: {response.text[:200]}")
-                     response.raise_for_status()
+            logger.info(f"Snapshot status: {response.status_code}")
+            
+            if response.status_code != 200:
+                 logger.error(f"Snapshot request failed. Body: {response.text[:200]}")
+                 response.raise_for_status()
 
-                content = response.text
-                logger.info(f"Snapshot content length: {len(content)}")
-                if len(content) < 1000:
-                    logger.info(f"Snapshot preview: {content}")
-                else:
-                    logger.info(f"Snapshot preview (first 500 chars): {content[:500]}")
+            content = response.text
+            logger.info(f"Snapshot content length: {len(content)}")
+            if len(content) < 1000:
+                logger.info(f"Snapshot preview: {content}")
+            else:
+                logger.info(f"Snapshot preview (first 500 chars): {content[:500]}")
 
-                if not content:
-                    logger.warning("Snapshot content is empty.")
-                    return []
+            if not content:
+                logger.warning("Snapshot content is empty.")
+                return []
 
-                results = []
+            results = []
+            
+            try:
+                data = json.loads(content)
+                snapshot_list = data.get("esims_snapshot_list", [])
+                logger.info(f"Parsed JSON successfully. Found {len(snapshot_list)} items.")
                 
-                try:
-                    data = json.loads(content)
-                    snapshot_list = data.get("esims_snapshot_list", [])
-                    logger.info(f"Parsed JSON successfully. Found {len(snapshot_list)} items.")
+                for item in snapshot_list:
+                    iccid = item.get("ICCID")
+                    activation_code = item.get("ACTIVATION_CODE")
                     
-                    for item in snapshot_list:
-                        iccid = item.get("ICCID")
-                        activation_code = item.get("ACTIVATION_CODE")
-                        
-                        if iccid and activation_code:
-                            results.append({
-                                "iccid": iccid,
-                                "activation_code": activation_code
-                            })
-                    
-                    logger.info(f"Valid records extracted: {len(results)}")
-                    return results
-                    
-                except json.JSONDecodeError:
-                    # Fallback to CSV if JSON parsing fails (just in case provider toggles format)
-                    logger.warning("JSON Decode failed, attempting CSV fallback...")
-                    csv_file = io.StringIO(content)
-                    reader = csv.DictReader(csv_file)
-                    
-                    rows_processed = 0
+                    if iccid and activation_code:
+                        results.append({
+                            "iccid": iccid,
+                            "activation_code": activation_code
+                        })
+                
+                logger.info(f"Valid records extracted: {len(results)}")
+                return results
+                
+            except json.JSONDecodeError:
+                # Fallback to CSV if JSON parsing fails (just in case provider toggles format)
+                logger.warning("JSON Decode failed, attempting CSV fallback...")
+                csv_file = io.StringIO(content)
+                reader = csv.DictReader(csv_file)
+                
+                rows_processed = 0
+                
+                for row in reader:
+                    rows_processed += 1
+                    row_clean = {k.strip(): v for k, v in row.items() if k}
                     
-                    for row in reader:
-                        rows_processed += 1
-                        row_clean = {k.strip(): v for k, v in row.items() if k}
-                        
-                        iccid = row_clean.get("ICCID")
-                        activation_code = row_clean.get("ACTIVATION CODE")
-                        
-                        if iccid and activation_code:
-                            results.append({
-                                "iccid": iccid,
-                                "activation_code": activation_code
-                            })
+                    iccid = row_clean.get("ICCID")
+                    activation_code = row_clean.get("ACTIVATION CODE")
                     
-                    logger.info(f"CSV Parse: Rows processed: {rows_processed}. Valid records: {len(results)}")
-                    return results
+                    if iccid and activation_code:
+                        results.append({
+                            "iccid": iccid,
+                            "activation_code": activation_code
+                        })
+                
+                logger.info(f"CSV Parse: Rows processed: {rows_processed}. Valid records: {len(results)}")
+                return results
 
-            except httpx.HTTPError as e:
-                logger.error(f"Provider Snapshot Failed: {e}")
-                raise AppError(503, "Failed to fetch eSIM snapshot from provider")
-            except Exception as e:
-                logger.error(f"Snapshot Parsing Error: {e}")
-                # Also log stack trace if possible or at least the error
-                import traceback
-                logger.error(traceback.format_exc())
-                raise AppError(500, "Failed to parse provider response")
+        except httpx.HTTPError as e:
+            logger.error(f"Provider Snapshot Failed: {e}")
+            raise AppError(503, "Failed to fetch eSIM snapshot from provider")
+        except Exception as e:
+            logger.error(f"Snapshot Parsing Error: {e}")
+            # Also log stack trace if possible or at least the error
+            import traceback
+            logger.error(traceback.format_exc())
+            raise AppError(500, "Failed to parse provider response")
@@ -0,0 +1,166 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.common.logging import logger
+from app.common.metrics import metrics
+from app.providers.esim_provider.schemas import ImsiListItem
+
+InventoryLoader = Callable[[], Awaitable[List[ImsiListItem]]]
+
+
+@dataclass
+class InventoryDiff:
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    balance_changed: List[str] = field(default_factory=list)
+
+    @property
+    def empty(self) -> bool:
+        return not (self.added or self.removed or self.balance_changed)
+
+
+@dataclass
+class InventorySnapshot:
+    # Insertion order follows the provider's /list order
+    items: Dict[str, ImsiListItem]
+    fetched_at: float
+    version: int
+
+
+InventoryListener = Callable[[InventorySnapshot, InventoryDiff], None]
+
+
+def diff_inventory(old: Dict[str, ImsiListItem], new: Dict[str, ImsiListItem]) -> InventoryDiff:
+    diff = InventoryDiff()
+    for imsi, item in new.items():
+        previous = old.get(imsi)
+        if previous is None:
+            diff.added.append(imsi)
+        elif previous.balance != item.balance:
+            diff.balance_changed.append(imsi)
+    diff.removed = [imsi for imsi in old if imsi not in new]
+    return diff
+
+
+class ImsiInventory:
+    """Process-level snapshot of the reseller inventory (provider ``GET /list``).
+
+    The full list is downloaded at most once per ``refresh_seconds``; concurrent
+    callers share one download. Each refresh is diffed against the previous
+    snapshot and listeners are told which IMSIs were added, removed or had
+    their balance changed. If a refresh fails the previous snapshot is kept.
+    Callers that act on a single IMSI must confirm it with the provider.
+    """
+
+    def __init__(self, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self._snapshot: Optional[InventorySnapshot] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self._listeners: List[InventoryListener] = []
+
+        self.hits = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.last_diff = InventoryDiff()
+
+    def subscribe(self, listener: InventoryListener) -> None:
+        self._listeners.append(listener)
+
+    async def snapshot(self, loader: InventoryLoader, force_refresh: bool = False) -> InventorySnapshot:
+        current = self._snapshot
+        if (
+            current is not None
+            and not force_refresh
+            and time.time() - current.fetched_at < self.refresh_seconds
+        ):
+            self.hits += 1
+            return current
+
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._refresh(loader))
+            self._inflight.add_done_callback(self._clear_inflight)
+        try:
+            return await asyncio.shield(self._inflight)
+        except Exception:
+            if current is None:
+                raise
+            logger.warning("Inventory refresh failed, serving snapshot v%s", current.version)
+            return current
+
+    async def items(self, loader: InventoryLoader, force_refresh: bool = False) -> List[ImsiListItem]:
+        return list((await self.snapshot(loader, force_refresh=force_refresh)).items.values())
+
+    def get(self, imsi: str) -> Optional[ImsiListItem]:
+        return self._snapshot.items.get(imsi) if self._snapshot else None
+
+    def discard(self, imsi: str) -> None:
+        """Drop an IMSI the provider no longer recognises until the next refresh."""
+        if self._snapshot and imsi in self._snapshot.items:
+            items = dict(self._snapshot.items)
+            items.pop(imsi)
+            self._snapshot = InventorySnapshot(
+                items=items, fetched_at=self._snapshot.fetched_at, version=self._snapshot.version
+            )
+
+    async def _refresh(self, loader: InventoryLoader) -> InventorySnapshot:
+        try:
+            fetched = await loader()
+        except Exception:
+            self.failures += 1
+            raise
+        items = {item.imsi: item for item in fetched}
+        previous = self._snapshot
+        diff = diff_inventory(previous.items if previous else {}, items)
+        snapshot = InventorySnapshot(
+            items=items,
+            fetched_at=time.time(),
+            version=(previous.version + 1) if previous else 1,
+        )
+        self._snapshot = snapshot
+        self.refreshes += 1
+        self.last_diff = diff
+
+        if not diff.empty:
+            logger.info(
+                "Inventory v%s: %s IMSIs (+%s -%s ~%s)",
+                snapshot.version,
+                len(items),
+                len(diff.added),
+                len(diff.removed),
+                len(diff.balance_changed),
+            )
+        for listener in self._listeners:
+            try:
+                listener(snapshot, diff)
+            except Exception as exc:
+                logger.warning("Inventory listener failed: %s", exc)
+        return snapshot
+
+    def _clear_inflight(self, task: asyncio.Task) -> None:
+        if self._inflight is task:
+            self._inflight = None
+        if not task.cancelled():
+            task.exception()  # consumed here; awaiting callers re-raise it
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "size": len(snapshot.items) if snapshot else 0,
+            "version": snapshot.version if snapshot else 0,
+            "age_seconds": round(time.time() - snapshot.fetched_at, 1) if snapshot else None,
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_diff": {
+                "added": len(self.last_diff.added),
+                "removed": len(self.last_diff.removed),
+                "balance_changed": len(self.last_diff.balance_changed),
+            },
+        }
+
+
+imsi_inventory = ImsiInventory(refresh_seconds=settings.ESIM_INVENTORY_REFRESH_SECONDS)
+metrics.register("imsi_inventory", imsi_inventory.stats)
@@ -0,0 +1,71 @@
+"""Time until a fresh instance can price eSIMs, with and without a tariff snapshot.
+
+Usage (needs network access to the rates feed):
+
+    python -m benchmarks.tariff_cold_start --rounds 5
+
+"without snapshot" is what a new Cloud Run instance paid before: download
+and parse the imsimarket feed before the first rate lookup. "with snapshot"
+loads the persisted table (file backend here; Firestore is one document read).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from app.core.config import settings
+from app.modules.esim.tariffs import FileTariffSnapshotStore, TariffStore
+
+
+def _store(snapshots=None) -> TariffStore:
+    return TariffStore(
+        url=settings.TARIFF_RATES_URL,
+        refresh_seconds=settings.TARIFF_REFRESH_SECONDS,
+        jitter=settings.TARIFF_REFRESH_JITTER,
+        retry_seconds=settings.TARIFF_REFRESH_RETRY_SECONDS,
+        timeout_seconds=settings.TARIFF_HTTP_TIMEOUT_SECONDS,
+        snapshots=snapshots,
+    )
+
+
+async def _first_lookup_ms(store: TariffStore) -> float:
+    started = time.perf_counter()
+    await store.start(warm_up_timeout=settings.TARIFF_HTTP_TIMEOUT_SECONDS)
+    store.current().best_rate("Kazakhstan")
+    elapsed = (time.perf_counter() - started) * 1000
+    await store.stop()
+    if not len(store.index):
+        raise SystemExit("rates feed unavailable; cannot benchmark")
+    return elapsed
+
+
+def _report(label: str, samples: list) -> None:
+    print(
+        f"{label:<18} median {statistics.median(samples):8.1f} ms   "
+        f"min {min(samples):8.1f} ms   max {max(samples):8.1f} ms"
+    )
+
+
+async def main(rounds: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshots = FileTariffSnapshotStore(os.path.join(tmp, "tariff_snapshot.json"))
+        # Seed the snapshot once, as the first instance of a deployment would
+        seed = _store(snapshots)
+        if not await seed.refresh():
+            raise SystemExit("rates feed unavailable; cannot seed snapshot")
+        print(f"{len(seed.index)} tariffs, snapshot {os.path.getsize(snapshots.path)} bytes\n")
+
+        without = [await _first_lookup_ms(_store()) for _ in range(rounds)]
+        with_snapshot = [await _first_lookup_ms(_store(snapshots)) for _ in range(rounds)]
+
+    _report("without snapshot", without)
+    _report("with snapshot", with_snapshot)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rounds))
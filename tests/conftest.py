@@ -0,0 +1,187 @@
+import itertools
+import os
+
+import pytest
+
+# Keep the app lifespan from starting background loops that reach the network.
+os.environ.setdefault("BACKGROUND_WORKERS_ENABLED", "false")
+
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound  # noqa: E402
+from google.cloud.firestore_v1 import DELETE_FIELD  # noqa: E402
+
+from app.infrastructure import firestore  # noqa: E402
+from app.modules.users.cache import user_cache  # noqa: E402
+
+
+class _WriteOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+class _WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class _Snapshot:
+    def __init__(self, ref, data, update_time):
+        self.id = ref.id
+        self.reference = ref
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+def _merge(current, data):
+    # set(merge=True) merges nested maps field by field, like Firestore
+    merged = dict(current)
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class _DocumentRef:
+    def __init__(self, store, collection, doc_id):
+        self._store = store
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def _key(self):
+        return (self._collection, self.id)
+
+    def _check(self, option):
+        current = self._store.docs.get(self._key)
+        if current is None:
+            raise NotFound("document not found")
+        if option is not None and current[1] != option.last_update_time:
+            raise FailedPrecondition("document changed")
+
+    def _write(self, data):
+        stamp = next(self._store.clock)
+        self._store.docs[self._key] = (data, stamp)
+        return _WriteResult(stamp)
+
+    def get(self):
+        data, stamp = self._store.docs.get(self._key, (None, None))
+        return _Snapshot(self, data, stamp)
+
+    def create(self, data):
+        if self._key in self._store.docs:
+            raise AlreadyExists("document exists")
+        return self._write(dict(data))
+
+    def set(self, data, merge=False):
+        current = self._store.docs.get(self._key, ({}, None))[0] if merge else {}
+        return self._write(_merge(current, data) if merge else dict(data))
+
+    def update(self, data, option=None):
+        self._check(option)
+        merged = {**self._store.docs[self._key][0], **data}
+        return self._write({key: value for key, value in merged.items() if value is not DELETE_FIELD})
+
+    def delete(self, option=None):
+        if option is not None:
+            self._check(option)
+        self._store.docs.pop(self._key, None)
+
+    def collection(self, name):
+        # Subcollections are stored under a "parent/doc_id/name" collection path
+        return _CollectionRef(self._store, f"{self._collection}/{self.id}/{name}")
+
+
+class _Query:
+    _OPS = {
+        "==": lambda a, b: a == b,
+        "!=": lambda a, b: a != b,
+        "<": lambda a, b: a is not None and a < b,
+        "<=": lambda a, b: a is not None and a <= b,
+        ">": lambda a, b: a is not None and a > b,
+        ">=": lambda a, b: a is not None and a >= b,
+        "in": lambda a, b: a in b,
+    }
+
+    def __init__(self, store, collection, filters=(), max_results=None):
+        self._store = store
+        self._collection = collection
+        self._filters = list(filters)
+        self._limit = max_results
+
+    def where(self, field, op, value):
+        return _Query(self._store, self._collection, self._filters + [(field, op, value)], self._limit)
+
+    def limit(self, count):
+        return _Query(self._store, self._collection, self._filters, count)
+
+    def get(self):
+        results = []
+        for (collection, doc_id), (data, stamp) in sorted(self._store.docs.items()):
+            if collection != self._collection:
+                continue
+            if all(self._OPS[op](data.get(field), value) for field, op, value in self._filters):
+                results.append(_Snapshot(_DocumentRef(self._store, collection, doc_id), data, stamp))
+        return results[: self._limit] if self._limit is not None else results
+
+    def stream(self):
+        return iter(self.get())
+
+
+class _CollectionRef(_Query):
+    def document(self, doc_id):
+        return _DocumentRef(self._store, self._collection, doc_id)
+
+
+class _Batch:
+    def __init__(self):
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(lambda: ref.set(data, merge=merge))
+
+    def update(self, ref, data):
+        self._ops.append(lambda: ref.update(data))
+
+    def delete(self, ref):
+        self._ops.append(lambda: ref.delete())
+
+    def commit(self):
+        for op in self._ops:
+            op()
+
+
+class FakeFirestore:
+    """Small in-memory stand-in for the Firestore client used by repository tests."""
+
+    def __init__(self):
+        self.docs = {}
+        self.clock = itertools.count(1)
+
+    def collection(self, name):
+        return _CollectionRef(self, name)
+
+    def batch(self):
+        return _Batch()
+
+    @staticmethod
+    def write_option(last_update_time=None):
+        return _WriteOption(last_update_time)
+
+    def data(self, collection, doc_id):
+        entry = self.docs.get((collection, doc_id))
+        return entry[0] if entry else None
+
+
+@pytest.fixture
+def fake_db():
+    db = FakeFirestore()
+    firestore.set_db(db)
+    user_cache.clear()
+    yield db
+    firestore.set_db(None)
+    user_cache.clear()
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.common.exceptions import ForbiddenError, UnauthorizedError
+from app.core.config import settings
+from app.core.dependencies import get_current_claims, get_current_user, require_app_claims
+from app.core.jwt import VerifiedTokenCache, create_access_token, create_refresh_token
+
+
+def _credentials(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def _claims(token):
+    return asyncio.run(get_current_claims(_credentials(token)))
+
+
+def test_claims_mode_authorizes_without_reading_the_user(fake_db, monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_CLAIMS_MODE", True)
+    claims = _claims(create_access_token({"sub": "u1", "apps": ["vink"]}))
+
+    assert require_app_claims("vink")(claims).user_id == "u1"
+    with pytest.raises(ForbiddenError):
+        require_app_claims("vink-sim")(claims)
+    # No users/u1 document exists, so only a lazy load touches Firestore
+    with pytest.raises(UnauthorizedError):
+        asyncio.run(claims.load_user())
+
+
+def test_user_document_decides_when_claims_mode_is_off(fake_db, monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_CLAIMS_MODE", False)
+    fake_db.collection("users").document("u1").set(
+        {"id": "u1", "phone_number": "+70000000000", "created_at": datetime.utcnow(), "apps_enabled": ["vink-sim"]}
+    )
+    claims = _claims(create_access_token({"sub": "u1", "apps": ["vink"]}))
+
+    assert claims.apps == ["vink-sim"]
+    assert asyncio.run(claims.load_user()).id == "u1"
+
+
+def test_refresh_tokens_are_not_accepted(fake_db, monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_CLAIMS_MODE", True)
+    with pytest.raises(UnauthorizedError):
+        _claims(create_refresh_token({"sub": "u1"}))
+
+
+def test_verified_token_cache_skips_repeat_verification():
+    cache = VerifiedTokenCache(ttl_seconds=60, max_entries=10)
+    token = create_access_token({"sub": "u1"})
+
+    assert cache.decode(token)["sub"] == "u1"
+    assert cache.decode(token)["sub"] == "u1"
+    assert cache.decode(token + "x") is None
+    assert cache.decode(token + "x") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["size"] == 1
+    assert stats["rejected"] == 2
+
+
+def test_refresh_tokens_are_refused_by_get_current_user(fake_db):
+    fake_db.collection("users").document("u1").set(
+        {"id": "u1", "phone_number": "+70000000000", "created_at": datetime.utcnow()}
+    )
+    with pytest.raises(UnauthorizedError):
+        asyncio.run(get_current_user(_credentials(create_refresh_token({"sub": "u1"}))))
+    assert asyncio.run(get_current_user(_credentials(create_access_token({"sub": "u1"})))).id == "u1"
@@ -0,0 +1,177 @@
+import asyncio
+import time
+from datetime import datetime
+
+from app.core.config import settings
+from app.infrastructure.leases import lease_manager
+from app.modules.esim.autopay import AutopayWorker
+from app.modules.esim.service import EsimService
+from app.modules.users.schemas import User
+from app.providers.esim_provider.cache import ImsiInfoResult
+from app.providers.esim_provider.schemas import ImsiInfoResponse
+
+
+def _service():
+    service = EsimService()
+
+    async def _get_esim_by_id(user, esim_id):
+        return esim_id
+
+    service.get_esim_by_id = _get_esim_by_id
+    return service
+
+
+class _ImsiItem:
+    imsi = "imsi1"
+    msisdn = "77000"
+    balance = 0.0
+
+
+class _Provider:
+    async def get_imsi_info(self, imsi):
+        raise RuntimeError("provider down")
+
+
+def test_reassign_clears_previous_owner_autopay_state(fake_db):
+    fake_db.collection("vink_sim_esims").document("e1").set(
+        {
+            "id": "e1",
+            "imsi": "imsi1",
+            "user_id": "old",
+            "status": "unassigned",
+            "autopay_status": "queued",
+            "autopay_queued_ts": 1.0,
+            "autopay_last_attempt_ts": 2.0,
+        }
+    )
+    service = _service()
+    service.provider = _Provider()
+
+    user = User(id="new", created_at=datetime.utcnow())
+    asyncio.run(service._allocate_specific_imsi_to_user(user, _ImsiItem()))
+
+    stored = fake_db.collection("vink_sim_esims").document("e1").get().to_dict()
+    assert stored["user_id"] == "new"
+    assert not [key for key in stored if key.startswith("autopay_")]
+
+
+def test_job_for_reassigned_esim_gets_terminal_status(fake_db):
+    fake_db.collection("vink_sim_esims").document("e1").set(
+        {"id": "e1", "imsi": "imsi1", "user_id": "new", "autopay_status": "queued"}
+    )
+    service = _service()
+
+    outcome = asyncio.run(service.process_autopay_job("e1", {"esim_id": "e1", "user_id": "old"}))
+
+    stored = fake_db.collection("vink_sim_esims").document("e1").get().to_dict()
+    assert outcome == "esim_reassigned"
+    assert stored["autopay_status"] == "skipped"
+    assert stored["autopay_last_status"] == "esim_reassigned"
+
+
+class _LowBalanceProvider:
+    def __init__(self):
+        self.forced_lookups = 0
+
+    async def lookup_imsi_info(self, imsi, force_refresh=False):
+        self.forced_lookups += int(force_refresh)
+        info = ImsiInfoResponse(ICCID="i", IMSI=imsi, MSISDN="77000", BALANCE=5.0, LASTMCC=401)
+        return ImsiInfoResult(info=info, fetched_at=time.time())
+
+
+class _Users:
+    async def get_user(self, user_id):
+        return User(id=user_id, created_at=datetime.utcnow())
+
+
+class _Epay:
+    async def list_saved_cards(self, account_id):
+        return []
+
+    def peek_saved_cards(self, account_id):
+        return None
+
+
+class _Payments:
+    async def list_known_cards(self, user_id):
+        return []
+
+
+def _autopay_service(monkeypatch):
+    monkeypatch.setattr(settings, "EPAY_ESIM_AUTOPAY_ENABLED", True)
+    monkeypatch.setattr(settings, "EPAY_ESIM_AUTOPAY_THRESHOLD_MB", 50.0)
+    service = _service()
+    service.provider = _LowBalanceProvider()
+    service.user_repository = _Users()
+    service.epay = _Epay()
+    service.payment_repository = _Payments()
+
+    async def _rate(last_mcc):
+        return "Kazakhstan", 0.01
+
+    service._resolve_country_and_rate = _rate
+    worker = AutopayWorker(
+        concurrency=1,
+        lease_seconds=60,
+        max_attempts=1,
+        retry_base_seconds=0,
+        recovery_scan_seconds=60,
+        repository=service.repository,
+    )
+    worker._service = service
+    return service, worker
+
+
+def test_read_path_job_waits_for_a_held_lease(fake_db, monkeypatch):
+    fake_db.collection("vink_sim_esims").document("e1").set({"id": "e1", "imsi": "imsi1", "user_id": "u1"})
+    service, worker = _autopay_service(monkeypatch)
+    user = User(id="u1", created_at=datetime.utcnow())
+
+    async def run():
+        esim_data = await service.repository.get_esim("e1")
+        assert await service._maybe_trigger_autopay(user, esim_data, 5.0, 0.01, "Kazakhstan") == "queued"
+
+        lease = await lease_manager.acquire("autopay:e1", 60)
+        assert await worker.process("e1") is None
+        job = fake_db.data("autopay_jobs", "e1")
+        assert job["status"] == "queued"
+        assert fake_db.data("vink_sim_esims", "e1")["autopay_status"] == "queued"
+
+        await lease_manager.release(lease)
+        return await worker.process("e1")
+
+    assert asyncio.run(run()) == "no_saved_card"
+    assert fake_db.data("autopay_jobs", "e1") is None
+    assert fake_db.data("vink_sim_esims", "e1")["autopay_status"] == "skipped"
+
+
+def test_stale_queued_status_without_a_job_is_requeued(fake_db, monkeypatch):
+    fake_db.collection("vink_sim_esims").document("e1").set(
+        {"id": "e1", "imsi": "imsi1", "user_id": "u1", "autopay_status": "queued"}
+    )
+    service, _ = _autopay_service(monkeypatch)
+    user = User(id="u1", created_at=datetime.utcnow())
+
+    async def run():
+        esim_data = await service.repository.get_esim("e1")
+        return await service._maybe_trigger_autopay(user, esim_data, 5.0, 0.01, "Kazakhstan")
+
+    assert asyncio.run(run()) == "queued"
+    assert fake_db.data("autopay_jobs", "e1")["user_id"] == "u1"
+    # With the job in place the same read is a no-op
+    assert asyncio.run(run()) == "in_progress"
+
+
+def test_fresh_sweep_balance_skips_the_forced_lookup(fake_db, monkeypatch):
+    fake_db.collection("vink_sim_esims").document("e1").set({"id": "e1", "imsi": "imsi1", "user_id": "u1"})
+    service, _ = _autopay_service(monkeypatch)
+    job = {"esim_id": "e1", "user_id": "u1", "provider_balance_mb": 500.0, "last_mcc": 401}
+
+    fresh = asyncio.run(service.process_autopay_job("e1", {**job, "balance_checked_at": time.time()}))
+    assert fresh == "not_needed"
+    assert service.provider.forced_lookups == 0
+
+    # A stale (or missing) reading is re-checked against the provider, which reports 5 MB
+    stale = asyncio.run(service.process_autopay_job("e1", {**job, "balance_checked_at": time.time() - 3600}))
+    assert stale == "no_saved_card"
+    assert service.provider.forced_lookups == 1
@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime
+
+from app.core.config import settings
+from app.modules.esim import service as service_module
+from app.modules.esim.service import EsimService
+from app.modules.users.schemas import User
+from app.providers.esim_provider.cache import ImsiInfoResult
+from app.providers.esim_provider.schemas import ImsiInfoResponse, ImsiListItem
+
+
+class _Provider:
+    def __init__(self, balances):
+        self.balances = balances
+        self.list_calls = 0
+
+    async def list_inventory(self, force_refresh=False):
+        self.list_calls += 1
+        return [ImsiListItem(imsi=imsi, msisdn="77000", balance=b) for imsi, b in self.balances.items()]
+
+    async def lookup_imsi_info(self, imsi, force_refresh=False):
+        info = ImsiInfoResponse(ICCID="i", IMSI=imsi, MSISDN="77000", BALANCE=self.balances[imsi], LASTMCC=401)
+        return ImsiInfoResult(info=info, fetched_at=0.0)
+
+
+class _Repository:
+    def __init__(self, esims):
+        self.esims = esims
+
+    async def get_allocated_esims(self):
+        return list(self.esims)
+
+
+class _Users:
+    async def get_user(self, user_id):
+        return User(id=user_id, created_at=datetime.utcnow())
+
+
+def test_sweep_only_considers_low_balance_esims(monkeypatch):
+    service = EsimService()
+    service.provider = _Provider({"1": 10.0, "2": 500.0, "3": 0.0, "4": 5.0})
+    service.repository = _Repository(
+        [
+            {"id": "e1", "imsi": "1", "user_id": "u1"},
+            {"id": "e2", "imsi": "2", "user_id": "u1"},
+            {"id": "e3", "imsi": "3", "user_id": "u2"},
+        ]
+    )
+    service.user_repository = _Users()
+    monkeypatch.setattr(settings, "EPAY_ESIM_AUTOPAY_THRESHOLD_MB", 51.0)
+
+    async def _rate(last_mcc):
+        return "Kazakhstan", 0.01
+
+    decisions = {"e1": "queued", "e3": "cooldown"}
+
+    async def _trigger(user, esim_data, balance, rate, country, **kwargs):
+        return decisions[esim_data["id"]]
+
+    async def _process(esim_id):
+        return "success"
+
+    service._resolve_country_and_rate = _rate
+    service._maybe_trigger_autopay = _trigger
+    monkeypatch.setattr(service_module.autopay_worker, "process", _process)
+
+    report = asyncio.run(service.run_autopay_sweep(concurrency=2))
+
+    assert service.provider.list_calls == 1
+    assert report["candidates"] == 2
+    assert report["charged"] == 1
+    assert report["skipped"] == 1
+    assert report["details"]["skipped"] == [{"esim_id": "e3", "status": "cooldown"}]
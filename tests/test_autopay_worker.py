@@ -0,0 +1,109 @@
+import asyncio
+
+from app.modules.esim.autopay import AutopayWorker, autopay_status_for
+
+
+class _Repository:
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    async def claim_autopay_job(self, esim_id, now_ts, lease_seconds):
+        job = self.jobs.get(esim_id)
+        if not job or job["status"] == "running" or job.get("next_attempt_at", 0) > now_ts:
+            return None
+        job.update(status="running", locked_until=now_ts + lease_seconds, attempts=job.get("attempts", 0) + 1)
+        return dict(job)
+
+    async def update_autopay_job(self, esim_id, fields):
+        self.jobs[esim_id].update(fields)
+
+    async def delete_autopay_job(self, esim_id):
+        self.jobs.pop(esim_id, None)
+
+    async def list_due_autopay_jobs(self, now_ts, limit=100):
+        return [esim_id for esim_id, job in self.jobs.items() if job["status"] == "queued"]
+
+
+class _Service:
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        self.statuses = {}
+
+    async def process_autopay_job(self, esim_id, job):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def set_autopay_status(self, esim_id, status, last_status=None):
+        self.statuses[esim_id] = status
+
+
+def _worker(repository, service, max_attempts=2):
+    worker = AutopayWorker(
+        concurrency=1,
+        lease_seconds=60,
+        max_attempts=max_attempts,
+        retry_base_seconds=0,
+        recovery_scan_seconds=60,
+        repository=repository,
+    )
+    worker._service = service
+    return worker
+
+
+def test_completed_job_is_removed():
+    repository = _Repository({"e1": {"status": "queued"}})
+    worker = _worker(repository, _Service(["success"]))
+
+    assert asyncio.run(worker.process("e1")) == "success"
+    assert "e1" not in repository.jobs
+    assert asyncio.run(worker.process("e1")) is None
+
+
+def test_errors_are_retried_then_marked_failed():
+    repository = _Repository({"e1": {"status": "queued"}})
+    service = _Service([RuntimeError("firestore down"), RuntimeError("firestore down")])
+    worker = _worker(repository, service, max_attempts=2)
+
+    assert asyncio.run(worker.process("e1")) is None
+    assert repository.jobs["e1"]["status"] == "queued"
+    assert asyncio.run(worker.process("e1")) == "error"
+    assert "e1" not in repository.jobs
+    assert service.statuses["e1"] == "failed"
+
+
+def test_lease_contention_requeues_without_spending_an_attempt():
+    repository = _Repository({"e1": {"status": "queued", "attempts": 0}})
+    service = _Service(["lease_busy", "success"])
+    worker = _worker(repository, service, max_attempts=1)
+
+    assert asyncio.run(worker.process("e1")) is None
+    assert repository.jobs["e1"]["status"] == "queued"
+    assert repository.jobs["e1"]["attempts"] == 0
+    assert "e1" not in service.statuses
+    assert asyncio.run(worker.process("e1")) == "success"
+    assert worker.stats()["deferred"] == 1
+
+
+def test_started_worker_drains_recovered_jobs():
+    repository = _Repository({"e1": {"status": "queued"}, "e2": {"status": "queued"}})
+    worker = _worker(repository, _Service(["success", "no_saved_card"]))
+
+    async def run():
+        await worker.start()
+        for _ in range(50):
+            if not repository.jobs:
+                break
+            await asyncio.sleep(0.01)
+        await worker.stop()
+
+    asyncio.run(run())
+    assert repository.jobs == {}
+    assert worker.stats()["processed"] == 2
+
+
+def test_status_mapping():
+    assert autopay_status_for("success") == "succeeded"
+    assert autopay_status_for("payment_declined") == "failed"
+    assert autopay_status_for("no_saved_card") == "skipped"
@@ -0,0 +1,82 @@
+import asyncio
+
+from app.modules.payment import service as payment_service
+from app.modules.payment.checkout import PaymentTokenCache
+from app.modules.payment.repository import PaymentRepository
+from app.modules.payment.schemas import PaymentRecord
+from app.modules.payment.service import PaymentService
+from app.providers.epay.schemas import EpayTokenResponse
+
+
+class _Epay:
+    terminal_id = "terminal-1"
+
+    def __init__(self):
+        self.token_requests = 0
+
+    async def obtain_payment_token(self, **kwargs):
+        self.token_requests += 1
+        await asyncio.sleep(0.01)
+        return EpayTokenResponse(
+            access_token=f"token-{self.token_requests}", expires_in=1200, scope="payment", token_type="Bearer"
+        )
+
+
+def _service(monkeypatch):
+    monkeypatch.setattr(
+        payment_service, "payment_token_cache", PaymentTokenCache(max_entries=10, expiry_margin_seconds=60)
+    )
+    service = PaymentService.__new__(PaymentService)
+    service.repo = PaymentRepository()
+    service.epay = _Epay()
+    return service
+
+
+async def _create_checkout(service):
+    record = PaymentRecord(
+        id="p1",
+        user_id="u1",
+        invoice_id="123456789",
+        amount=5,
+        back_link="vinksim://payment-return?result=success",
+        description="Top-up </script>",
+    )
+    await service.repo.create_payment(record)
+    await service.repo.create_checkout_mapping("p1", "u1", "secret")
+
+
+def _token(access_token):
+    return EpayTokenResponse(access_token=access_token, expires_in=1200, scope="payment", token_type="Bearer")
+
+
+def test_checkout_reuses_token_from_initiate_without_persisting_it(fake_db, monkeypatch):
+    service = _service(monkeypatch)
+
+    async def run():
+        await _create_checkout(service)
+        payment_service.payment_token_cache.put(
+            "p1", payment_service.payment_token_cache.session_for(_token("from-initiate"))
+        )
+        return [await service.get_checkout_html("p1", "secret") for _ in range(3)]
+
+    pages = asyncio.run(run())
+    assert service.epay.token_requests == 0
+    assert '"access_token":"from-initiate"' in pages[0]
+    assert pages[0] == pages[2]
+    # User-controlled text cannot close the inline script
+    assert "Top-up <\\/script>" in pages[0]
+    assert "payment_token" not in fake_db.data("payment_checkout", "p1")
+
+
+def test_token_is_requested_once_for_concurrent_reloads(fake_db, monkeypatch):
+    # e.g. the instance that served initiate was replaced, or the token neared expiry
+    service = _service(monkeypatch)
+
+    async def run():
+        await _create_checkout(service)
+        return await asyncio.gather(*(service.get_checkout_html("p1", "secret") for _ in range(3)))
+
+    pages = asyncio.run(run())
+    assert service.epay.token_requests == 1
+    assert all('"access_token":"token-1"' in page for page in pages)
+    assert "payment_token" not in fake_db.data("payment_checkout", "p1")
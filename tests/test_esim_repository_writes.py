@@ -0,0 +1,47 @@
+import asyncio
+
+from google.cloud.firestore_v1 import DELETE_FIELD
+
+from app.infrastructure.documents import TrackedDocument
+from app.modules.esim.repository import EsimRepository, esim_write_stats
+
+
+def test_tracked_document_reports_changed_and_removed_fields():
+    doc = TrackedDocument({"id": "e1", "iccid": "old", "autopay_in_progress": False, "meta": {"a": 1}})
+    assert doc.changes() == {}
+
+    doc["iccid"] = "new"
+    doc["meta"]["a"] = 2
+    doc.pop("autopay_in_progress")
+    assert doc.changes() == {"iccid": "new", "meta": {"a": 2}, "autopay_in_progress": DELETE_FIELD}
+
+    doc.mark_clean()
+    assert not doc.dirty
+
+
+def test_save_esim_writes_only_changes_and_batches_many(fake_db):
+    fake_db.collection("vink_sim_esims").document("e1").set({"id": "e1", "user_id": "u1", "iccid": "a", "name": "x"})
+    fake_db.collection("vink_sim_esims").document("e2").set({"id": "e2", "user_id": "u1", "iccid": "b", "name": "y"})
+    repository = EsimRepository()
+    before = esim_write_stats.stats()
+
+    async def run():
+        esim = await repository.get_esim("e1")
+        await repository.save_esim(esim)  # untouched: no write
+        esim["name"] = "renamed"
+        await repository.save_esim(esim)
+
+        esims = await repository.get_user_esims("u1")
+        for item in esims:
+            item["iccid"] = item["iccid"] + "-synced"
+        return await repository.save_esims(esims)
+
+    flushed = asyncio.run(run())
+    after = esim_write_stats.stats()
+
+    assert flushed == 2
+    assert fake_db.data("vink_sim_esims", "e1") == {"id": "e1", "user_id": "u1", "iccid": "a-synced", "name": "renamed"}
+    assert after["skipped_noop_writes"] - before["skipped_noop_writes"] == 1
+    assert after["partial_updates"] - before["partial_updates"] == 3
+    assert after["batches"] - before["batches"] == 1
+    assert after["full_writes"] == before["full_writes"]
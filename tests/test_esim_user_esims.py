@@ -0,0 +1,74 @@
+import asyncio
+import time
+from datetime import datetime
+
+from app.core.config import settings
+from app.modules.esim.service import EsimService
+from app.modules.esim.tariffs import EMPTY_TARIFF_INDEX
+from app.modules.users.schemas import User
+from app.providers.esim_provider.cache import ImsiInfoResult
+from app.providers.esim_provider.schemas import ImsiInfoResponse
+
+
+class _FakeRepository:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def get_user_esims(self, user_id):
+        return [dict(doc) for doc in self.docs]
+
+    async def save_esim(self, esim_data):
+        pass
+
+    async def save_esims(self, esims):
+        self.flushed = [esim["id"] for esim in esims if esim["iccid"] != "old"]
+
+
+class _SlowProvider:
+    def __init__(self, delays):
+        self.delays = delays
+
+    async def lookup_imsi_info(self, imsi):
+        await asyncio.sleep(self.delays[imsi])
+        info = ImsiInfoResponse(ICCID=f"iccid-{imsi}", IMSI=imsi, MSISDN="77000", BALANCE=500.0)
+        return ImsiInfoResult(info=info, fetched_at=time.time())
+
+    def peek_imsi_info(self, imsi):
+        return None
+
+
+def test_get_user_esims_runs_lookups_concurrently_and_tolerates_timeouts(monkeypatch):
+    monkeypatch.setattr(settings, "ESIM_PROVIDER_SYNC_CONCURRENCY", 5)
+    monkeypatch.setattr(settings, "ESIM_PROVIDER_SYNC_TIMEOUT_SECONDS", 0.2)
+    monkeypatch.setattr(settings, "EPAY_ESIM_AUTOPAY_ENABLED", False)
+
+    docs = [
+        {"id": f"e{i}", "imsi": f"imsi{i}", "data_limit": 1000.0, "iccid": "old", "msisdn": "48000"}
+        for i in range(5)
+    ]
+    delays = {f"imsi{i}": 0.1 for i in range(4)}
+    delays["imsi4"] = 5.0  # never answers within the per-item timeout
+
+    service = EsimService()
+    service.repository = _FakeRepository(docs)
+    service.provider = _SlowProvider(delays)
+
+    async def _no_tariffs():
+        return EMPTY_TARIFF_INDEX
+
+    service.get_tariff_index = _no_tariffs
+    user = User(id="u1", created_at=datetime.utcnow())
+
+    started = time.perf_counter()
+    esims = asyncio.run(service.get_user_esims(user))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 1.0
+    assert [e.id for e in esims] == ["e0", "e1", "e2", "e3", "e4"]
+    assert esims[0].iccid == "iccid-imsi0"
+    assert esims[0].provider_balance == 500.0
+    # Timed-out eSIM is still returned from the stored document
+    assert esims[4].iccid == "old"
+    assert esims[4].provider_balance == 0.0
+    # ICCID sync is flushed once for the whole list
+    assert service.repository.flushed == ["e0", "e1", "e2", "e3"]
@@ -0,0 +1,64 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from app.infrastructure import firestore
+from app.modules.users.repository import UserRepository
+
+
+class _Snapshot:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return self._data
+
+
+def test_shim_makes_sync_client_awaitable():
+    fake = MagicMock()
+    fake.collection.return_value.document.return_value.get.return_value = _Snapshot(
+        {"id": "u1", "created_at": "2025-01-01T00:00:00"}
+    )
+    firestore.set_db(fake)
+    try:
+        user = asyncio.run(UserRepository().get_user("u1"))
+    finally:
+        firestore.set_db(None)
+
+    assert user.id == "u1"
+    fake.collection.assert_called_with("users")
+    fake.collection.return_value.document.assert_called_with("u1")
+
+
+def test_shim_batch_stages_synchronously_and_commits_async():
+    fake = MagicMock()
+    firestore.set_db(fake)
+    try:
+        db = firestore.get_db()
+        batch = db.batch()
+        ref = db.collection("users").document("u1")
+        batch.update(ref, {"balance": 1})
+        asyncio.run(batch.commit())
+    finally:
+        firestore.set_db(None)
+
+    fake.batch.return_value.update.assert_called_with(
+        fake.collection.return_value.document.return_value, {"balance": 1}
+    )
+    fake.batch.return_value.commit.assert_called_once()
+
+
+def test_singletons_follow_the_current_client():
+    from app.infrastructure.leases import lease_manager
+    from app.modules.esim.allocator import free_imsi_allocator
+
+    first, second = object(), object()
+    try:
+        firestore.set_db(first, sync=False)
+        assert lease_manager.db is first
+        assert free_imsi_allocator.repository.db is first
+        firestore.set_db(second, sync=False)
+        assert lease_manager.db is second
+        assert free_imsi_allocator.repository.db is second
+    finally:
+        firestore.set_db(None)
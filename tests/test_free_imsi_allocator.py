@@ -0,0 +1,125 @@
+import asyncio
+
+from app.modules.esim.allocator import FreeImsiAllocator
+from app.providers.esim_provider.schemas import ImsiListItem
+
+
+class _Repository:
+    def __init__(self, allocated=(), reserved=()):
+        self.allocated = {imsi: {"imsi": imsi, "user_id": "someone"} for imsi in allocated}
+        self.reservations = {imsi: {} for imsi in reserved}
+        self.scans = 0
+
+    async def get_all_allocated_imsis(self):
+        self.scans += 1
+        return list(self.allocated)
+
+    async def get_reserved_imsis(self):
+        return list(self.reservations)
+
+    async def create_reservation(self, imsi, payload):
+        if imsi in self.reservations:
+            return False
+        self.reservations[imsi] = payload
+        return True
+
+    async def delete_reservation(self, imsi):
+        self.reservations.pop(imsi, None)
+
+    async def get_esim_by_imsi(self, imsi):
+        return self.allocated.get(imsi)
+
+
+class _Provider:
+    def __init__(self, imsis):
+        self.imsis = imsis
+
+    async def list_inventory(self):
+        return [ImsiListItem(imsi=imsi, msisdn="77000", balance=1.0) for imsi in self.imsis]
+
+
+def test_acquire_skips_taken_imsis_without_rescanning():
+    repository = _Repository(allocated=["1"], reserved=["2"])
+    allocator = FreeImsiAllocator(repository=repository)
+    provider = _Provider(["1", "2", "3", "4", "5"])
+
+    async def run():
+        return [await allocator.acquire(provider, {}) for _ in range(3)]
+
+    first, second, third = asyncio.run(run())
+    assert [first.imsi, second.imsi] == ["3", "4"]
+    assert third.imsi == "5"
+    assert repository.scans == 1
+
+
+def test_conflicts_from_other_instances_are_skipped():
+    repository = _Repository()
+    allocator = FreeImsiAllocator(repository=repository)
+    provider = _Provider(["1", "2", "3"])
+
+    async def run():
+        await allocator.rebuild(provider)
+        # Another instance reserved "1" and allocated "2" after our rebuild
+        repository.reservations["1"] = {}
+        repository.allocated["2"] = {"imsi": "2", "user_id": "other"}
+        return await allocator.acquire(provider, {})
+
+    item = asyncio.run(run())
+    assert item.imsi == "3"
+    assert allocator.stats()["conflicts"] == 2
+    assert "2" not in repository.reservations
+
+
+def test_concurrent_acquires_get_distinct_imsis_and_release_returns_them():
+    repository = _Repository()
+    allocator = FreeImsiAllocator(repository=repository)
+    provider = _Provider(["1", "2"])
+
+    async def run():
+        items = await asyncio.gather(*(allocator.acquire(provider, {}) for _ in range(3)))
+        await repository.delete_reservation("1")
+        allocator.release("1")
+        again = await allocator.acquire(provider, {})
+        return items, again
+
+    items, again = asyncio.run(run())
+    assert sorted(item.imsi for item in items if item) == ["1", "2"]
+    assert items.count(None) == 1
+    assert again.imsi == "1"
+
+
+def test_firestore_error_keeps_imsi_in_pool():
+    repository = _Repository()
+    allocator = FreeImsiAllocator(repository=repository)
+    provider = _Provider(["1", "2"])
+    create_reservation = repository.create_reservation
+
+    async def unavailable(imsi, payload):
+        raise RuntimeError("firestore unavailable")
+
+    async def run():
+        await allocator.rebuild(provider)
+        repository.create_reservation = unavailable
+        try:
+            await allocator.acquire(provider, {})
+        except RuntimeError:
+            pass
+        repository.create_reservation = create_reservation
+        return [await allocator.acquire(provider, {}) for _ in range(2)]
+
+    items = asyncio.run(run())
+    assert sorted(item.imsi for item in items) == ["1", "2"]
+    assert allocator.stats()["conflicts"] == 0
+
+
+def test_empty_pool_is_not_rescanned_per_purchase():
+    repository = _Repository(allocated=["1"])
+    allocator = FreeImsiAllocator(repository=repository, min_rebuild_seconds=60)
+    provider = _Provider(["1"])
+
+    async def run():
+        return [await allocator.acquire(provider, {}) for _ in range(3)]
+
+    assert asyncio.run(run()) == [None, None, None]
+    assert repository.scans == 1
+    assert allocator.stats()["empty"] == 3
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from app.providers.esim_provider.cache import ImsiInfoCache
+from app.providers.esim_provider.schemas import ImsiInfoResponse
+
+
+def _cache(**overrides):
+    params = dict(ttl_seconds=60.0, revalidate_seconds=60.0, max_stale_seconds=3600.0, max_entries=10)
+    params.update(overrides)
+    return ImsiInfoCache(**params)
+
+
+class _Loader:
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    async def __call__(self, imsi):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("provider down")
+        return ImsiInfoResponse(ICCID="iccid", IMSI=imsi, MSISDN="77000", BALANCE=float(self.calls))
+
+
+def test_fresh_entries_are_served_from_cache():
+    cache, loader = _cache(), _Loader()
+
+    async def run():
+        first = await cache.get("250", loader)
+        second = await cache.get("250", loader)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert loader.calls == 1
+    assert second.info.BALANCE == first.info.BALANCE
+    assert not second.stale
+
+
+def test_concurrent_misses_share_one_provider_call():
+    cache, loader = _cache(), _Loader()
+
+    async def run():
+        return await asyncio.gather(*(cache.get("250", loader) for _ in range(5)))
+
+    asyncio.run(run())
+    assert loader.calls == 1
+
+
+def test_provider_failure_serves_stale_entry():
+    cache, loader = _cache(ttl_seconds=0.0, revalidate_seconds=0.0), _Loader()
+
+    async def run():
+        await cache.get("250", loader)
+        loader.fail = True
+        return await cache.get("250", loader)
+
+    result = asyncio.run(run())
+    assert result.stale
+    assert cache.stats()["stale_served"] == 1
+
+
+def test_invalidate_forces_reload_and_failure_without_entry_raises():
+    cache, loader = _cache(), _Loader()
+
+    async def run():
+        await cache.get("250", loader)
+        cache.invalidate("250")
+        loader.fail = True
+        await cache.get("250", loader)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert loader.calls == 2
+
+
+def test_refresh_after_invalidation_does_not_join_older_load():
+    cache, loader = _cache(), _Loader()
+
+    async def run():
+        before_write = asyncio.create_task(cache.get("250", loader))
+        await asyncio.sleep(0)
+        cache.invalidate("250")
+        after_write = await cache.get("250", loader, force_refresh=True)
+        await before_write
+        cached = await cache.get("250", loader)
+        return after_write, cached
+
+    after_write, cached = asyncio.run(run())
+    assert loader.calls == 2
+    assert after_write.info.BALANCE == 2.0
+    assert cached.info.BALANCE == 2.0
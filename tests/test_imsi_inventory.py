@@ -0,0 +1,64 @@
+import asyncio
+
+from app.providers.esim_provider.inventory import ImsiInventory
+from app.providers.esim_provider.schemas import ImsiListItem
+
+
+class _Provider:
+    def __init__(self, items):
+        self.items = items
+        self.calls = 0
+        self.fail = False
+
+    async def list_imsis(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("provider down")
+        return [ImsiListItem(imsi=imsi, msisdn="77000", balance=balance) for imsi, balance in self.items]
+
+
+def test_snapshot_is_shared_until_refresh_interval():
+    inventory = ImsiInventory(refresh_seconds=60.0)
+    provider = _Provider([("1", 10.0), ("2", 20.0)])
+
+    async def run():
+        results = await asyncio.gather(*(inventory.items(provider.list_imsis) for _ in range(5)))
+        await inventory.items(provider.list_imsis)
+        return results
+
+    results = asyncio.run(run())
+    assert provider.calls == 1
+    assert [item.imsi for item in results[0]] == ["1", "2"]
+
+
+def test_refresh_reports_diff_to_listeners():
+    inventory = ImsiInventory(refresh_seconds=60.0)
+    provider = _Provider([("1", 10.0), ("2", 20.0)])
+    diffs = []
+    inventory.subscribe(lambda snapshot, diff: diffs.append(diff))
+
+    async def run():
+        await inventory.snapshot(provider.list_imsis)
+        provider.items = [("2", 15.0), ("3", 30.0)]
+        return await inventory.snapshot(provider.list_imsis, force_refresh=True)
+
+    snapshot = asyncio.run(run())
+    assert snapshot.version == 2
+    assert diffs[-1].added == ["3"]
+    assert diffs[-1].removed == ["1"]
+    assert diffs[-1].balance_changed == ["2"]
+
+
+def test_failed_refresh_keeps_previous_snapshot():
+    inventory = ImsiInventory(refresh_seconds=60.0)
+    provider = _Provider([("1", 10.0)])
+
+    async def run():
+        await inventory.snapshot(provider.list_imsis)
+        provider.fail = True
+        return await inventory.snapshot(provider.list_imsis, force_refresh=True)
+
+    snapshot = asyncio.run(run())
+    assert list(snapshot.items) == ["1"]
+    assert inventory.stats()["failures"] == 1
@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+from app.infrastructure.leases import LeaseManager
+
+
+def test_only_one_holder_until_release(fake_db):
+    leases = LeaseManager()
+
+    async def run():
+        first = await leases.acquire("autopay:e1", 60)
+        second = await leases.acquire("autopay:e1", 60)
+        await leases.release(first)
+        third = await leases.acquire("autopay:e1", 60)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first is not None and not first.taken_over
+    assert second is None
+    assert third is not None
+    assert leases.stats()["contended"] == 1
+
+
+def test_expired_lease_is_taken_over_once(fake_db):
+    leases = LeaseManager()
+
+    async def run():
+        stale = await leases.acquire("autopay:e1", 60)
+        fake_db.data("leases", "autopay:e1")["expires_at"] = time.time() - 1
+        winners = await asyncio.gather(*(leases.acquire("autopay:e1", 60) for _ in range(3)))
+        await leases.release(stale)
+        return [w for w in winners if w]
+
+    winners = asyncio.run(run())
+    assert len(winners) == 1
+    assert winners[0].taken_over
+    stats = leases.stats()
+    assert stats["takeovers"] == 1
+    # The crashed holder's late release must not delete the new lease
+    assert stats["lost"] == 1
+    assert fake_db.data("leases", "autopay:e1")["holder"] == winners[0].holder
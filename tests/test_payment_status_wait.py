@@ -0,0 +1,82 @@
+import asyncio
+
+from app.modules.payment.notifier import PaymentStatusNotifier
+from app.modules.payment.repository import PaymentRepository
+from app.modules.payment.schemas import PaymentRecord, PaymentStatus
+from app.modules.payment.service import PaymentService
+
+
+def _service():
+    service = PaymentService.__new__(PaymentService)
+    service.repo = PaymentRepository()
+    return service
+
+
+def _settle_later(repository, record, delay=0.02):
+    async def settle():
+        await asyncio.sleep(delay)
+        record.status = PaymentStatus.CHARGE
+        await repository.update_payment(record)
+
+    return asyncio.create_task(settle())
+
+
+def test_wait_returns_when_payment_is_settled(fake_db):
+    service = _service()
+    record = PaymentRecord(id="p1", user_id="u1", invoice_id="INV1", amount=5)
+
+    async def run():
+        await service.repo.create_payment(record)
+        settle = _settle_later(service.repo, record.model_copy())
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await service.wait_for_payment_status("u1", "p1", timeout_seconds=10)
+        await settle
+        return result, loop.time() - started
+
+    result, elapsed = asyncio.run(run())
+    assert result.status == PaymentStatus.CHARGE
+    assert elapsed < 1
+
+
+def test_wait_times_out_with_pending_status(fake_db):
+    service = _service()
+
+    async def run():
+        await service.repo.create_payment(PaymentRecord(id="p1", user_id="u1", invoice_id="INV1", amount=5))
+        return await service.wait_for_payment_status("u1", "p1", timeout_seconds=0.05)
+
+    assert asyncio.run(run()).status == PaymentStatus.PENDING
+
+
+def test_event_stream_sends_initial_and_final_status(fake_db):
+    service = _service()
+    record = PaymentRecord(id="p1", user_id="u1", invoice_id="INV1", amount=5)
+
+    async def run():
+        await service.repo.create_payment(record)
+        settle = _settle_later(service.repo, record.model_copy())
+        events = await service.stream_payment_status("u1", "p1", timeout_seconds=10)
+        chunks = [chunk async for chunk in events]
+        await settle
+        return chunks
+
+    chunks = [chunk for chunk in asyncio.run(run()) if chunk.startswith("event:")]
+    assert len(chunks) == 2
+    assert '"status":"pending"' in chunks[0].replace(" ", "")
+    assert '"status":"charge"' in chunks[1].replace(" ", "")
+
+
+def test_notifier_drops_waiters_after_timeout():
+    notifier = PaymentStatusNotifier()
+
+    async def run():
+        assert await notifier.wait("p1", 0.01) is None
+        waiter = asyncio.create_task(notifier.wait("p1", 1))
+        await asyncio.sleep(0)
+        notifier.publish("p1", "charge")
+        return await waiter
+
+    assert asyncio.run(run()) == "charge"
+    assert notifier.stats()["waiters"] == 0
+    assert notifier.stats()["woken"] == 1
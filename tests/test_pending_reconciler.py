@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.modules.payment.reconciler import PendingPaymentReconciler
+from app.modules.payment.repository import PaymentRepository
+from app.modules.payment.schemas import PaymentRecord, PaymentStatus
+
+
+class _Service:
+    def __init__(self, repository):
+        self.repository = repository
+        self.active = 0
+        self.max_active = 0
+        self.seen = []
+
+    async def reconcile_pending_payment(self, record):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        self.seen.append(record.id)
+        record.status = PaymentStatus.FAILED
+        record.reason = "expired_pending_timeout"
+        await self.repository.update_payment(record)
+        return record
+
+
+def _record(payment_id, minutes_old, status=PaymentStatus.PENDING):
+    return PaymentRecord(
+        id=payment_id,
+        user_id="u1",
+        invoice_id=f"INV-{payment_id}",
+        amount=5,
+        status=status,
+        created_at=datetime.utcnow() - timedelta(minutes=minutes_old),
+    )
+
+
+def test_reconciler_resolves_only_stale_pending_payments(fake_db):
+    repository = PaymentRepository()
+    reconciler = PendingPaymentReconciler(interval_seconds=0, concurrency=2, batch_size=50, repository=repository)
+    service = _Service(repository)
+    reconciler._service = service
+
+    async def run():
+        for record in (
+            _record("old-1", 60),
+            _record("old-2", 45),
+            _record("old-3", 30),
+            _record("fresh", 1),
+            _record("done", 60, status=PaymentStatus.CHARGE),
+        ):
+            await repository.create_payment(record)
+        return await reconciler.run_once()
+
+    assert asyncio.run(run()) == 3
+    assert sorted(service.seen) == ["old-1", "old-2", "old-3"]
+    assert service.max_active == 2
+    assert fake_db.data("payment_records", "old-1")["status"] == "failed"
+    assert fake_db.data("payment_records", "fresh")["status"] == "pending"
+    assert reconciler.stats()["expired"] == 3
+
+    # Resolved payments drop out of the pending index
+    assert asyncio.run(reconciler.run_once()) == 0
+
+
+def test_is_stale_uses_pending_ttl():
+    assert PendingPaymentReconciler.is_stale(_record("p", 60))
+    assert not PendingPaymentReconciler.is_stale(_record("p", 1))
+    assert not PendingPaymentReconciler.is_stale(_record("p", 60, status=PaymentStatus.AUTH))
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from app.providers.epay.cards import SavedCardCache
+from app.providers.epay.schemas import EpaySavedCard
+
+
+class _Loader:
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    async def __call__(self, account_id):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("ePay down")
+        return [EpaySavedCard(ID="c1", CardMask="4400-XXXX-1111")]
+
+
+def test_concurrent_lookups_share_one_epay_call():
+    cache = SavedCardCache(ttl_seconds=60, max_stale_seconds=600, max_entries=10)
+    loader = _Loader()
+
+    async def run():
+        first = await asyncio.gather(*(cache.get("u1", loader) for _ in range(5)))
+        again = await cache.get("u1", loader)
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert loader.calls == 1
+    assert [card.ID for card in again] == ["c1"]
+    assert cache.stats()["fresh_hits"] == 1
+
+
+def test_stale_list_is_served_when_epay_fails():
+    cache = SavedCardCache(ttl_seconds=0, max_stale_seconds=600, max_entries=10)
+    loader = _Loader()
+
+    async def run():
+        await cache.get("u1", loader)
+        loader.fail = True
+        return await cache.get("u1", loader)
+
+    assert [card.ID for card in asyncio.run(run())] == ["c1"]
+    assert cache.stats()["stale_served"] == 1
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get("u2", loader))
+
+
+def test_invalidate_and_upsert():
+    cache = SavedCardCache(ttl_seconds=60, max_stale_seconds=600, max_entries=10)
+    loader = _Loader()
+
+    async def run():
+        await cache.get("u1", loader)
+        cache.upsert("u1", EpaySavedCard(ID="c2"))
+        with_new = await cache.get("u1", loader)
+        cache.invalidate("u1")
+        reloaded = await cache.get("u1", loader)
+        return with_new, reloaded
+
+    with_new, reloaded = asyncio.run(run())
+    assert [card.ID for card in with_new] == ["c1", "c2"]
+    assert [card.ID for card in reloaded] == ["c1"]
+    assert loader.calls == 2
+    # Accounts that were never loaded are not populated by upserts
+    cache.upsert("u3", EpaySavedCard(ID="c3"))
+    assert cache.peek("u3") is None
@@ -0,0 +1,45 @@
+from datetime import datetime
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app.core.container import ServiceContainer, container
+from app.main import app
+from app.core.dependencies import get_current_user
+from app.modules.users.schemas import User
+
+
+def test_services_are_built_once_and_share_clients():
+    services = ServiceContainer()
+
+    payment = services.payment_service
+    assert services.payment_service is payment
+    assert payment.esim_service is services.esim_service
+    assert payment.wallet_service is services.wallet_service
+    assert payment.epay is services.epay
+    assert services.esim_service.epay is services.epay
+    assert services.esim_service.provider is services.esim_provider
+    assert services.user_service.esim_service is services.esim_service
+
+    services.reset()
+    assert services.payment_service is not payment
+
+
+def test_override_replaces_service_for_requests(fake_db):
+    user = User(id="u1", phone_number="+70000000000", created_at=datetime.utcnow())
+
+    class _Users:
+        async def get_profile(self, user_id):
+            return user
+
+    app.dependency_overrides[get_current_user] = lambda: user
+    container.override(user_service=_Users())
+    try:
+        with patch("app.main.init_firestore"), TestClient(app) as client:
+            response = client.get("/api/v1/user/profile")
+    finally:
+        app.dependency_overrides.clear()
+        container.reset()
+
+    assert response.status_code == 200
+    assert response.json()["data"]["id"] == "u1"
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import pytest
+
+from app.modules.esim import tariffs
+from app.modules.esim.schemas import Tariff
+from app.modules.esim.tariffs import TariffIndex, TariffStore
+
+
+def _tariff(plmn, network, country, rate):
+    return Tariff(plmn=plmn, network_name=network, country_name=country, data_rate=rate)
+
+
+def test_index_answers_country_and_plmn_lookups():
+    index = TariffIndex(
+        [
+            _tariff("KAZKT", "Kcell", "Kazakhstan", 0.02),
+            _tariff("KAZ77", "Tele2", "Kazakhstan", 0.01),
+            _tariff("TURTC", "Turkcell", "Turkey", 0.05),
+        ]
+    )
+
+    assert index.best_rate("Kazakhstan") == 0.01
+    assert [t.network_name for t in index.networks("Kazakhstan")] == ["Tele2", "Kcell"]
+    assert index.by_plmn("TURTC").country_name == "Turkey"
+    assert index.best_rate("Atlantis") is None
+    assert index.networks("Atlantis") == []
+    assert index.stats()["countries"] == 2
+
+
+def test_store_keeps_last_good_index_when_refresh_fails(monkeypatch):
+    store = TariffStore(url="http://rates.invalid", refresh_seconds=3600, jitter=0.1, retry_seconds=60, timeout_seconds=1)
+    feed = [{"PLMN": "KAZKT", "NetworkName": "Kcell", "CountryName": "Kazakhstan", "DataRate": 0.02}]
+
+    class _Response:
+        def raise_for_status(self):
+            if feed is None:
+                raise RuntimeError("rates feed down")
+
+        def json(self):
+            return feed
+
+    class _Client:
+        def __init__(self, **kwargs):
+            pass
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def get(self, url):
+            return _Response()
+
+    monkeypatch.setattr(tariffs.httpx, "AsyncClient", _Client)
+
+    assert asyncio.run(store.refresh())
+    feed = None
+    assert not asyncio.run(store.refresh())
+    assert store.current().best_rate("Kazakhstan") == 0.02
+    assert store.stats()["failures"] == 1
+    assert 3240 <= store.next_delay(True) <= 3960
+
+
+def test_start_serves_persisted_snapshot_without_downloading(tmp_path):
+    snapshots = tariffs.FileTariffSnapshotStore(str(tmp_path / "tariff_snapshot.json"))
+    snapshot = tariffs.TariffSnapshot.from_tariffs(
+        [_tariff("KAZKT", "Kcell", "Kazakhstan", 0.02)], fetched_at=time.time()
+    )
+    asyncio.run(snapshots.save(snapshot))
+
+    store = TariffStore(
+        url="http://rates.invalid",
+        refresh_seconds=3600,
+        jitter=0.1,
+        retry_seconds=60,
+        timeout_seconds=1,
+        snapshots=snapshots,
+    )
+
+    async def run():
+        await store.start(warm_up_timeout=1)
+        await store.stop()
+
+    asyncio.run(run())
+    assert store.index.best_rate("Kazakhstan") == 0.02
+    assert store.stats()["version"] == snapshot.version
+    assert store.stats()["failures"] == 0
+
+
+def test_get_tariffs_is_unavailable_until_a_table_loads():
+    from app.common.exceptions import AppError
+    from app.modules.esim.service import EsimService
+    from app.modules.esim.tariffs import TariffSnapshot
+
+    store = TariffStore(url="http://rates.invalid", refresh_seconds=3600, jitter=0.1, retry_seconds=60, timeout_seconds=1)
+    store.refresh_in_background = lambda: None
+    service = EsimService.__new__(EsimService)
+    service.tariffs = store
+
+    with pytest.raises(AppError) as exc:
+        asyncio.run(service.get_tariffs())
+    assert exc.value.status_code == 503
+
+    store._install(TariffSnapshot.from_tariffs([_tariff("KAZKT", "Kcell", "Kazakhstan", 0.02)], fetched_at=time.time()))
+    assert [t.plmn for t in asyncio.run(service.get_tariffs())] == ["KAZKT"]
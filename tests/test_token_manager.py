@@ -0,0 +1,67 @@
+import asyncio
+
+from app.infrastructure.tokens import TokenManager
+
+
+def test_concurrent_callers_share_one_refresh():
+    calls = []
+
+    async def fetcher():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return f"token-{len(calls)}", 3600
+
+    async def scenario():
+        manager = TokenManager(refresh_ahead_seconds=300, expiry_margin_seconds=60)
+        tokens = await asyncio.gather(*[manager.get_token("k", fetcher) for _ in range(10)])
+        again = await manager.get_token("k", fetcher)
+        return manager, tokens, again
+
+    manager, tokens, again = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert set(tokens) == {"token-1"}
+    assert again == "token-1"
+    assert manager.coalesced_waits == 9
+
+
+def test_refresh_ahead_serves_current_token_and_refreshes_in_background():
+    calls = []
+
+    async def fetcher():
+        calls.append(1)
+        # 100s lifetime with a 300s refresh-ahead window: refresh at half-life
+        return f"token-{len(calls)}", 100
+
+    async def scenario():
+        manager = TokenManager(refresh_ahead_seconds=300, expiry_margin_seconds=10)
+        first = await manager.get_token("k", fetcher)
+        manager._tokens["k"].refresh_at = 0  # pretend half-life has passed
+        served = await manager.get_token("k", fetcher)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        latest = await manager.get_token("k", fetcher)
+        return first, served, latest, manager
+
+    first, served, latest, manager = asyncio.run(scenario())
+
+    assert first == "token-1"
+    assert served == "token-1"
+    assert latest == "token-2"
+    assert manager.proactive_refreshes == 1
+
+
+def test_invalidate_forces_new_token():
+    calls = []
+
+    async def fetcher():
+        calls.append(1)
+        return f"token-{len(calls)}", 3600
+
+    async def scenario():
+        manager = TokenManager(refresh_ahead_seconds=300, expiry_margin_seconds=60)
+        first = await manager.get_token("k", fetcher)
+        manager.invalidate("k", first)
+        return first, await manager.get_token("k", fetcher)
+
+    assert asyncio.run(scenario()) == ("token-1", "token-2")
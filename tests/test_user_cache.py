@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.core.dependencies import get_current_user
+from app.core.jwt import create_access_token
+from app.modules.users.cache import UserCache, user_cache
+from app.modules.users.repository import UserRepository
+from app.modules.users.schemas import User
+
+
+def _credentials(user_id):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=create_access_token({"sub": user_id}))
+
+
+def test_current_user_is_read_once_and_invalidated_on_update(fake_db):
+    fake_db.collection("users").document("u1").set(
+        {"id": "u1", "phone_number": "+70000000000", "created_at": datetime.utcnow()}
+    )
+
+    before = user_cache.stats()
+
+    async def run():
+        first = await get_current_user(_credentials("u1"))
+        second = await get_current_user(_credentials("u1"))
+        await UserRepository().update_user("u1", {"balance": 12.5})
+        third = await get_current_user(_credentials("u1"))
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first.balance == second.balance == 0.0
+    assert third.balance == 12.5
+    after = user_cache.stats()
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 2
+    assert after["invalidations"] - before["invalidations"] == 1
+
+
+def test_load_overlapping_invalidation_is_not_cached():
+    cache = UserCache(ttl_seconds=60, max_entries=10)
+    loads = []
+
+    async def loader(user_id):
+        loads.append(user_id)
+        if len(loads) == 1:
+            cache.invalidate(user_id)
+        return User(id=user_id, phone_number="+70000000000", created_at=datetime.utcnow())
+
+    async def run():
+        await cache.get("u1", loader)
+        await cache.get("u1", loader)
+        await cache.get("u1", loader)
+
+    asyncio.run(run())
+    assert len(loads) == 2
+
+
+def test_user_cached_while_update_is_in_flight_is_dropped(fake_db):
+    fake_db.collection("users").document("u1").set(
+        {"id": "u1", "phone_number": "+70000000000", "created_at": datetime.utcnow()}
+    )
+    stale = User(id="u1", phone_number="+70000000000", created_at=datetime.utcnow())
+
+    class _Repository(UserRepository):
+        @property
+        def collection(self):
+            users = super().collection
+
+            class _Collection:
+                def document(self, user_id):
+                    ref = users.document(user_id)
+                    original_get = ref.get
+
+                    async def get():
+                        # A concurrent request caches what it read before the write landed
+                        user_cache._users.set(user_id, stale)
+                        return await original_get()
+
+                    ref.get = get
+                    return ref
+
+            return _Collection()
+
+    async def run():
+        updated = await _Repository().update_user("u1", {"balance": 12.5})
+        cached = await UserRepository().get_cached_user("u1")
+        return updated, cached
+
+    updated, cached = asyncio.run(run())
+    assert updated.balance == 12.5
+    assert cached.balance == 12.5
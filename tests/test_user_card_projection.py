@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.modules.payment.repository import PaymentRepository
+from app.modules.payment.schemas import PaymentRecord, PaymentStatus
+
+
+def _record(payment_id, card_id, status=PaymentStatus.CHARGE, minutes_ago=0):
+    return PaymentRecord(
+        id=payment_id,
+        user_id="u1",
+        invoice_id=f"INV-{payment_id}",
+        amount=5,
+        status=status,
+        card_id=card_id,
+        card_mask=f"4400-XXXX-{card_id}",
+        created_at=datetime.utcnow() - timedelta(minutes=minutes_ago),
+    )
+
+
+def test_successful_payments_update_projection(fake_db):
+    repository = PaymentRepository()
+
+    async def run():
+        await repository.update_payment(_record("p1", "c1"))
+        await asyncio.sleep(0.001)
+        await repository.update_payment(_record("p2", "c2"))
+        await repository.update_payment(_record("p3", "c3", status=PaymentStatus.FAILED))
+        return await repository.list_known_cards("u1")
+
+    cards = asyncio.run(run())
+    assert [card["card_id"] for card in cards] == ["c2", "c1"]
+    assert cards[0]["card_mask"] == "4400-XXXX-c2"
+    assert fake_db.data("payment_records", "p3")["status"] == "failed"
+
+
+def test_missing_projection_is_backfilled_once(fake_db, monkeypatch):
+    repository = PaymentRepository()
+    scans = []
+
+    async def list_payments(user_id, limit=50):
+        scans.append(limit)
+        return [
+            _record("p1", "c1", minutes_ago=30),
+            _record("p2", "c2", minutes_ago=10),
+            _record("p3", "c1", minutes_ago=20),
+            _record("p4", "c9", status=PaymentStatus.FAILED),
+        ]
+
+    monkeypatch.setattr(repository, "list_payments", list_payments)
+
+    async def run():
+        first = await repository.list_known_cards("u1")
+        second = await repository.list_known_cards("u1")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [card["card_id"] for card in first] == ["c2", "c1"]
+    assert [card["card_id"] for card in second] == ["c2", "c1"]
+    assert scans == [200]
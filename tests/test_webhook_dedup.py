@@ -0,0 +1,120 @@
+import asyncio
+
+from app.common.locks import KeyedLock
+from app.modules.payment import service as payment_service
+from app.modules.payment.schemas import PaymentRecord, PaymentStatus
+from app.modules.payment.service import PaymentService
+from app.modules.payment.webhooks import WebhookGuard
+from app.providers.epay.schemas import EpayStatusResponse, EpayTransactionDetail
+
+
+class _Repo:
+    def __init__(self, record):
+        self.record = record
+        self.reads = 0
+
+    async def find_payment_by_invoice(self, invoice_id):
+        self.reads += 1
+        return self.record.model_copy()
+
+    async def update_payment(self, record):
+        self.record = record.model_copy()
+        return record
+
+
+class _Epay:
+    def __init__(self):
+        self.checks = 0
+
+    async def check_transaction_status(self, invoice_id):
+        self.checks += 1
+        await asyncio.sleep(0.01)
+        return EpayStatusResponse(
+            resultCode="100",
+            resultMessage="ok",
+            transaction=EpayTransactionDetail(id="txn-1", statusName="CHARGE"),
+        )
+
+
+def _service(monkeypatch):
+    monkeypatch.setattr(payment_service, "webhook_guard", WebhookGuard(ttl_seconds=60, max_entries=100))
+    service = PaymentService.__new__(PaymentService)
+    service.repo = _Repo(PaymentRecord(id="p1", user_id="u1", invoice_id="INV1", amount=5))
+    service.epay = _Epay()
+    service.effects = 0
+
+    async def apply_success_effect(record, previous_status):
+        if previous_status not in (PaymentStatus.AUTH, PaymentStatus.CHARGE):
+            service.effects += 1
+
+    service._apply_success_effect = apply_success_effect
+    return service
+
+
+def test_concurrent_duplicates_apply_success_once(monkeypatch):
+    service = _service(monkeypatch)
+    payload = {"invoiceId": "INV1", "code": "ok", "reasonCode": 0}
+
+    async def run():
+        await asyncio.gather(*(service.handle_webhook_raw(dict(payload)) for _ in range(3)))
+
+    asyncio.run(run())
+    assert service.effects == 1
+    assert service.epay.checks == 1
+    assert service.repo.record.status == PaymentStatus.CHARGE
+
+
+def test_redelivery_short_circuits_but_new_code_is_processed(monkeypatch):
+    service = _service(monkeypatch)
+
+    async def run():
+        await service.handle_webhook_raw({"invoiceId": "INV1", "code": "ok"})
+        await service.handle_webhook_raw({"invoiceId": "INV1", "code": "OK"})
+        await service.handle_webhook_raw({"invoiceId": "INV1", "code": "failed"})
+
+    asyncio.run(run())
+    assert service.repo.reads == 2
+    assert service.epay.checks == 2
+    assert payment_service.webhook_guard.stats()["duplicates_skipped"] == 1
+
+
+def test_keyed_lock_serialises_per_key_and_cleans_up():
+    locks = KeyedLock()
+    events = []
+
+    async def work(key, tag):
+        async with locks.hold(key):
+            events.append(f"{tag}-start")
+            await asyncio.sleep(0.01)
+            events.append(f"{tag}-end")
+
+    async def run():
+        await asyncio.gather(work("a", "a1"), work("a", "a2"), work("b", "b1"))
+
+    asyncio.run(run())
+    assert events.index("a1-end") < events.index("a2-start")
+    assert events.index("b1-start") < events.index("a1-end")
+    assert len(locks) == 0
+    assert locks.stats()["contended"] == 1
+
+
+def test_unverified_failure_is_not_remembered(monkeypatch):
+    service = _service(monkeypatch)
+    check_transaction_status = service.epay.check_transaction_status
+
+    async def unavailable_once(invoice_id):
+        if service.epay.checks == 0:
+            service.epay.checks += 1
+            return EpayStatusResponse(resultCode="500", resultMessage="try later")
+        return await check_transaction_status(invoice_id)
+
+    service.epay.check_transaction_status = unavailable_once
+
+    async def run():
+        await service.handle_webhook_raw({"invoiceId": "INV1", "code": "ok"})
+        await service.handle_webhook_raw({"invoiceId": "INV1", "code": "ok"})
+
+    asyncio.run(run())
+    assert service.epay.checks == 2
+    assert service.repo.record.status == PaymentStatus.CHARGE
+    assert service.effects == 1
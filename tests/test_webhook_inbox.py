@@ -0,0 +1,115 @@
+import asyncio
+
+from app.modules.payment.repository import PaymentRepository
+from app.modules.payment.webhooks import WebhookInbox
+
+
+class _Service:
+    def __init__(self, failures=0, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.handled = []
+
+    async def handle_webhook_raw(self, payload):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("ePay unavailable")
+        self.handled.append(payload)
+
+
+def _inbox(service, worker_count=2, max_attempts=3):
+    inbox = WebhookInbox(
+        worker_count=worker_count,
+        max_attempts=max_attempts,
+        retry_base_seconds=0,
+        lease_seconds=60,
+        recovery_scan_seconds=60,
+        repository=PaymentRepository(),
+    )
+    inbox._service = service
+    return inbox
+
+
+def _inbox_items(fake_db):
+    return {doc_id: data for (collection, doc_id), (data, _) in fake_db.docs.items() if collection == "webhook_inbox"}
+
+
+def test_accept_processes_inline_without_workers(fake_db):
+    service = _Service()
+    inbox = _inbox(service)
+
+    asyncio.run(inbox.accept({"invoiceId": "INV1", "code": "ok"}))
+
+    assert service.handled == [{"invoiceId": "INV1", "code": "ok"}]
+    assert _inbox_items(fake_db) == {}
+
+
+def test_failed_item_is_retried_then_dead_lettered(fake_db):
+    service = _Service(failures=5)
+    inbox = _inbox(service, max_attempts=2)
+
+    async def run():
+        item_id = await inbox.accept({"invoiceId": "INV1"})
+        first = _inbox_items(fake_db)[item_id]["status"]
+        second = await inbox.process(item_id)
+        return item_id, first, second
+
+    item_id, first, second = asyncio.run(run())
+    assert first == "pending"
+    assert second == "dead"
+    item = _inbox_items(fake_db)[item_id]
+    assert item["attempts"] == 2
+    assert item["last_error"] == "ePay unavailable"
+    assert inbox.stats()["retried"] == 1
+    assert inbox.stats()["dead_lettered"] == 1
+    # Dead items are not picked up again
+    assert asyncio.run(inbox.process(item_id)) is None
+
+
+def test_workers_keep_per_invoice_order(fake_db):
+    service = _Service(delay=0.01)
+    inbox = _inbox(service, worker_count=3)
+
+    async def run():
+        await inbox.start()
+        try:
+            for seq in range(4):
+                for invoice in ("INV1", "INV2"):
+                    await inbox.accept({"invoiceId": invoice, "seq": seq})
+            assert inbox.stats()["queue_depth"] == 8
+            for queue in inbox._queues:
+                await queue.join()
+        finally:
+            await inbox.stop()
+
+    asyncio.run(run())
+    for invoice in ("INV1", "INV2"):
+        assert [p["seq"] for p in service.handled if p["invoiceId"] == invoice] == [0, 1, 2, 3]
+    assert _inbox_items(fake_db) == {}
+    assert inbox.stats()["processed"] == 8
+
+
+def test_recovery_requeues_abandoned_items(fake_db):
+    service = _Service()
+    inbox = _inbox(service)
+    fake_db.collection("webhook_inbox").document("stuck").set(
+        {"invoice_id": "INV1", "payload": {"invoiceId": "INV1"}, "status": "processing", "locked_until": 0, "received_at": 1}
+    )
+    fake_db.collection("webhook_inbox").document("later").set(
+        {"invoice_id": "INV1", "payload": {}, "status": "pending", "next_attempt_at": 9e12, "received_at": 2}
+    )
+
+    async def run():
+        await inbox.start()
+        try:
+            await asyncio.sleep(0)
+            for queue in inbox._queues:
+                await queue.join()
+        finally:
+            await inbox.stop()
+
+    asyncio.run(run())
+    assert service.handled == [{"invoiceId": "INV1"}]
+    assert set(_inbox_items(fake_db)) == {"later"}